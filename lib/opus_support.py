@@ -8,8 +8,10 @@
 # formats.
 ################################################################################
 
+import functools
 import math
 import numpy as np
+import os
 import re
 import unittest
 
@@ -852,6 +854,45 @@ def format_time_et(tai, **kwargs):
     et = julian.tdb_from_tai(tai)
     return '%.3f' % et
 
+# Versions of the above that format a whole array of TAI values at once.
+# julian's routines accept arrays, so the conversions are done in one
+# vectorized call instead of once per value.
+
+def _array_to_strings(arr):
+    # julian returns arrays of bytes for ISO strings
+    return [x.decode() if isinstance(x, bytes) else str(x)
+            for x in np.ravel(arr)]
+
+def format_time_ymd_array(tai, **kwargs):
+    return _array_to_strings(julian.iso_from_tai(np.asarray(tai, dtype='float'),
+                                                 ymd=True, digits=3))
+
+def format_time_ydoy_array(tai, **kwargs):
+    return _array_to_strings(julian.iso_from_tai(np.asarray(tai, dtype='float'),
+                                                 ymd=False, digits=3))
+
+def format_time_jd_array(tai, **kwargs):
+    (day, sec) = julian.day_sec_from_tai(np.asarray(tai, dtype='float'))
+    jd = julian.jd_from_day_sec(day, sec)
+    return ['JD%.8f' % x for x in np.ravel(jd).tolist()]
+
+def format_time_jed_array(tai, **kwargs):
+    jed = julian.jed_from_tai(np.asarray(tai, dtype='float'))
+    return ['JED%.8f' % x for x in np.ravel(jed).tolist()]
+
+def format_time_mjd_array(tai, **kwargs):
+    (day, sec) = julian.day_sec_from_tai(np.asarray(tai, dtype='float'))
+    mjd = julian.mjd_from_day_sec(day, sec)
+    return ['MJD%.8f' % x for x in np.ravel(mjd).tolist()]
+
+def format_time_mjed_array(tai, **kwargs):
+    mjed = julian.mjed_from_tai(np.asarray(tai, dtype='float'))
+    return ['MJED%.8f' % x for x in np.ravel(mjed).tolist()]
+
+def format_time_et_array(tai, **kwargs):
+    et = julian.tdb_from_tai(np.asarray(tai, dtype='float'))
+    return ['%.3f' % x for x in np.ravel(et).tolist()]
+
 class TimeTest(unittest.TestCase):
     # Note - julian.py has its own test suite, so we don't need to duplicate
     # all that here. We just do a couple of simple tests to make sure the
@@ -924,6 +965,18 @@ class TimeTest(unittest.TestCase):
         self.assertAlmostEqual(parse_time('-43167.816'), 0, places=3)
         self.assertAlmostEqual(parse_time('599956832.184'), 600000000, places=3)
 
+    def test_format_arrays(self):
+        "Time format: arrays match single values"
+        tais = [0, 600000000, 123456789.123]
+        for single, array in ((format_time_ymd, format_time_ymd_array),
+                              (format_time_ydoy, format_time_ydoy_array),
+                              (format_time_jd, format_time_jd_array),
+                              (format_time_jed, format_time_jed_array),
+                              (format_time_mjd, format_time_mjd_array),
+                              (format_time_mjed, format_time_mjed_array),
+                              (format_time_et, format_time_et_array)):
+            self.assertEqual(array(tais), [single(x) for x in tais])
+
     def test_idopotent(self):
         "Time idempotency"
         self.assertEqual(format_time_ymd(parse_time('2015-05-03T10:12:34.123')),
@@ -1861,6 +1914,177 @@ def _strip_trailing_zeros(s):
         s = s1+'e'+s2
     return s
 
+### FORMAT A COLUMN OF VALUES FOR A GIVEN UNIT
+
+# Array versions of the format functions in UNIT_FORMAT_DB. Format functions
+# not listed here are called once per value.
+_ARRAY_FORMAT_FUNCS = {
+    format_time_ymd:  format_time_ymd_array,
+    format_time_ydoy: format_time_ydoy_array,
+    format_time_jd:   format_time_jd_array,
+    format_time_jed:  format_time_jed_array,
+    format_time_mjd:  format_time_mjd_array,
+    format_time_mjed: format_time_mjed_array,
+    format_time_et:   format_time_et_array,
+}
+
+_COLUMN_FORMATTERS = {}
+
+def get_column_formatter(numerical_format, unit_id, unit,
+                         keep_trailing_zeros=False):
+    """Return a function that formats a whole column of values.
+
+    The function takes a list of values and returns a list of the same length
+    where each entry is what format_unit_value would return for that value.
+    Everything that only depends on the column (the unit conversion factor,
+    the adjusted format strings, the format function) is worked out once, and
+    the formatter is cached for each (numerical_format, unit_id, unit).
+    """
+    key = (numerical_format, unit_id, unit, keep_trailing_zeros)
+    formatter = _COLUMN_FORMATTERS.get(key)
+    if formatter is None:
+        formatter = _compile_column_formatter(numerical_format, unit_id, unit,
+                                              keep_trailing_zeros)
+        _COLUMN_FORMATTERS[key] = formatter
+    return formatter
+
+def _compile_column_formatter(numerical_format, unit_id, unit,
+                              keep_trailing_zeros):
+    conversion_factor = None
+    format_func = None
+    if unit_id is not None:
+        if unit is None:
+            unit = get_default_unit(unit_id)
+        unit = unit.lower()
+        conversion = UNIT_FORMAT_DB[unit_id]['conversions'][unit]
+        if unit != UNIT_FORMAT_DB[unit_id]['default']:
+            conversion_factor = conversion[1]
+        format_func = conversion[3]
+
+    def convert_values(vals):
+        # Same as convert_from_default_unit, but for the whole column at once
+        if conversion_factor is None:
+            return vals, None
+        arr = np.asarray(vals, dtype='float') / conversion_factor
+        if not np.all(np.isfinite(arr)):
+            raise ValueError
+        return arr.tolist(), arr
+
+    if format_func is not None:
+        array_format_func = _ARRAY_FORMAT_FUNCS.get(format_func)
+        if array_format_func is not None:
+            def format_values(vals):
+                vals, arr = convert_values(vals)
+                return array_format_func(vals if arr is None else arr)
+        else:
+            def format_values(vals):
+                vals, _ = convert_values(vals)
+                return [format_func(val, unit_id=unit_id, unit=unit,
+                                    numerical_format=numerical_format,
+                                    keep_trailing_zeros=keep_trailing_zeros)
+                        for val in vals]
+    elif numerical_format is None:
+        def format_values(vals):
+            vals, _ = convert_values(vals)
+            return [str(val) for val in vals]
+    else:
+        fixed_format = adjust_format_string_for_units(numerical_format,
+                                                      unit_id, unit)
+        exp_format = adjust_format_string_for_units(
+                                        numerical_format.replace('f', 'e'),
+                                        unit_id, unit)
+        format_fixed = ('{:'+fixed_format+'}').format
+        format_exp = ('{:'+exp_format+'}').format
+        strip_fixed = strip_exp = None
+        if not keep_trailing_zeros:
+            strip_exp = _strip_trailing_zeros
+            if re.fullmatch(r'\.\d+f', fixed_format):
+                # The result is always NNN.DDD (or inf/nan), so there's no
+                # need for the regular expressions in _strip_trailing_zeros
+                strip_fixed = (lambda x: x.rstrip('0').rstrip('.')
+                               if '.' in x else x)
+            else:
+                strip_fixed = _strip_trailing_zeros
+        def format_values(vals):
+            vals, arr = convert_values(vals)
+            if arr is None:
+                arr = np.asarray(vals, dtype='float')
+            use_exp = (np.abs(arr) >= 1e8).tolist()
+            ret = []
+            for val, exp in zip(vals, use_exp):
+                if exp:
+                    s = format_exp(val)
+                    if strip_exp is not None:
+                        s = strip_exp(s)
+                else:
+                    s = format_fixed(val)
+                    if strip_fixed is not None:
+                        s = strip_fixed(s)
+                ret.append(s)
+            return ret
+
+    def column_formatter(vals):
+        # None and strings are passed through unchanged, just like
+        # format_unit_value
+        ret = list(vals)
+        indexes = [i for i, val in enumerate(ret)
+                   if val is not None and not isinstance(val, str)]
+        if not indexes:
+            return ret
+        if len(indexes) == len(ret):
+            return format_values(ret)
+        for i, s in zip(indexes, format_values([ret[i] for i in indexes])):
+            ret[i] = s
+        return ret
+
+    return column_formatter
+
+class ColumnFormatTest(unittest.TestCase):
+    def _check_column(self, vals, numerical_format, unit_id, unit,
+                      keep_trailing_zeros=False):
+        formatter = get_column_formatter(numerical_format, unit_id, unit,
+                                         keep_trailing_zeros)
+        self.assertEqual(formatter(vals),
+                         [format_unit_value(val, numerical_format, unit_id,
+                                            unit, keep_trailing_zeros)
+                          for val in vals])
+
+    def test_format_no_unit(self):
+        "Column format: no unit"
+        self._check_column([1, 2.5, None, 'N/A', -3], None, None, None)
+        self._check_column([1.5, 2.25, 1e9, -1.23456e12, 0., 100.],
+                           '.3f', None, None)
+        self._check_column([1.5, 2.25, 1e9], '.3f', None, None, True)
+        self._check_column([12, 123456789], 'd', None, None)
+
+    def test_format_units(self):
+        "Column format: unit conversion"
+        vals = [0., 1.5, 60268., 149597870.7*2, -12.25, None]
+        for unit in ('km', 'm', 'au', None):
+            self._check_column(vals, '.3f', 'distance', unit)
+        self._check_column([0., 45.5, -90., 359.999], '.4f', 'latitude',
+                           'radians')
+        self._check_column([0., 45.5, -90., 359.999], '.4f', 'latitude',
+                           'dms')
+        self._check_column([0., 45.5, 180., 359.999], '.4f', 'hour_angle',
+                           'hms')
+
+    def test_format_times(self):
+        "Column format: times"
+        vals = [0, 600000000, None, 123456789.123]
+        for unit in ('ymdhms', 'ydhms', 'jd', 'jed', 'mjd', 'mjed', 'et'):
+            self._check_column(vals, None, 'datetime', unit)
+
+    def test_format_cached(self):
+        "Column format: formatter is reused"
+        self.assertIs(get_column_formatter('.3f', 'distance', 'km'),
+                      get_column_formatter('.3f', 'distance', 'km'))
+
+    def test_format_bad_unit(self):
+        "Column format: bad unit"
+        with self.assertRaises(KeyError):
+            get_column_formatter('.3f', 'distance', 'xyzzy')
+
 def _clean_numeric_field(s, compress_spaces=True):
     def clean_func(x):
         ret = x.lower().replace(',', '').replace('_','')
@@ -1872,17 +2096,75 @@ def _clean_numeric_field(s, compress_spaces=True):
 
     return clean_func(s)
 
+### PARSE A VALUE FOR A GIVEN UNIT
+
+# The number of recently parsed (string, format, unit_id, unit) combinations
+# remembered by parse_unit_value
+PARSE_UNIT_VALUE_CACHE_SIZE = 4096
+
+_UNIT_PARSERS = {}
+
+def _get_unit_parser(unit_id):
+    """Return the precompiled parsing information for a unit_id.
+
+    This is a tuple (default_unit, conversions, suffix_match, suffix_units).
+    suffix_match is the fullmatch method of a regular expression that splits a
+    cleaned numeric string into the number and the longest unit name suffix
+    (like "1 km" into "1" and "km" rather than "1 k" and "m"), or None if
+    there are no suffixes. suffix_units maps each suffix to its unit.
+    UNIT_FORMAT_DB never changes, so this is only built once per unit_id.
+    Raises KeyError for an unknown unit_id.
+    """
+    unit_parser = _UNIT_PARSERS.get(unit_id)
+    if unit_parser is None:
+        unit_info = UNIT_FORMAT_DB[unit_id]
+        conversions = unit_info['conversions']
+        suffix_units = {}
+        for trial_unit, trial_conversion in conversions.items():
+            for suffix in trial_conversion[4]:
+                # If two units share a suffix, the first one wins
+                suffix_units.setdefault(suffix, trial_unit)
+        suffix_match = None
+        if suffix_units:
+            # The number is matched non-greedily, so the suffix that starts
+            # earliest (the longest one) is the one that's found
+            suffixes = sorted(suffix_units, key=lambda x: -len(x))
+            suffix_match = re.compile('(.*?)('
+                                      +'|'.join([re.escape(x)
+                                                 for x in suffixes])
+                                      +')', re.DOTALL).fullmatch
+        unit_parser = (unit_info['default'], conversions, suffix_match,
+                       suffix_units)
+        _UNIT_PARSERS[unit_id] = unit_parser
+    return unit_parser
+
 def parse_unit_value(s, numerical_format, unit_id, unit):
-    """Parse a string given the unit and numerical format."""
+    """Parse a string given the unit and numerical format.
+
+    The same search strings are parsed over and over, so the results for
+    recently seen strings are remembered.
+    """
     if s is None or s == '':
         return None
+    if isinstance(s, str):
+        return _parse_unit_value_cached(s, numerical_format, unit_id, unit)
+    return _parse_unit_value(s, numerical_format, unit_id, unit)
+
+@functools.lru_cache(maxsize=PARSE_UNIT_VALUE_CACHE_SIZE)
+def _parse_unit_value_cached(s, numerical_format, unit_id, unit):
+    # Exceptions aren't cached, so bad strings are always parsed again
+    return _parse_unit_value(s, numerical_format, unit_id, unit)
+
+def _parse_unit_value(s, numerical_format, unit_id, unit):
     parse_func = None
     if unit_id is not None:
+        (default_unit, conversions,
+         suffix_match, suffix_units) = _get_unit_parser(unit_id)
         if unit is None:
-            unit = get_default_unit(unit_id)
+            unit = default_unit
         unit = unit.lower()
         (display_name, conversion_factor, parse_func,
-         display_func, _) = UNIT_FORMAT_DB[unit_id]['conversions'][unit]
+         display_func, _) = conversions[unit]
     if parse_func is None:
         # Direct numeric conversion with no special parsing
         # Choose between float or int parsing
@@ -1894,23 +2176,13 @@ def parse_unit_value(s, numerical_format, unit_id, unit):
         # spaces
         s = _clean_numeric_field(s)
         force_unit = None
-        if unit_id:
+        if unit_id and suffix_match is not None:
             # Look for an overriding unit name suffix, like "1 km"
-            conversions = UNIT_FORMAT_DB[unit_id]['conversions']
-            # Build a list of all possible suffixes. Sort the possible suffixes
-            # by descending length so that we find, for example, "km" before "m"
-            sorted_suffixes = []
-            for trial_unit, trial_conversion in conversions.items():
-                trial_suffix_list = trial_conversion[4]
-                for suffix in trial_suffix_list:
-                    sorted_suffixes.append((suffix, trial_unit, trial_conversion))
-            sorted_suffixes.sort(key=lambda x: -len(x[0]))
-            for trial_suffix, trial_unit, trial_conversion in sorted_suffixes:
-                if s.endswith(trial_suffix):
-                    force_unit = trial_unit
-                    # Strip off the unit name from the number
-                    s = s[:-len(trial_suffix)]
-                    break
+            match = suffix_match(s)
+            if match:
+                # Strip off the unit name from the number
+                s, suffix = match.groups()
+                force_unit = suffix_units[suffix]
         ret = parse_func(s) # Parse the int or float
         if not math.isfinite(ret):
             raise ValueError
@@ -1927,6 +2199,101 @@ def parse_unit_value(s, numerical_format, unit_id, unit):
                       numerical_format=numerical_format,
                       unit_id=unit_id, unit=unit)
 
+class ParseUnitValueTest(unittest.TestCase):
+    @staticmethod
+    def _parse_unit_value_rebuild(s, numerical_format, unit_id, unit):
+        # parse_unit_value as it was before the suffixes were precompiled,
+        # for comparison
+        unit = get_default_unit(unit_id) if unit is None else unit.lower()
+        parse_func = float
+        if numerical_format and numerical_format[-1] == 'd':
+            parse_func = int
+        s = _clean_numeric_field(s)
+        force_unit = None
+        conversions = UNIT_FORMAT_DB[unit_id]['conversions']
+        sorted_suffixes = []
+        for trial_unit, trial_conversion in conversions.items():
+            for suffix in trial_conversion[4]:
+                sorted_suffixes.append((suffix, trial_unit))
+        sorted_suffixes.sort(key=lambda x: -len(x[0]))
+        for trial_suffix, trial_unit in sorted_suffixes:
+            if s.endswith(trial_suffix):
+                force_unit = trial_unit
+                s = s[:-len(trial_suffix)]
+                break
+        ret = parse_func(s)
+        if force_unit is not None:
+            ret = convert_to_default_unit(ret, unit_id, force_unit)
+            ret = convert_from_default_unit(ret, unit_id, unit)
+        return ret
+
+    def test_parse_suffixes(self):
+        "Parse unit value: unit suffixes"
+        self.assertEqual(parse_unit_value('1 km', '.3f', 'distance', 'km'), 1)
+        self.assertEqual(parse_unit_value('1000 m', '.3f', 'distance', 'km'),
+                         1)
+        self.assertEqual(parse_unit_value('1,000meters', '.3f', 'distance',
+                                          None), 1)
+        self.assertEqual(parse_unit_value('1km', '.3f', 'distance', 'M'),
+                         1000)
+        self.assertEqual(parse_unit_value('12', 'd', None, None), 12)
+        self.assertIsNone(parse_unit_value('', '.3f', 'distance', 'km'))
+        with self.assertRaises(ValueError):
+            parse_unit_value('km', '.3f', 'distance', 'km')
+        with self.assertRaises(ValueError):
+            parse_unit_value('1 xyzzy', '.3f', 'distance', 'km')
+        with self.assertRaises(ValueError):
+            parse_unit_value('inf km', '.3f', 'distance', 'km')
+        with self.assertRaises(KeyError):
+            parse_unit_value('1', '.3f', 'distance', 'xyzzy')
+
+    def test_parse_same_as_rebuild(self):
+        "Parse unit value: same results as searching all suffixes"
+        for unit_id, unit_info in UNIT_FORMAT_DB.items():
+            for unit, conversion in unit_info['conversions'].items():
+                if conversion[2] is not None:
+                    continue
+                for suffix_unit in unit_info['conversions'].values():
+                    for suffix in suffix_unit[4]:
+                        s = '12.5 ' + suffix
+                        self.assertEqual(
+                            parse_unit_value(s, '.3f', unit_id, unit),
+                            self._parse_unit_value_rebuild(s, '.3f',
+                                                           unit_id, unit))
+
+    @unittest.skipUnless(os.environ.get('OPUS_BENCHMARK'),
+                         'set OPUS_BENCHMARK to run benchmarks')
+    def test_parse_benchmark(self):
+        "Parse unit value: microbenchmark"
+        import time
+        strings = ['%d.5 %s' % (i, suffix)
+                   for i in range(20)
+                   for suffix in ('km', 'm', 'au', '')]
+        num_loops = 50
+
+        time1 = time.perf_counter()
+        for _ in range(num_loops):
+            for s in strings:
+                self._parse_unit_value_rebuild(s, '.3f', 'distance', 'km')
+        rebuild_time = time.perf_counter() - time1
+
+        _parse_unit_value_cached.cache_clear()
+        time1 = time.perf_counter()
+        for _ in range(num_loops):
+            for s in strings:
+                _parse_unit_value(s, '.3f', 'distance', 'km')
+        compiled_time = time.perf_counter() - time1
+
+        time1 = time.perf_counter()
+        for _ in range(num_loops):
+            for s in strings:
+                parse_unit_value(s, '.3f', 'distance', 'km')
+        cached_time = time.perf_counter() - time1
+
+        print(f'\nparse_unit_value {len(strings)*num_loops} calls: '
+              f'rebuild {rebuild_time:.4f}s, compiled {compiled_time:.4f}s, '
+              f'cached {cached_time:.4f}s')
+
 def parse_form_type(s):
     """Parse the ParamInfo FORM_TYPE with its subfields.
 
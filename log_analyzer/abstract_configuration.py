@@ -1,11 +1,11 @@
 import abc
 import re
 from enum import Flag
-from typing import List, Dict, Optional, Match, Tuple, Pattern, Callable, Any, TextIO, NewType
+from typing import List, Dict, Optional, Match, Tuple, Pattern, Callable, Any, TextIO, NewType, Set
 
 from markupsafe import Markup
 
-from log_entry import LogEntry
+from log_entry import LogEntry, LineFilter
 
 SESSION_INFO = Tuple[List[str], Optional[str]]
 LogId = NewType('LogId', int)
@@ -31,6 +31,28 @@ class AbstractConfiguration(metaclass=abc.ABCMeta):
         """Implements the --summary operation, whatever that happens to mean for this configuration"""
         raise Exception()
 
+    def get_log_line_filter(self) -> Optional[LineFilter]:
+        """
+        Returns a function that is given the raw text of a log line and returns False if the line can't possibly
+        be of interest to a session, so that the line doesn't need to be parsed.  Used by --prefilter.  It must be a
+        module-level function so that it can be sent to worker processes.  The default is to parse every line.
+        """
+        return None
+
+    def get_checkpoint_state(self) -> Any:
+        """
+        Returns any state, other than the sessions themselves, that the configuration has built up while the log
+        entries were parsed, so that it can be saved by --checkpoint.  It must be picklable.  The default is None.
+        """
+        return None
+
+    def restore_checkpoint_state(self, state: Any, reparsed_entries: Set[LogEntry]) -> None:
+        """
+        Restores the state returned by get_checkpoint_state.  The entries in reparsed_entries were parsed before the
+        state was saved, and are going to be parsed again, so anything they contributed should be dropped.
+        """
+        pass
+
 
 class AbstractSessionInfo(metaclass=abc.ABCMeta):
     @abc.abstractmethod
@@ -0,0 +1,99 @@
+import argparse
+import os
+import pickle
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+from log_entry import LogEntry, LogReader, LineFilter
+from log_parser import SessionCheckpoint
+
+
+class CheckpointFile:
+    """
+    The state file used by --checkpoint.
+
+    It holds the SessionCheckpoint returned by the last LogParser.run_batch, along with the size, mtime, and number
+    of entries of every log file that went into it.  The next run only reads the files that are new or have grown,
+    and only passes on the entries that were added to the end of a file.  If any file has shrunk or disappeared, or
+    the options that affect parsing have changed, the state is thrown away and everything is read again.
+    """
+    VERSION = 1
+
+    # The arguments that affect how entries are parsed into sessions
+    SETTINGS = ('session_timeout_minutes', 'uses_html', 'ignored_ips', 'prefilter', 'debug_show_all',
+                'api_host_url', 'configuration_file')
+
+    _file_name: str
+    _settings: Dict[str, Any]
+    _file_states: Dict[str, Tuple[int, float, int]]
+
+    def __init__(self, file_name: str, args: argparse.Namespace):
+        self._file_name = file_name
+        self._settings = {name: getattr(args, name, None) for name in self.SETTINGS}
+        self._file_states = {}
+
+    def read_log_entries(self, file_names: Iterable[str], *, processes: int = 1,
+                         line_filter: Optional[LineFilter] = None) \
+            -> Tuple[List[LogEntry], Optional[SessionCheckpoint]]:
+        """
+        Returns the log entries that aren't in the saved state, and the saved SessionCheckpoint to pass to run_batch
+        along with them.  The checkpoint is None if there is no usable saved state, in which case all the entries
+        are returned.
+        """
+        file_names = list(file_names)
+        saved = self.__load()
+        saved_file_states: Dict[str, Tuple[int, float, int]] = saved['file_states'] if saved else {}
+        for file_name, (size, _mtime, _count) in saved_file_states.items():
+            if file_name not in file_names or os.stat(file_name).st_size < size:
+                print(f'Log file {file_name} has been removed or truncated.  Ignoring {self._file_name}')
+                saved = None
+                saved_file_states = {}
+                break
+
+        self._file_states = {}
+        files_to_read: List[str] = []
+        for file_name in file_names:
+            stat = os.stat(file_name)
+            saved_state = saved_file_states.get(file_name)
+            if saved_state and saved_state[:2] == (stat.st_size, stat.st_mtime):
+                self._file_states[file_name] = saved_state
+            else:
+                # Stat the file before reading it, so that lines added while it is being read are read again
+                # next time rather than skipped.
+                self._file_states[file_name] = (stat.st_size, stat.st_mtime, 0)
+                files_to_read.append(file_name)
+
+        new_entries: List[LogEntry] = []
+        entries_by_file = LogReader.read_logs_by_file(files_to_read, processes=processes, line_filter=line_filter)
+        for file_name, entries in zip(files_to_read, entries_by_file):
+            _, _, already_read = saved_file_states.get(file_name, (0, 0.0, 0))
+            new_entries.extend(entries[already_read:])
+            size, mtime, _ = self._file_states[file_name]
+            self._file_states[file_name] = (size, mtime, len(entries))
+
+        print(f'Read {len(new_entries)} new log entries')
+        return new_entries, saved['checkpoint'] if saved else None
+
+    def save(self, checkpoint: SessionCheckpoint) -> None:
+        """Saves the checkpoint along with the state of the files read by read_log_entries."""
+        state = dict(version=self.VERSION, settings=self._settings, file_states=self._file_states,
+                     checkpoint=checkpoint)
+        temp_file_name = self._file_name + '.tmp'
+        with open(temp_file_name, 'wb') as file:
+            pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file_name, self._file_name)
+        print(f'Saved checkpoint as {self._file_name}')
+
+    def __load(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._file_name, 'rb') as file:
+                state: Dict[str, Any] = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, AttributeError, ImportError, pickle.UnpicklingError) as e:
+            print(f'Unable to read {self._file_name}: {e}')
+            return None
+        if state.get('version') != self.VERSION or state.get('settings') != self._settings:
+            print(f'{self._file_name} was made with different options.  Ignoring it')
+            return None
+        print(f'Reading checkpoint from {self._file_name}')
+        return state
@@ -45,6 +45,10 @@ def expand_globs_and_dates(args: Namespace, *, error_analysis: bool = False) ->
         args.output = run_date.strftime(args.output)
         Path(args.output).parent.mkdir(parents=True, exist_ok=True)
 
+    if not error_analysis and args.checkpoint:
+        args.checkpoint = run_date.strftime(args.checkpoint)
+        Path(args.checkpoint).parent.mkdir(parents=True, exist_ok=True)
+
     if not error_analysis and args.sessions_relative_directory:
         args.sessions_relative_directory = run_date.strftime(args.sessions_relative_directory)
 
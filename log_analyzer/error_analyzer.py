@@ -7,7 +7,7 @@ import sys
 from bisect import bisect_left, bisect_right
 from collections import deque, defaultdict
 from operator import attrgetter
-from typing import List, Optional, NamedTuple, Iterable, TextIO, Tuple, Dict, cast
+from typing import List, Optional, NamedTuple, Iterable, TextIO, Tuple, Dict, Set, cast
 
 from cronjob_utils import expand_globs_and_dates
 from jinga_environment import JINJA_ENVIRONMENT
@@ -36,6 +36,24 @@ class ErrorAndLog(NamedTuple):
     log_entries: List[LogEntry]
 
 
+class AccessLogIndex(object):
+    """
+    The times of the access log entries of a single ip, in sorted order, and where to find each entry.  The entries
+    themselves are read by ErrorReader._read_matched_log_entries once we know which ones are needed.
+    """
+    times: List[datetime.datetime]
+    locations: List[Tuple[int, int]]  # (index of the file, offset of the line in the file)
+
+    def __init__(self) -> None:
+        self.times = []
+        self.locations = []
+
+    def sort(self) -> None:
+        order = sorted(range(len(self.times)), key=self.times.__getitem__)
+        self.times = [self.times[i] for i in order]
+        self.locations = [self.locations[i] for i in order]
+
+
 class ErrorReader(object):
     _files: List[str]
     _ignored_ips: List[ipaddress.IPv4Network]
@@ -43,6 +61,8 @@ class ErrorReader(object):
     _output: TextIO
     _seen_errors: Dict[Tuple[str, ...], List[ErrorAndLog]]
     _uses_html: bool
+    _access_files: List[str]
+    _matched_locations: List[Tuple[List[LogEntry], List[Tuple[int, int]]]]
 
     def __init__(self, files: List[str], ignored_ips: List[ipaddress.IPv4Network], ignored_errors: List[str],
                  output: TextIO, uses_html: bool):
@@ -52,6 +72,8 @@ class ErrorReader(object):
         self._output = output
         self._seen_errors = defaultdict(list)
         self._uses_html = uses_html
+        self._access_files = [file for file in files if "access" in file]
+        self._matched_locations = []
 
     def run(self) -> None:
         error_entries = self._get_error_entries()
@@ -59,13 +81,10 @@ class ErrorReader(object):
         errors_by_host_ip = [(host_ip, list(error_entries))
                              for host_ip, error_entries in itertools.groupby(error_entries, attrgetter("host_ip"))]
 
-        log_entries = self._get_log_entries()
-        log_entries.sort(key=attrgetter('host_ip', 'time'))
-        log_entries_by_host_ip = {host_ip: list(log_entries) for host_ip, log_entries in
-                                  itertools.groupby(log_entries, attrgetter('host_ip'))}
+        access_log_indices = self._index_access_logs({host_ip for host_ip, _ in errors_by_host_ip})
         for host_ip, error_entries in errors_by_host_ip:
-            log_entries = log_entries_by_host_ip.get(host_ip, [])
-            self._check_one_ip(error_entries, log_entries)
+            self._check_one_ip(error_entries, access_log_indices.get(host_ip, AccessLogIndex()))
+        self._read_matched_log_entries()
         self._show_results()
 
     def _get_error_entries(self) -> List[ErrorEntry]:
@@ -87,14 +106,53 @@ class ErrorReader(object):
         result = any(ignored_error in entry.full_message for ignored_error in self._ignored_errors)
         return result
 
-    def _get_log_entries(self) -> List[LogEntry]:
-        files = [file for file in self._files if "access" in file]
-        log_entries = LogReader.read_logs(files)
-        return [entry for entry in log_entries
-                # Note, we don't bother filtering out ignored ips or local network.  They won't get in the way
-                # We do filter out /static_media requests returning 200, because they can't possible be the cause of
-                # an error message.
-                if not(entry.status == 200 and entry.url.path.startswith('/static_media'))]
+    def _index_access_logs(self, host_ips: Set[ipaddress.IPv4Address]) -> Dict[ipaddress.IPv4Address, AccessLogIndex]:
+        """
+        Streams through the access logs, and indexes the entries of the ips that have errors.  The lines of all
+        other ips are skipped without being parsed.
+        """
+        host_ip_strings = {str(host_ip) for host_ip in host_ips}
+        indices: Dict[ipaddress.IPv4Address, AccessLogIndex] = defaultdict(AccessLogIndex)
+        for file_index, file_name in enumerate(self._access_files):
+            print(f'Reading {file_name}')
+            for offset, line in LogReader.iterate_lines_with_offsets(file_name):
+                host = line[:line.find(' ')]
+                if host not in host_ip_strings and ':' not in host:
+                    continue
+                log_entry = self._parse_access_log_line(line)
+                if log_entry and log_entry.host_ip in host_ips:
+                    index = indices[log_entry.host_ip]
+                    index.times.append(log_entry.time.replace(tzinfo=None))
+                    index.locations.append((file_index, offset))
+        for index in indices.values():
+            index.sort()
+        return indices
+
+    @staticmethod
+    def _parse_access_log_line(line: str) -> Optional[LogEntry]:
+        log_entry = LogReader.parse_line(line)
+        # We don't bother filtering out ignored ips or local network.  They won't get in the way
+        # We do filter out /static_media requests returning 200, because they can't possible be the cause of
+        # an error message.
+        if log_entry and not (log_entry.status == 200 and log_entry.url.path.startswith('/static_media')):
+            return log_entry
+        return None
+
+    def _read_matched_log_entries(self) -> None:
+        """Reads the access log entries that _check_one_ip matched to errors, one pass per file."""
+        offsets_by_file: Dict[int, Set[int]] = defaultdict(set)
+        for _, locations in self._matched_locations:
+            for file_index, offset in locations:
+                offsets_by_file[file_index].add(offset)
+        lines = {(file_index, offset): line
+                 for file_index, offsets in offsets_by_file.items()
+                 for offset, line in LogReader.read_lines_at_offsets(self._access_files[file_index], offsets).items()}
+        for log_entries, locations in self._matched_locations:
+            for location in locations:
+                log_entry = self._parse_access_log_line(lines[location])
+                assert log_entry
+                log_entries.append(log_entry)
+        self._matched_locations = []
 
     @staticmethod
     def _read_error_files(file_names: Iterable[str]) -> List[ErrorEntry]:
@@ -128,9 +186,9 @@ class ErrorReader(object):
         else:
             return ErrorEntry(time=time, host_ip=host_ip, message=rest, full_message=rest)
 
-    def _check_one_ip(self, error_entries: List[ErrorEntry], log_entries: List[LogEntry]) -> None:
+    def _check_one_ip(self, error_entries: List[ErrorEntry], access_log_index: AccessLogIndex) -> None:
         error_entries_deque = deque(error_entries)
-        log_entry_dates = [log_entry.time.replace(tzinfo=None) for log_entry in log_entries]
+        log_entry_dates = access_log_index.times
 
         def merge_error_entries(old_entries: List[ErrorEntry], new_entry: ErrorEntry) -> bool:
             # In some cases, error logs can be more than one line long.  This function returns true if the next
@@ -146,18 +204,15 @@ class ErrorReader(object):
             these_error_entries = [error_entries_deque.popleft()]
             while error_entries_deque and merge_error_entries(these_error_entries, error_entries_deque[0]):
                 these_error_entries.append(error_entries_deque.popleft())
-            if not log_entries:
-                # don't bother looking if there are no log entries
-                these_log_entries: List[LogEntry] = []
-            else:
+            # The log entries are filled in later by _read_matched_log_entries
+            these_log_entries: List[LogEntry] = []
+            if log_entry_dates:
                 start_time = these_error_entries[0].time.replace(microsecond=0)
                 end_time = these_error_entries[-1].time
                 left = bisect_left(log_entry_dates, start_time)
                 right = bisect_right(log_entry_dates, end_time)
                 if left < right and left != len(log_entry_dates):
-                    these_log_entries = log_entries[left:right]
-                else:
-                    these_log_entries = []
+                    self._matched_locations.append((these_log_entries, access_log_index.locations[left:right]))
             error_key = tuple(entry.message for entry in these_error_entries)
             self._seen_errors[error_key].append(ErrorAndLog(these_error_entries, these_log_entries))
 
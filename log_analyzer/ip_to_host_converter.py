@@ -6,9 +6,11 @@ import datetime
 import functools
 import shelve
 import socket
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from ipaddress import IPv4Address
 from random import uniform
-from typing import Optional, Callable, Tuple
+from typing import Optional, Callable, Dict, Iterable, List, Set, Tuple
 
 
 class IpToHostConverter(metaclass=abc.ABCMeta):
@@ -19,21 +21,30 @@ class IpToHostConverter(metaclass=abc.ABCMeta):
     RESULT_TYPE = Callable[[IPv4Address], Optional[str]]
 
     @staticmethod
-    def get_ip_to_host_converter(uses_reverse_dns: bool, dns_cache: bool, **_args) -> IpToHostConverter:
+    def get_ip_to_host_converter(uses_reverse_dns: bool, dns_cache: bool,
+                                 dns_workers: int = 32, dns_timeout: float = 5.0,
+                                 **_args) -> IpToHostConverter:
         """
         Returns the appropriate IpToHostConvert, given the arguments.
         """
         if not uses_reverse_dns:
             return NullIpToHostConverter()
         elif dns_cache:
-            return ShelvedIPToHostConverter(".logs/reverse-dns")
+            return ShelvedIPToHostConverter(".logs/reverse-dns", max_workers=dns_workers, timeout=dns_timeout)
         else:
-            return NormalIpToHostConverter()
+            return NormalIpToHostConverter(max_workers=dns_workers, timeout=dns_timeout)
 
     @functools.lru_cache(maxsize=None)
     def convert(self, ip: IPv4Address) -> Optional[str]:
         return self._convert(ip)
 
+    def resolve_all(self, ips: Iterable[IPv4Address]) -> None:
+        """
+        Called with every ip that is about to be converted, so that the lookups can be done all at once rather
+        than one at a time as convert() is called.  The default does nothing.
+        """
+        pass
+
     @abc.abstractmethod
     def _convert(self, ip: IPv4Address) -> Optional[str]:
         raise Exception()
@@ -46,23 +57,119 @@ class NullIpToHostConverter(IpToHostConverter):
 
 
 class NormalIpToHostConverter(IpToHostConverter):
-    """An IpToHostConverter that calls gethostbyaddr to attempt to parse its value"""
+    """
+    An IpToHostConverter that calls gethostbyaddr to attempt to parse its value.
+
+    resolve_all() looks up the ips on a pool of max_workers threads.  A lookup that takes longer than timeout
+    seconds is given up on and its ip is treated as having no name for the rest of the run.  The thread itself
+    can't be interrupted, so it stays busy until the system resolver gives up.
+
+    resolver takes an ip string and returns its host name or raises OSError.  It defaults to gethostbyaddr, and
+    can be replaced by a stub for testing.
+    """
+    _resolver: Callable[[str], str]
+    _max_workers: int
+    _timeout: float
+    _resolved: Dict[IPv4Address, Optional[str]]
+    _timed_out: Set[IPv4Address]
+
+    def __init__(self, *, resolver: Optional[Callable[[str], str]] = None,
+                 max_workers: int = 32, timeout: float = 5.0):
+        self._resolver = resolver or self.__gethostbyaddr
+        self._max_workers = max_workers
+        self._timeout = timeout
+        self._resolved = {}
+        self._timed_out = set()
+
     def _convert(self, ip: IPv4Address) -> Optional[str]:
+        if ip in self._resolved:
+            return self._resolved[ip]
+        if ip in self._timed_out:
+            return None
+        return self._lookup(ip)
+
+    def resolve_all(self, ips: Iterable[IPv4Address]) -> None:
+        unknown_ips = sorted({ip for ip in ips if not self._is_known(ip)})
+        if not unknown_ips:
+            return
+        start_time = time.time()
+        names, timed_out = self.__lookup_concurrently(unknown_ips)
+        for ip, name in names.items():
+            self._remember(ip, name)
+        self._timed_out.update(timed_out)
+        print(f"Resolved {len(unknown_ips)} ips in {time.time() - start_time:.1f} seconds; "
+              f"{len(timed_out)} timed out")
+
+    def _lookup(self, ip: IPv4Address) -> Optional[str]:
         try:
-            name, _, _ = socket.gethostbyaddr(str(ip))
-            return name
+            return self._resolver(str(ip))
         except OSError:
             return None
 
+    def _is_known(self, ip: IPv4Address) -> bool:
+        """Returns true if we already have a result for this ip, and so it doesn't need to be looked up."""
+        return ip in self._resolved or ip in self._timed_out
+
+    def _remember(self, ip: IPv4Address, name: Optional[str]) -> None:
+        """Saves the result of a successful lookup."""
+        self._resolved[ip] = name
+
+    def __lookup_concurrently(self, ips: List[IPv4Address]) \
+            -> Tuple[Dict[IPv4Address, Optional[str]], List[IPv4Address]]:
+        """
+        Looks up the ips on a thread pool.  Returns the names that were found (or None if the lookup failed) and
+        the list of ips whose lookups timed out.  A lookup's time is counted from when it starts running, not from
+        when it was queued.
+        """
+        start_times: Dict[IPv4Address, float] = {}
+
+        def lookup(ip: IPv4Address) -> Optional[str]:
+            start_times[ip] = time.monotonic()
+            return self._lookup(ip)
+
+        names: Dict[IPv4Address, Optional[str]] = {}
+        timed_out: List[IPv4Address] = []
+        executor = ThreadPoolExecutor(max_workers=self._max_workers)
+        futures: Dict[Future[Optional[str]], IPv4Address] = {}
+        try:
+            futures.update((executor.submit(lookup, ip), ip) for ip in ips)
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=self._timeout / 4, return_when=FIRST_COMPLETED)
+                for future in done:
+                    names[futures[future]] = future.result()
+                now = time.monotonic()
+                expired = {future for future in pending
+                           if now - start_times.get(futures[future], now) > self._timeout}
+                for future in expired:
+                    timed_out.append(futures[future])
+                pending -= expired
+        finally:
+            # Don't wait for lookups that have timed out, and don't start any that haven't been run.
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+        return names, timed_out
+
+    @staticmethod
+    def __gethostbyaddr(ip: str) -> str:
+        name, _, _ = socket.gethostbyaddr(ip)
+        return name
+
 
 class ShelvedIPToHostConverter(NormalIpToHostConverter):
+    """
+    A NormalIpToHostConverter that remembers its results in a persistent database.  Entries expire after 25-30
+    days.  Lookups that time out aren't saved, so they are tried again on the next run.
+    """
     _database: shelve.Shelf
     _cached: int
     _created: int
     _expired: int
 
-    def __init__(self, file_name: str):
-        super().__init__()
+    def __init__(self, file_name: str, *, resolver: Optional[Callable[[str], str]] = None,
+                 max_workers: int = 32, timeout: float = 5.0):
+        super().__init__(resolver=resolver, max_workers=max_workers, timeout=timeout)
         self._database = shelve.open(file_name)
         self._expired = self.__purge_old_database_entries()
         self._cached = self._created = 0
@@ -74,11 +181,19 @@ class ShelvedIPToHostConverter(NormalIpToHostConverter):
             name, _timeout = value
             self._cached += 1
             return name
+        if ip in self._timed_out:
+            return None
+        name = self._lookup(ip)
+        self._remember(ip, name)
+        return name
+
+    def _is_known(self, ip: IPv4Address) -> bool:
+        return str(ip) in self._database or ip in self._timed_out
+
+    def _remember(self, ip: IPv4Address, name: Optional[str]) -> None:
         self._created += 1
-        name = super()._convert(ip)
         expiration = datetime.datetime.now() + datetime.timedelta(days=uniform(25.0, 30.0))
         self._database[str(ip)] = (name, expiration)
-        return name
 
     def __purge_old_database_entries(self) -> int:
         now = datetime.datetime.now()
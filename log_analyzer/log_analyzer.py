@@ -9,8 +9,10 @@ from typing import List, Optional, cast
 
 from abstract_configuration import AbstractConfiguration
 from cronjob_utils import expand_globs_and_dates
-from log_entry import LogReader, LogEntry
-from log_parser import LogParser
+from checkpoint import CheckpointFile
+from log_cache import LogCache
+from log_entry import LogReader
+from log_parser import LogParser, SessionCheckpoint
 from ip_to_host_converter import IpToHostConverter
 
 
@@ -66,12 +68,25 @@ def main(arguments: Optional[List[str]] = None) -> None:
                         help='base url to access the information')
     parser.add_argument('--reverse-dns', '--dns', action='store_true', dest='uses_reverse_dns',
                         help='Attempt to resolve the real host name')
+    parser.add_argument('--dns-workers', default=32, type=int, metavar='count', dest='dns_workers',
+                        help='number of reverse dns lookups to run at once')
+    parser.add_argument('--dns-timeout', default=5.0, type=float, metavar='seconds', dest='dns_timeout',
+                        help='give up on a reverse dns lookup after this many seconds')
     parser.add_argument('--ignore-ip', '-x', default=[], action="append", metavar='cidrlist', dest='ignore_ip',
                         type=parse_ignored_ips,
                         help='list of ips to ignore.  May be specified multiple times')
     parser.add_argument('--session-timeout', default=60, type=int, metavar="minutes", dest='session_timeout_minutes',
                         help='a session ends after this period (minutes) of inactivity')
     parser.add_argument('--manifest', default=[], action='append', dest='manifests')
+    parser.add_argument('--processes', default=1, type=int, metavar='count', dest='processes',
+                        help='number of processes to use to read the log files')
+    parser.add_argument('--prefilter', action='store_true', dest='prefilter',
+                        help="Don't parse log lines that can't be part of a report.  Faster, but since these lines "
+                             "no longer keep a session alive, a few sessions may be split in two")
+
+    parser.add_argument('--checkpoint', dest='checkpoint', metavar='file',
+                        help="For --batch, a file in which to save the sessions found so far.  The next run only "
+                             "parses the log entries added since then.  Like --output, it is a pattern")
 
     parser.add_argument('--output', '-o', dest='output',
                         help="output file.  default is stdout.  For --batch, specifies the output pattern")
@@ -86,7 +101,7 @@ def main(arguments: Optional[List[str]] = None) -> None:
     # Debugging hack that shows all log entries
     parser.add_argument('--xxshowall', action='store_true', dest='debug_show_all', help=argparse.SUPPRESS)
 
-    # Caches the read entries into a database, rather than reading the log files anew each time.
+    # Caches the entries read from each log file, rather than reading the log files anew each time.
     parser.add_argument('--xxcached_log_entry', action='store_true', dest='cached_log_entries', help=argparse.SUPPRESS)
 
     parser.add_argument('log_files', nargs=argparse.REMAINDER, help='log files')
@@ -118,13 +133,22 @@ def main(arguments: Optional[List[str]] = None) -> None:
     else:
         if len(args.log_files) < 1:
             raise Exception("Must specify at least one log file.")
-        if args.cached_log_entries:
-            log_entries_list = handle_cached_log_entries(args)
+        line_filter = configuration.get_log_line_filter() if args.prefilter else None
+        checkpoint_file = CheckpointFile(args.checkpoint, args) if args.checkpoint else None
+        session_checkpoint: Optional[SessionCheckpoint] = None
+        if checkpoint_file and run_type == RunType.BATCH:
+            log_entries_list, session_checkpoint = checkpoint_file.read_log_entries(
+                args.log_files, processes=args.processes, line_filter=line_filter)
+        elif args.cached_log_entries:
+            log_entries_list = LogCache().read_logs(args.log_files, processes=args.processes,
+                                                    line_filter=line_filter)
         else:
-            log_entries_list = LogReader.read_logs(args.log_files)
+            log_entries_list = LogReader.read_logs(args.log_files, processes=args.processes, line_filter=line_filter)
 
         if run_type == RunType.BATCH:
-            log_parser.run_batch(log_entries_list)
+            session_checkpoint = log_parser.run_batch(log_entries_list, session_checkpoint)
+            if checkpoint_file:
+                checkpoint_file.save(session_checkpoint)
         elif run_type == RunType.SUMMARY:
             log_parser.run_summary(log_entries_list)
         elif run_type == RunType.FAKE_REALTIME:
@@ -132,28 +156,5 @@ def main(arguments: Optional[List[str]] = None) -> None:
             log_parser.run_realtime(iter(log_entries_list))
 
 
-def handle_cached_log_entries(args: argparse.Namespace) -> List[LogEntry]:
-    import pickle
-    import hashlib
-
-    log_files = sorted(args.log_files)
-    hash_key = hashlib.sha256(':'.join(log_files).encode()).hexdigest()
-    filename = f'.logs/log-{hash_key[:8]}.db'
-
-    try:
-        with open(filename, "rb") as data:
-            print(f"Reading logs from {filename}")
-            return cast(List[LogEntry], pickle.load(data))
-    except FileNotFoundError as _e:
-        pass
-
-    result = LogReader.read_logs(args.log_files)
-    with open(filename, "wb") as output:
-        pickle.dump(result, output)
-        print(f"Caching logs as {filename}")
-
-    return result
-
-
 if __name__ == '__main__':
     main()
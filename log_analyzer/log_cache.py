@@ -0,0 +1,170 @@
+import datetime
+import hashlib
+import os
+import pickle
+from ipaddress import IPv4Address
+from pathlib import Path
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+from urllib.parse import SplitResult
+
+import numpy as np
+import numpy.typing as npt
+
+from log_entry import LogEntry, LogReader, LineFilter, TIME_FORMAT
+
+
+class LogCache:
+    """
+    A per-log-file cache of the parsed log entries, used by --xxcached_log_entry.
+
+    Each log file gets its own pair of cache files, keyed by the file's path and the line filter, and checked
+    against the file's size and mtime.  So when a new day's log is added to a monthly run, only that file is
+    parsed.
+
+    The entries are stored as columns: a NumPy record array holding the time, the ip as a uint32, the status,
+    the size, and indices into a table of interned strings for everything else.  The array is memory mapped when
+    it is read back, and each distinct time, ip, and url in it is only turned into Python objects once.  The rare
+    entry that can't be stored this way (an IPv6 address, an unusual time string) is pickled as is.
+    """
+    VERSION = 1
+
+    DTYPE = np.dtype([('time', np.int64), ('utc_offset', np.int32), ('ip', np.uint32),
+                      ('status', np.int16), ('size', np.int64),
+                      ('method', np.int32), ('user', np.int32), ('agent', np.int32),
+                      ('scheme', np.int32), ('netloc', np.int32), ('path', np.int32),
+                      ('query', np.int32), ('fragment', np.int32)])
+
+    _directory: Path
+
+    def __init__(self, directory: str = '.logs/columns'):
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+
+    def read_logs(self, file_names: Iterable[str], *, processes: int = 1,
+                  line_filter: Optional[LineFilter] = None) -> List[LogEntry]:
+        """Returns the same thing as LogReader.read_logs, using the cache where it is up to date."""
+        file_names = list(file_names)
+        cached: Dict[str, List[LogEntry]] = {}
+        for file_name in file_names:
+            entries = self.__read_cache(file_name, line_filter)
+            if entries is not None:
+                print(f'Reading {file_name} from cache')
+                cached[file_name] = entries
+
+        missing = [file_name for file_name in file_names if file_name not in cached]
+        if missing:
+            # Stat the files before reading them, so that a file that grows while it is being read doesn't get a
+            # cache that claims to hold the new lines.
+            stats = [os.stat(file_name) for file_name in missing]
+            # Read the files, and then divide the entries back up by file.
+            entries_by_file = LogReader.read_logs_by_file(missing, processes=processes, line_filter=line_filter)
+            for file_name, stat, entries in zip(missing, stats, entries_by_file):
+                self.__write_cache(file_name, stat, line_filter, entries)
+                cached[file_name] = entries
+
+        return [entry for file_name in file_names for entry in cached[file_name]]
+
+    def __cache_paths(self, file_name: str, line_filter: Optional[LineFilter]) -> Tuple[Path, Path]:
+        filter_name = f'{line_filter.__module__}.{line_filter.__qualname__}' if line_filter else ''
+        key = hashlib.sha256(f'{os.path.abspath(file_name)}:{filter_name}'.encode()).hexdigest()[:16]
+        return self._directory / f'log-{key}.npy', self._directory / f'log-{key}.pickle'
+
+    def __read_cache(self, file_name: str, line_filter: Optional[LineFilter]) -> Optional[List[LogEntry]]:
+        rows_path, info_path = self.__cache_paths(file_name, line_filter)
+        try:
+            with open(info_path, 'rb') as file:
+                info: Dict[str, Any] = pickle.load(file)
+            stat = os.stat(file_name)
+            if (info['version'], info['path'], info['size'], info['mtime']) != \
+                    (self.VERSION, os.path.abspath(file_name), stat.st_size, stat.st_mtime):
+                return None
+            rows = np.load(rows_path, mmap_mode='r')
+        except (OSError, EOFError, KeyError, ValueError, pickle.UnpicklingError):
+            return None
+        return self.__rows_to_entries(rows, info['strings'], info['extras'])
+
+    def __write_cache(self, file_name: str, stat: os.stat_result, line_filter: Optional[LineFilter],
+                      entries: List[LogEntry]) -> None:
+        rows_path, info_path = self.__cache_paths(file_name, line_filter)
+        rows, strings, extras = self.__entries_to_rows(entries)
+        # Write the rows first, so that the info file is never newer than its rows.
+        np.save(rows_path, rows, allow_pickle=False)
+        info = dict(version=self.VERSION, path=os.path.abspath(file_name), size=stat.st_size, mtime=stat.st_mtime,
+                    strings=strings, extras=extras)
+        with open(info_path, 'wb') as file:
+            pickle.dump(info, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def __entries_to_rows(cls, entries: List[LogEntry]) -> Tuple[npt.NDArray[np.void], List[str], Dict[int, LogEntry]]:
+        strings: List[str] = []
+        string_index: Dict[str, int] = {}
+        extras: Dict[int, LogEntry] = {}
+
+        def intern(value: Optional[str]) -> int:
+            if value is None:
+                return -1
+            index = string_index.get(value)
+            if index is None:
+                index = string_index[value] = len(strings)
+                strings.append(value)
+            return index
+
+        rows: npt.NDArray[np.void] = np.zeros(len(entries), dtype=cls.DTYPE)
+        for index, entry in enumerate(entries):
+            time = entry.time
+            utc_offset = time.utcoffset()
+            if not isinstance(entry.host_ip, IPv4Address) or utc_offset is None or time.microsecond \
+                    or utc_offset.seconds % 60 or time.strftime(TIME_FORMAT) != entry.time_string:
+                extras[index] = entry
+                continue
+            url = entry.url
+            rows[index] = (int(time.timestamp()), utc_offset // datetime.timedelta(minutes=1), int(entry.host_ip),
+                           entry.status, -1 if entry.size is None else entry.size,
+                           intern(entry.method), intern(entry.user), intern(entry.agent),
+                           intern(url.scheme), intern(url.netloc), intern(url.path),
+                           intern(url.query), intern(url.fragment))
+        return rows, strings, extras
+
+    @classmethod
+    def __rows_to_entries(cls, rows: npt.NDArray[np.void], strings: List[str],
+                          extras: Dict[int, LogEntry]) -> List[LogEntry]:
+        names = cls.DTYPE.names
+        assert names is not None
+        columns: List[List[int]] = [rows[name].tolist() for name in names]
+        # Log entries share most of their values with the ones around them, so make each distinct time, ip, and
+        # url only once.
+        timezones: Dict[int, datetime.timezone] = {}
+        times: Dict[Tuple[int, int], Tuple[datetime.datetime, str]] = {}
+        ips: Dict[int, IPv4Address] = {}
+        urls: Dict[Tuple[int, int, int, int, int], SplitResult] = {}
+        entries: List[LogEntry] = []
+        for index, (time, utc_offset, ip, status, size, method, user, agent,
+                    scheme, netloc, path, query, fragment) in enumerate(zip(*columns)):
+            if index in extras:
+                entries.append(extras[index])
+                continue
+            time_info = times.get((time, utc_offset))
+            if time_info is None:
+                tzinfo = timezones.get(utc_offset)
+                if tzinfo is None:
+                    tzinfo = timezones[utc_offset] = datetime.timezone(datetime.timedelta(minutes=utc_offset))
+                entry_time = datetime.datetime.fromtimestamp(time, tzinfo)
+                time_info = times[time, utc_offset] = (entry_time, entry_time.strftime(TIME_FORMAT))
+            host_ip = ips.get(ip)
+            if host_ip is None:
+                host_ip = ips[ip] = IPv4Address(ip)
+            url_key = (scheme, netloc, path, query, fragment)
+            url = urls.get(url_key)
+            if url is None:
+                url = urls[url_key] = SplitResult(strings[scheme], strings[netloc], strings[path],
+                                                  strings[query], strings[fragment])
+            entries.append(LogEntry(host_ip=host_ip,
+                                    user=None if user < 0 else strings[user],
+                                    status=status,
+                                    method=strings[method],
+                                    url=url,
+                                    size=None if size < 0 else size,
+                                    agent=None if agent < 0 else strings[agent],
+                                    time_string=time_info[1],
+                                    time=time_info[0]))
+        return entries
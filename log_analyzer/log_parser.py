@@ -8,7 +8,7 @@ import sys
 from collections import deque
 from ipaddress import IPv4Address
 from pathlib import Path
-from typing import List, Iterator, Dict, NamedTuple, Optional, TextIO, Any
+from typing import List, Iterator, Dict, NamedTuple, Optional, TextIO, Any, Set
 
 from abstract_configuration import AbstractConfiguration, AbstractSessionInfo, LogId
 from ip_to_host_converter import IpToHostConverter
@@ -77,6 +77,32 @@ class HostInfo(NamedTuple):
         return self.sessions[0].start_time()
 
 
+class SessionCheckpoint(NamedTuple):
+    """
+    What run_batch needs to know about the log entries it has already seen, so that the next run only has to parse
+    the new ones.  Sessions that ended more than session_timeout before the cutoff (the time of the latest entry)
+    can't change, and are kept as is.  The entries of the last session of each host are kept raw, because new
+    entries might continue that session; they are parsed again along with the new entries.
+    """
+    completed_sessions: List[Session]
+    open_log_entries: List[LogEntry]
+    cutoff: Optional[datetime.datetime]
+    next_session_number: int
+    configuration_state: Any
+
+
+class _OpenSessions:
+    """Used by __get_session_list to collect the sessions that might continue past the cutoff."""
+    cutoff: datetime.datetime
+    log_entries: List[LogEntry]
+    session_ids: Set[str]
+
+    def __init__(self, cutoff: datetime.datetime):
+        self.cutoff = cutoff
+        self.log_entries = []
+        self.session_ids = set()
+
+
 class LogParser:
     """
     Code that reads through the log entries, groups them by host and by session, and prints them out in a nice format.
@@ -87,7 +113,7 @@ class LogParser:
     _by_ip: bool
     _ignored_ips: List[ipaddress.IPv4Network]
     _ip_to_host_converter: IpToHostConverter
-    _id_generator: Iterator[str]
+    _next_session_number: int
 
     def __init__(self, configuration: AbstractConfiguration, *,
                  session_timeout_minutes: int, output: str,
@@ -104,11 +130,31 @@ class LogParser:
         self._by_ip = by_ip
         self._ignored_ips = ignored_ips
         self._ip_to_host_converter = ip_to_host_converter
-        self._id_generator = (f'{self.__base36(value):>04}' for value in itertools.count(1))
+        self._next_session_number = 1
 
-    def run_batch(self, log_entries: List[LogEntry]) -> None:
+    def run_batch(self, log_entries: List[LogEntry],
+                  checkpoint: Optional[SessionCheckpoint] = None) -> SessionCheckpoint:
+        """
+        Generate the report.  If checkpoint is given, it is the result of an earlier run_batch, and log_entries
+        are just the entries that have been logged since then.  Returns the checkpoint for the next run.
+        """
         print(f'Parsing input')
-        all_sessions = self.__get_session_list(log_entries, self._uses_html)
+        previous_sessions: List[Session] = []
+        cutoff: Optional[datetime.datetime] = None
+        if checkpoint:
+            previous_sessions = checkpoint.completed_sessions
+            cutoff = checkpoint.cutoff
+            self._next_session_number = checkpoint.next_session_number
+            self._configuration.restore_checkpoint_state(checkpoint.configuration_state,
+                                                         set(checkpoint.open_log_entries))
+            log_entries = checkpoint.open_log_entries + log_entries
+        latest_time = max((entry.time for entry in log_entries), default=None)
+        if latest_time and (not cutoff or latest_time > cutoff):
+            cutoff = latest_time
+        open_sessions = _OpenSessions(cutoff) if cutoff else None
+        all_sessions = previous_sessions + self.__get_session_list(log_entries, self._uses_html, open_sessions)
+        # Look up the host names all at once, rather than one at a time as the hosts are grouped.
+        self._ip_to_host_converter.resolve_all(session.host_ip for session in all_sessions)
 
         def do_grouping(by_ip: bool) -> List[HostInfo]:
             if by_ip:
@@ -134,6 +180,14 @@ class LogParser:
             host_infos = do_grouping(by_ip=True)
             self.__generate_batch_html_output(host_infos)
 
+        return SessionCheckpoint(
+            completed_sessions=[session for session in all_sessions
+                                if not open_sessions or session.id not in open_sessions.session_ids],
+            open_log_entries=open_sessions.log_entries if open_sessions else [],
+            cutoff=cutoff,
+            next_session_number=self._next_session_number,
+            configuration_state=self._configuration.get_checkpoint_state())
+
     def run_summary(self, log_entries: List[LogEntry]) -> None:
         """Print out all slugs that have appeared in the text."""
         all_sessions = self.__get_session_list(log_entries, uses_html=False)
@@ -201,8 +255,12 @@ class LogParser:
 
             self.__print_entry_info(entry, entry_info, current_session.start_time)
 
-    def __get_session_list(self, log_entries: List[LogEntry], uses_html: bool) -> List[Session]:
-        """Group the log entries into parsed sessions."""
+    def __get_session_list(self, log_entries: List[LogEntry], uses_html: bool,
+                           open_sessions: Optional[_OpenSessions] = None) -> List[Session]:
+        """
+        Group the log entries into parsed sessions.  If open_sessions is given, the sessions that haven't timed out
+        by its cutoff, and their raw log entries, are added to it.
+        """
 
         sessions: List[Session] = []
         log_entries.sort(key=lambda entry: (entry.host_ip, entry.time))
@@ -228,26 +286,40 @@ class LogParser:
                                  data=entry_info, opus_url=opus_url, id=log_id)
 
                 current_session_entries = [create_session_entry(entry, entry_info, opus_url, entry_id)]
+                current_session_log_entries = [entry]
 
                 # Keep on grabbing entries for as long as we have not reached a timeout.
                 session_end_time = session_start_time + self._session_timeout
                 while session_log_entries and session_log_entries[0].time <= session_end_time:
                     entry = session_log_entries.popleft()
+                    current_session_log_entries.append(entry)
                     session_end_time = entry.time + self._session_timeout
                     entry_id = LogId(entry_id + 1)
                     entry_info, opus_url = session_info.parse_log_entry(entry, entry_id)
                     if entry_info:
                         current_session_entries.append(create_session_entry(entry, entry_info, opus_url, entry_id))
 
+                # Only the last session of a host can still be open.
+                is_open = open_sessions is not None and session_end_time >= open_sessions.cutoff
                 if session_info.get_icon_flags():
                     # We ignore sessions that don't actually do anything.
-                    sessions.append(Session(host_ip=session_host_ip,
-                                            entries=current_session_entries,
-                                            session_info=session_info,
-                                            id=next(self._id_generator)))
+                    session = Session(host_ip=session_host_ip,
+                                      entries=current_session_entries,
+                                      session_info=session_info,
+                                      id=self.__next_session_id())
+                    sessions.append(session)
+                    if open_sessions is not None and is_open:
+                        open_sessions.session_ids.add(session.id)
+                if open_sessions is not None and is_open:
+                    open_sessions.log_entries.extend(current_session_log_entries)
 
         return sessions
 
+    def __next_session_id(self) -> str:
+        value = self._next_session_number
+        self._next_session_number += 1
+        return f'{self.__base36(value):>04}'
+
     def __generate_batch_text_output(self, host_infos: List[HostInfo]) -> None:
         output = self._output
         assert not self._uses_html
@@ -1,15 +1,15 @@
 import collections
 import textwrap
-from typing import List, Dict, Any, Tuple, TextIO, cast, Optional, Sequence
+from typing import List, Dict, Any, Tuple, TextIO, cast, Optional, Sequence, Set
 
 from abstract_configuration import AbstractConfiguration
 from ip_to_host_converter import IpToHostConverter
-from log_entry import LogEntry
+from log_entry import LogEntry, LineFilter
 from log_parser import Session, HostInfo
 from opus import slug
 from .html_generator import HtmlGenerator
 from .query_handler import QueryHandler, MetadataSlugInfo
-from .session_info import SessionInfo
+from .session_info import SessionInfo, is_possibly_interesting_log_line
 
 
 class Configuration(AbstractConfiguration):
@@ -52,6 +52,17 @@ class Configuration(AbstractConfiguration):
     def create_batch_html_generator(self, host_infos_by_ip: List[HostInfo]) -> HtmlGenerator:
         return HtmlGenerator(self, host_infos_by_ip)
 
+    def get_log_line_filter(self) -> Optional[LineFilter]:
+        return is_possibly_interesting_log_line
+
+    def get_checkpoint_state(self) -> List[Tuple[str, LogEntry]]:
+        return self._sessionless_downloads
+
+    def restore_checkpoint_state(self, state: List[Tuple[str, LogEntry]], reparsed_entries: Set[LogEntry]) -> None:
+        # The SessionInfos share this list, so it must be updated in place.
+        self._sessionless_downloads[:] = [(file_name, entry) for file_name, entry in state
+                                          if entry not in reparsed_entries]
+
     @property
     def api_host_url(self) -> str:
         return self._api_host_url
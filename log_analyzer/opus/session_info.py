@@ -13,6 +13,31 @@ from .slug import Info
 LogMarker = Union[LogId, Tuple[LogId, int]]
 
 
+def is_possibly_interesting_log_line(line: str) -> bool:
+    """
+    A cheap test on the raw text of a log line, done before it is parsed.  Returns False if SessionInfo.parse_log_entry
+    would certainly ignore the entry: it isn't a successful request for /opus/__ or /downloads/, or it comes from
+    a bot.  It may return True for lines that will be ignored anyway.
+    """
+    if '/opus/__' not in line and '/downloads/' not in line:
+        return False
+    if '" 200 ' not in line:
+        return False
+    # The user agent is the last quoted field.  If it has an escaped quote, this finds just the end of it, which is
+    # still enough to rule out a bot.
+    line = line.rstrip()
+    if line.endswith('"'):
+        agent = line[line.rfind('"', 0, -1) + 1:-1].lower()
+        if 'bot' in agent or 'spider' in agent:
+            return False
+    return True
+
+
+def _new_sessioned_download_usage() -> Tuple[List[int], Set[LogMarker]]:
+    # Not a lambda, so that a SessionInfo can be pickled by --checkpoint
+    return [0], set()
+
+
 class SessionInfo(AbstractSessionInfo):
     """
     A class that keeps track of information about the current user session and parses log entries based on information
@@ -47,7 +72,7 @@ class SessionInfo(AbstractSessionInfo):
         self._session_metadata_slugs = dict()
         self._session_sort_slugs_usage = collections.defaultdict(set)
         self._help_files_usage = collections.defaultdict(set)
-        self._sessioned_downloads_usage = collections.defaultdict(lambda: ([0], set()))
+        self._sessioned_downloads_usage = collections.defaultdict(_new_sessioned_download_usage)
         self._sessionless_downloads_usage = sessionless_downloads
         self._product_types_usage = collections.defaultdict(set)
         self._product_types_count = 0
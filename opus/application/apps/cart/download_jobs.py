@@ -0,0 +1,524 @@
+################################################################################
+#
+# cart/download_jobs.py
+#
+# A simple on-disk job queue for building download archives.
+#
+# Building the archive for a large cart can take minutes, which is far longer
+# than we want to tie up a web server process and longer than most proxies
+# will wait. Instead, api_create_download gathers everything that needs the
+# database (the list of files, data.csv, the manifest) into a job spec and the
+# archive itself is built later by a worker, which is either a thread pool
+# inside the web server process or the separate download_worker.py process.
+# The client polls for the result.
+#
+# Each job is a JSON file in DOWNLOAD_JOB_PATH named by a hash of everything
+# that determines the archive's contents (including the import version), so
+# asking for the same download again finds the job (and the archive) that
+# already exists. The finished jobs thus form a content-addressed cache of
+# archives, which is kept within DOWNLOAD_ARCHIVE_CACHE_MAX_SIZE and
+# DOWNLOAD_ARCHIVE_CACHE_MAX_COUNT by deleting the least recently used ones.
+# Archives are written under a temporary name and renamed when complete, and
+# a job whose worker died is simply run again, so an interrupted build never
+# leaves a truncated archive behind.
+#
+################################################################################
+
+from collections import deque
+import concurrent.futures
+import hashlib
+import io
+import json
+import os
+import re
+import tarfile
+import threading
+import time
+import zipfile
+
+import settings
+
+import logging
+log = logging.getLogger(__name__)
+
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+# A queued job that nobody has started after this many seconds was probably
+# lost when the web server process that queued it was restarted
+_JOB_LOST_TIME = 60
+
+_JOB_ID_RE = re.compile(r'[0-9a-f]{40}')
+
+
+################################################################################
+#
+# Job files
+#
+################################################################################
+
+def download_job_id(key):
+    "Return the job id for a download described by the JSON-able dict key."
+    key_str = json.dumps(key, sort_keys=True)
+    return hashlib.sha1(key_str.encode()).hexdigest()
+
+def is_valid_download_job_id(job_id):
+    "Return True if job_id looks like something download_job_id returned."
+    return job_id is not None and _JOB_ID_RE.fullmatch(job_id) is not None
+
+def _job_file_name(job_id):
+    return os.path.join(settings.DOWNLOAD_JOB_PATH, job_id+'.json')
+
+def _lock_file_name(job_id):
+    return os.path.join(settings.DOWNLOAD_JOB_PATH, job_id+'.lock')
+
+def read_download_job(job_id):
+    "Return the job dict for job_id, or None if there is no such job."
+    try:
+        with open(_job_file_name(job_id), 'r') as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+def _write_download_job(job):
+    # Write to a temporary file and rename so readers never see a partial job
+    os.makedirs(settings.DOWNLOAD_JOB_PATH, exist_ok=True)
+    job_file_name = _job_file_name(job['job_id'])
+    tmp_file_name = (job_file_name + '.' + str(os.getpid()) + '.'
+                     + str(threading.get_ident()) + '.tmp')
+    with open(tmp_file_name, 'w') as fp:
+        json.dump(job, fp)
+    os.replace(tmp_file_name, job_file_name)
+
+def _pid_alive(pid):
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError: # pragma: no cover
+        return True
+    return True
+
+def _lock_holder(job_id):
+    "Return the pid holding the lock on job_id, or None if not locked."
+    try:
+        with open(_lock_file_name(job_id), 'r') as fp:
+            return int(fp.read())
+    except (OSError, ValueError):
+        return None
+
+def _claim_download_job(job_id):
+    """Try to lock job_id for this process. Return True if successful.
+
+    The lock file is written under a temporary name and hard linked into
+    place, so nobody can ever see a lock file without its pid in it.
+    """
+    lock_file_name = _lock_file_name(job_id)
+    tmp_file_name = (lock_file_name + '.' + str(os.getpid()) + '.'
+                     + str(threading.get_ident()) + '.tmp')
+    with open(tmp_file_name, 'w') as fp:
+        fp.write(str(os.getpid()))
+    try:
+        for _ in range(2):
+            try:
+                os.link(tmp_file_name, lock_file_name)
+            except FileExistsError:
+                if _pid_alive(_lock_holder(job_id)):
+                    return False
+                # Whoever held the lock died; take it over
+                try:
+                    os.remove(lock_file_name)
+                except OSError: # pragma: no cover
+                    pass
+                continue
+            return True
+        return False # pragma: no cover
+    finally:
+        os.remove(tmp_file_name)
+
+def _release_download_job(job_id):
+    try:
+        os.remove(_lock_file_name(job_id))
+    except OSError: # pragma: no cover
+        pass
+
+def _job_needs_run(job):
+    "Return True if nobody is working on this job but it isn't finished."
+    if job['status'] == JOB_RUNNING:
+        return not _pid_alive(_lock_holder(job['job_id']))
+    if job['status'] == JOB_QUEUED:
+        return time.time() - job['queued_time'] > _JOB_LOST_TIME
+    return False
+
+
+################################################################################
+#
+# The queue
+#
+################################################################################
+
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+
+def _start_download_job(job_id):
+    # With the 'process' worker, download_worker.py will find the job itself
+    if settings.DOWNLOAD_JOB_WORKER != 'thread':
+        return
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+                                        settings.DOWNLOAD_JOB_WORKER_THREADS)
+    _EXECUTOR.submit(run_download_job, job_id)
+
+def find_download_job(job_id):
+    """Return the job for job_id if it's finished or in progress.
+
+    Returns None if there is no such job, if it failed, or if its archive has
+    since been deleted, meaning the caller should submit it again. A job that
+    was abandoned by a dead worker is restarted.
+    """
+    job = read_download_job(job_id)
+    if job is None or job['status'] == JOB_FAILED:
+        return None
+    if job['status'] == JOB_DONE:
+        # The archive's mtime records when it was last used, for eviction
+        try:
+            os.utime(job['spec']['archive_file_name'])
+        except OSError:
+            return None
+        return job
+    if _job_needs_run(job):
+        log.info('Restarting abandoned download job %s', job_id)
+        job['status'] = JOB_QUEUED
+        job['queued_time'] = time.time()
+        _write_download_job(job)
+        _start_download_job(job_id)
+    return job
+
+def submit_download_job(job_id, spec, start=True):
+    """Queue a job to build the archive described by spec.
+
+    If an equivalent job is already queued, running, or done, that job is
+    returned instead and spec is ignored. If start is False, the job is not
+    handed to the thread pool because the caller is going to run it with
+    run_download_job.
+    """
+    job = find_download_job(job_id)
+    if job is not None:
+        return job
+    job = {'job_id': job_id,
+           'status': JOB_QUEUED,
+           'queued_time': time.time(),
+           'spec': spec}
+    _write_download_job(job)
+    if start:
+        _start_download_job(job_id)
+    return job
+
+def wait_for_download_job(job_id, timeout):
+    "Wait up to timeout seconds for job_id to finish and return the job."
+    end_time = time.time() + timeout
+    while True:
+        job = read_download_job(job_id)
+        if (job is None or job['status'] in (JOB_DONE, JOB_FAILED) or
+            time.time() >= end_time):
+            return job
+        time.sleep(0.1)
+
+def run_download_job(job_id):
+    "Build the archive for job_id unless someone else already is."
+    if not _claim_download_job(job_id):
+        return
+    try:
+        job = read_download_job(job_id)
+        if job is None or job['status'] not in (JOB_QUEUED, JOB_RUNNING):
+            return
+        job['status'] = JOB_RUNNING
+        job['start_time'] = time.time()
+        _write_download_job(job)
+
+        spec = job['spec']
+        archive_file_name = spec['archive_file_name']
+        partial_file_name = archive_file_name + '.partial'
+        try:
+            errors = build_archive(partial_file_name, spec)
+            os.replace(partial_file_name, archive_file_name)
+        except Exception as e:
+            log.error('run_download_job: Building archive %s for job %s '
+                      +'failed: %s', archive_file_name, job_id, str(e))
+            if os.path.exists(partial_file_name):
+                os.remove(partial_file_name)
+            job['status'] = JOB_FAILED
+            job['error'] = str(e)
+        else:
+            job['status'] = JOB_DONE
+            job['errors'] = errors
+        finally:
+            if os.path.exists(spec['csv_file_name']):
+                os.remove(spec['csv_file_name'])
+        job['finish_time'] = time.time()
+        _write_download_job(job)
+        log.info('Download job %s %s in %.2f secs', job_id, job['status'],
+                 job['finish_time']-job['start_time'])
+    finally:
+        _release_download_job(job_id)
+
+    _evict_download_archives_if_due()
+
+def _evict_download_archives_if_due():
+    # Looking at every job is too slow to do after each one, so only run
+    # evict_download_archives every DOWNLOAD_ARCHIVE_EVICT_INTERVAL seconds.
+    # The time of the last run is a file's mtime so that all the workers
+    # share it.
+    stamp_file_name = os.path.join(settings.DOWNLOAD_JOB_PATH,
+                                   'last_eviction')
+    try:
+        last_time = os.path.getmtime(stamp_file_name)
+    except OSError:
+        last_time = 0
+    if time.time() - last_time < settings.DOWNLOAD_ARCHIVE_EVICT_INTERVAL:
+        return
+    with open(stamp_file_name, 'a'):
+        pass
+    os.utime(stamp_file_name)
+    evict_download_archives()
+
+def evict_download_archives():
+    """Delete the least recently used archives until the cache is small enough.
+
+    Archives used within the last DOWNLOAD_ARCHIVE_CACHE_MIN_AGE seconds are
+    never deleted, since the user may not have fetched them yet. Failed jobs
+    are forgotten once they are that old.
+    """
+    try:
+        job_file_names = os.listdir(settings.DOWNLOAD_JOB_PATH)
+    except FileNotFoundError: # pragma: no cover
+        return
+    now = time.time()
+    archives = []
+    for job_file_name in job_file_names:
+        if not job_file_name.endswith('.json'):
+            continue
+        job_id = job_file_name[:-5]
+        job = read_download_job(job_id)
+        if job is None:
+            continue
+        if job['status'] == JOB_FAILED:
+            if now - job['finish_time'] > settings.DOWNLOAD_ARCHIVE_CACHE_MIN_AGE:
+                _remove_download_job(job_id, None)
+            continue
+        if job['status'] != JOB_DONE:
+            continue
+        archive_file_name = job['spec']['archive_file_name']
+        try:
+            st = os.stat(archive_file_name)
+        except OSError:
+            # Someone deleted the archive out from under us
+            _remove_download_job(job_id, None)
+            continue
+        archives.append((st.st_mtime, st.st_size, job_id, archive_file_name))
+
+    # Oldest first
+    archives.sort()
+    total_size = sum([x[1] for x in archives])
+    total_count = len(archives)
+    for mtime, size, job_id, archive_file_name in archives:
+        if (total_size <= settings.DOWNLOAD_ARCHIVE_CACHE_MAX_SIZE and
+            total_count <= settings.DOWNLOAD_ARCHIVE_CACHE_MAX_COUNT):
+            break
+        if now - mtime < settings.DOWNLOAD_ARCHIVE_CACHE_MIN_AGE:
+            break
+        log.info('Evicting download archive %s (%d bytes)', archive_file_name,
+                 size)
+        _remove_download_job(job_id, archive_file_name)
+        total_size -= size
+        total_count -= 1
+
+def _remove_download_job(job_id, archive_file_name):
+    # The job file goes first so nobody finds a job whose archive is missing
+    for file_name in (_job_file_name(job_id), archive_file_name):
+        if file_name is None:
+            continue
+        try:
+            os.remove(file_name)
+        except OSError: # pragma: no cover
+            pass
+
+def run_download_worker(poll_interval, once=False):
+    """Run queued download jobs forever (the 'process' worker).
+
+    This is used by download_worker.py. Jobs left half-built by a worker
+    that died are picked up again.
+    """
+    while True:
+        try:
+            job_file_names = sorted(os.listdir(settings.DOWNLOAD_JOB_PATH))
+        except FileNotFoundError:
+            job_file_names = []
+        for job_file_name in job_file_names:
+            if not job_file_name.endswith('.json'):
+                continue
+            job_id = job_file_name[:-5]
+            job = read_download_job(job_id)
+            if job is None:
+                continue
+            if (job['status'] == JOB_QUEUED or
+                (job['status'] == JOB_RUNNING and _job_needs_run(job))):
+                run_download_job(job_id)
+        if once:
+            return
+        time.sleep(poll_interval)
+
+
+################################################################################
+#
+# Building archives
+#
+################################################################################
+
+def _read_file(path, read_ahead):
+    # Returns the file contents, None if the file is to be copied into the
+    # archive directly instead of read into memory, or the exception if it
+    # can't be read
+    if not read_ahead:
+        return None
+    try:
+        with open(path, 'rb') as fp:
+            return fp.read()
+    except Exception as e:
+        return e
+
+def _file_size(path):
+    # A file we can't stat counts as empty; reading it will report the error
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def _read_members(members):
+    """Yield (member, contents) for each member in order.
+
+    The files are read ahead by a pool of threads so that slow storage can
+    be read in parallel while the archive is written in order. No more than
+    DOWNLOAD_READ_AHEAD_MAX_SIZE bytes are read ahead at once; a file bigger
+    than that isn't read ahead at all, and its contents are None.
+    """
+    num_threads = settings.DOWNLOAD_READ_THREADS
+    max_size = settings.DOWNLOAD_READ_AHEAD_MAX_SIZE
+    with concurrent.futures.ThreadPoolExecutor(num_threads) as executor:
+        pending = deque()
+        pending_size = 0
+        for member in members:
+            size = _file_size(member[0])
+            read_ahead = size <= max_size
+            if not read_ahead:
+                size = 0
+            while pending and (len(pending) >= num_threads*2 or
+                               pending_size + size > max_size):
+                old_member, old_size, future = pending.popleft()
+                pending_size -= old_size
+                yield old_member, future.result()
+            pending.append((member, size,
+                            executor.submit(_read_file, member[0], read_ahead)))
+            pending_size += size
+        while pending:
+            member, _, future = pending.popleft()
+            yield member, future.result()
+
+def _add_file(archive_file, fmt, path, arcname, contents=None):
+    if contents is None:
+        if fmt == 'zip':
+            archive_file.write(path, arcname=arcname)
+        else:
+            archive_file.add(path, arcname=arcname)
+    elif fmt == 'zip':
+        zinfo = zipfile.ZipInfo.from_file(path, arcname=arcname)
+        zinfo.compress_type = archive_file.compression
+        archive_file.writestr(zinfo, contents)
+    else:
+        tarinfo = archive_file.gettarinfo(path, arcname=arcname)
+        tarinfo.size = len(contents)
+        archive_file.addfile(tarinfo, io.BytesIO(contents))
+
+def _add_bytes(archive_file, fmt, arcname, contents):
+    now = time.time()
+    if fmt == 'zip':
+        zinfo = zipfile.ZipInfo(arcname,
+                                date_time=time.localtime(now)[:6])
+        zinfo.compress_type = archive_file.compression
+        zinfo.external_attr = 0o644 << 16
+        archive_file.writestr(zinfo, contents)
+    else:
+        tarinfo = tarfile.TarInfo(arcname)
+        tarinfo.size = len(contents)
+        tarinfo.mtime = now
+        tarinfo.mode = 0o644
+        archive_file.addfile(tarinfo, io.BytesIO(contents))
+
+def build_archive(archive, spec):
+    """Write the archive described by spec to archive.
+
+    archive is either a file name or a writable file object.
+
+    spec is a dict containing:
+        fmt                 One of settings.DOWNLOAD_FORMATS.
+        members             A list of [path, arcname, opus_id, product_type,
+                            pretty_name] for each data product.
+        url_file_only       If True, don't include the data products.
+        manifest            The contents of manifest.csv.
+        manifest_file_name  Where to save a copy of the manifest.
+        csv_file_name       The file containing data.csv.
+        urls                The contents of urls.txt.
+
+    Returns a list of errors for data products that couldn't be added.
+    """
+    fmt = spec['fmt']
+    write_mode = settings.DOWNLOAD_FORMATS[fmt][1]
+    if fmt == 'zip':
+        archive_file = zipfile.ZipFile(archive, mode=write_mode)
+    elif isinstance(archive, str):
+        archive_file = tarfile.open(name=archive, mode=write_mode)
+    else:
+        archive_file = tarfile.open(mode=write_mode, fileobj=archive)
+
+    errors = []
+    try:
+        if not spec['url_file_only']:
+            for member, contents in _read_members(spec['members']):
+                path, arcname, opus_id, product_type, pretty_name = member
+                try:
+                    if isinstance(contents, Exception):
+                        raise contents
+                    _add_file(archive_file, fmt, path, arcname, contents)
+                except Exception as e:
+                    log.error('api_create_download threw exception '+
+                              'for opus_id %s, product_type %s, '+
+                              'file %s, pretty_name %s: %s',
+                              opus_id, product_type, path,
+                              pretty_name, str(e))
+                    errors.append('Error adding: ' + pretty_name)
+
+        # Write errors to manifest file
+        manifest = spec['manifest']
+        if errors:
+            manifest += 'Errors:\n'
+            for e in errors:
+                manifest += e+'\n'
+        with open(spec['manifest_file_name'], 'w') as manifest_fp:
+            manifest_fp.write(manifest)
+
+        # Add manifests and checksum files to the archive
+        _add_file(archive_file, fmt, spec['manifest_file_name'],
+                  'manifest.csv')
+        _add_file(archive_file, fmt, spec['csv_file_name'], 'data.csv')
+        _add_bytes(archive_file, fmt, 'urls.txt', spec['urls'].encode())
+    finally:
+        archive_file.close()
+
+    return errors
@@ -9,6 +9,7 @@ from django.test import RequestFactory
 
 from cart.views import (api_cart_status,
                         api_create_download,
+                        api_download_status,
                         api_edit_cart,
                         api_get_cart_csv,
                         api_reset_session,
@@ -151,3 +152,29 @@ class cartTests(TestCase):
         with self.assertRaisesRegex(Http404,
             r'Internal error \(No request was provided\) for /api/download/testopusid.zip'):
             api_create_download(request, 'testopusid', 'zip')
+
+
+            ##################################################
+            ######### api_download_status UNIT TESTS #########
+            ##################################################
+
+    def test__api_download_status_no_request(self):
+        "[test_cart.py] api_download_status: no request"
+        with self.assertRaisesRegex(Http404,
+            r'Internal error \(No request was provided\) for /__cart/download/status.json'):
+            api_download_status(None)
+
+    def test__api_download_status_no_get(self):
+        "[test_cart.py] api_download_status: no GET"
+        request = self.factory.get('/__cart/download/status.json')
+        request.GET = None
+        with self.assertRaisesRegex(Http404,
+            r'Internal error \(No request was provided\) for /__cart/download/status.json'):
+            api_download_status(request)
+
+    def test__api_download_status_no_jobid(self):
+        "[test_cart.py] api_download_status: no jobid"
+        request = self.factory.get('/__cart/download/status.json')
+        with self.assertRaisesRegex(Http404,
+            r'Unknown download job "None" for /__cart/download/status.json'):
+            api_download_status(request)
@@ -6,7 +6,8 @@ from cart.views import (
     api_get_cart_csv,
     api_edit_cart,
     api_reset_session,
-    api_create_download
+    api_create_download,
+    api_download_status
 )
 
 urlpatterns = [
@@ -16,6 +17,7 @@ urlpatterns = [
     url(r'^__cart/(?P<action>add|remove|addrange|removerange|addall).json$', api_edit_cart),
     url(r'^__cart/reset.json$', api_reset_session),
     url(r'^__cart/download.json$', api_create_download),
+    url(r'^__cart/download/status.json$', api_download_status),
     url(r'^api/download/(?P<opus_id>[-\w]+).(?P<fmt>zip|tar|tgz)$', api_create_download),
     url(r'^__api/download/(?P<opus_id>[-\w]+).(?P<fmt>zip|tar|tgz)$', api_create_download),
 ]
@@ -18,14 +18,13 @@
 import csv
 import logging
 import os
-import tarfile
 import time
-import zipfile
 
 import settings
 
 from django.db import connection, DatabaseError
-from django.http import (HttpResponse,
+from django.http import (FileResponse,
+                         HttpResponse,
                          HttpResponseServerError,
                          Http404)
 from django.template.loader import get_template
@@ -33,8 +32,16 @@ from django.views.decorators.cache import never_cache
 
 from hurry.filesize import size as nice_file_size
 
+from cart.download_jobs import (download_job_id,
+                                find_download_job,
+                                is_valid_download_job_id,
+                                run_download_job,
+                                submit_download_job,
+                                wait_for_download_job,
+                                JOB_DONE,
+                                JOB_FAILED)
 from cart.models import Cart
-from dictionary.models import Definitions
+from dictionary.views import get_def_for_tooltip
 from metadata.views import (get_cart_count,
                             get_result_count_helper)
 from results.views import (get_search_results_chunk,
@@ -46,7 +53,7 @@ from search.views import (url_to_search_params,
                           parse_order_slug,
                           create_order_by_sql)
 from tools.app_utils import (cols_to_slug_list,
-                             csv_response,
+                             csv_streaming_response,
                              download_filename,
                              enter_api_call,
                              exit_api_call,
@@ -63,10 +70,12 @@ from tools.app_utils import (cols_to_slug_list,
                              HTTP404_NO_REQUEST,
                              HTTP404_SEARCH_PARAMS_INVALID,
                              HTTP404_UNKNOWN_DOWNLOAD_FILE_FORMAT,
+                             HTTP404_UNKNOWN_DOWNLOAD_JOB,
                              HTTP404_UNKNOWN_SLUG,
                              HTTP500_DATABASE_ERROR,
                              HTTP500_INTERNAL_ERROR,
                              HTTP500_SEARCH_CACHE_FAILED)
+from tools.db_utils import get_import_version
 from tools.file_utils import get_pds_products
 
 log = logging.getLogger(__name__)
@@ -257,7 +266,7 @@ def api_get_cart_csv(request):
         raise ret
 
     csv_filename = download_filename(None, 'cart')
-    ret = csv_response(csv_filename, page, column_labels)
+    ret = csv_streaming_response(csv_filename, page, column_labels)
 
     exit_api_call(api_code, ret)
     return ret
@@ -521,6 +530,16 @@ def api_create_download(request, opus_id=None, fmt=None):
                urlonly=1 (optional) means to not include the actual data products
                hierarchical=1 (optional) means files in archive are stored with
                hierarchy tree
+
+    For a single OPUS ID the archive is returned directly.
+
+    For the cart the archive is built by a download job and the returned JSON
+    is one of:
+        {'filename': url} when the archive is ready
+        {'error': message} if it couldn't be created
+        {'jobid': jobid, 'status': 'queued'|'running'} if it isn't ready after
+            DOWNLOAD_JOB_WAIT_TIME seconds; poll
+            __cart/download/status.json?jobid=<jobid> for the result
     """
     api_code = enter_api_call('api_create_download', request)
 
@@ -587,28 +606,13 @@ def api_create_download(request, opus_id=None, fmt=None):
             exit_api_call(api_code, ret)
             return ret
 
-    # Fetch the full file info of the files we'll be zipping up
-    # We want the raw objects so we can get the file metadata as well as the
-    # abspath
-    files = get_pds_products(opus_ids, loc_type='raw',
-                             product_types=product_types)
-
-    file_type = 'url' if url_file_only else 'data'
-
     if not fmt:
         fmt = request.GET.get('fmt', 'zip')
     # If the file format is not supported, raise HTTP404 error.
     if fmt not in settings.DOWNLOAD_FORMATS:
         raise Http404(HTTP404_UNKNOWN_DOWNLOAD_FILE_FORMAT(fmt, request))
 
-    archive_root = download_filename(opus_id, file_type)
-    archive_base_file_name = archive_root + f'.{fmt}'
-    archive_file_name = settings.TAR_FILE_PATH + archive_base_file_name
-    manifest_file_name = settings.MANIFEST_FILE_PATH+f'manifest_{archive_root}.csv'
-    csv_file_name = settings.TAR_FILE_PATH + f'csv_{archive_root}.txt'
-    url_file_name = settings.TAR_FILE_PATH + f'url_{archive_root}.txt'
-
-    _create_csv_file(request, csv_file_name, opus_id, api_code=api_code)
+    hierarchical_struct = int(request.GET.get('hierarchical', 0))
 
     # Don't create download if the resultant archive file would be too big
     if not url_file_only:
@@ -641,126 +645,117 @@ def api_create_download(request, opus_id=None, fmt=None):
             return ret
         request.session['cum_download_size'] = int(cum_download_size)
 
-    mime_type = settings.DOWNLOAD_FORMATS[fmt][0]
-    write_mode = settings.DOWNLOAD_FORMATS[fmt][1]
-    # Add each file to the new archive file and create a manifest too
-    if return_directly:
-        response = HttpResponse(content_type=mime_type)
-        if fmt == 'zip':
-            archive_file = zipfile.ZipFile(response, mode=write_mode)
+    # Archives are cached by their contents. If the same archive has already
+    # been built (or is being built), just use that one.
+    file_type = 'url' if url_file_only else 'data'
+    job_id = download_job_id({
+        'opus_ids': sorted(opus_ids),
+        'types': sorted(product_types),
+        'fmt': fmt,
+        'urlonly': bool(url_file_only),
+        'hierarchical': hierarchical_struct,
+        'cols': request.GET.get('cols', settings.DEFAULT_COLUMNS),
+        'order': request.GET.get('order', settings.DEFAULT_SORT_ORDER),
+        'import_version': get_import_version()
+    })
+    job = find_download_job(job_id)
+    if job is not None:
+        if return_directly:
+            job = wait_for_download_job(job_id,
+                                        settings.DOWNLOAD_JOB_MAX_WAIT_TIME)
+            ret = _download_job_file_response(job, request)
+            exit_api_call(api_code, '<Encoded zip file>')
         else:
-            archive_file = tarfile.open(mode=write_mode, fileobj=response)
+            job = wait_for_download_job(job_id,
+                                        settings.DOWNLOAD_JOB_WAIT_TIME)
+            ret = _download_job_response(job)
+            exit_api_call(api_code, ret)
+        return ret
+
+    archive_root = f'pdsrms-{file_type}-{job_id}'
+    if opus_id:
+        archive_root += f'_{opus_id}'
+    archive_base_file_name = archive_root + f'.{fmt}'
+    archive_file_name = settings.TAR_FILE_PATH + archive_base_file_name
+    manifest_file_name = settings.MANIFEST_FILE_PATH+f'manifest_{archive_root}.csv'
+    # The CSV file is temporary and two requests might be building the same
+    # archive, so give it a unique name
+    csv_root = download_filename(opus_id, file_type)
+    csv_file_name = settings.TAR_FILE_PATH + f'csv_{csv_root}.txt'
+
+    # Fetch the full file info of the files we'll be zipping up
+    # We want the raw objects so we can get the file metadata as well as the
+    # abspath
+    files = get_pds_products(opus_ids, loc_type='raw',
+                             product_types=product_types)
+
+    _create_csv_file(request, csv_file_name, opus_id, api_code=api_code)
+
+    manifest, urls, members = _get_download_members(files,
+                                                    hierarchical_struct)
+
+    spec = {'fmt': fmt,
+            'members': members,
+            'url_file_only': bool(url_file_only),
+            'manifest': manifest,
+            'manifest_file_name': manifest_file_name,
+            'csv_file_name': csv_file_name,
+            'urls': urls,
+            'archive_file_name': archive_file_name,
+            'archive_url': (settings.TAR_FILE_URL_PATH
+                            + archive_base_file_name)}
+
+    job = submit_download_job(job_id, spec, start=not return_directly)
+    if job['spec']['csv_file_name'] != csv_file_name: # pragma: no cover
+        # Someone else queued the same download while we were working
+        os.remove(csv_file_name)
+    if return_directly:
+        # A single observation is small, so build it right now and return it
+        run_download_job(job_id)
+        job = wait_for_download_job(job_id,
+                                    settings.DOWNLOAD_JOB_MAX_WAIT_TIME)
+        ret = _download_job_file_response(job, request)
+        exit_api_call(api_code, '<Encoded zip file>')
     else:
-        if fmt == 'zip':
-            archive_file = zipfile.ZipFile(archive_file_name, mode=write_mode)
-        else:
-            archive_file = tarfile.open(name=archive_file_name, mode=write_mode)
+        job = wait_for_download_job(job_id, settings.DOWNLOAD_JOB_WAIT_TIME)
+        ret = _download_job_response(job)
+        exit_api_call(api_code, ret)
+    return ret
 
-    manifest_fp = open(manifest_file_name, 'w')
-    manifest_fp.write('OPUS ID,Product Category,Product Type,'
-                      +'Product Type Abbrev,'
-                      +'Version,File Path,Checksum,Size\n')
-    url_fp = open(url_file_name, 'w')
 
-    errors = []
-    # Store the files' logical paths added to the zip file.
-    added = []
+@never_cache
+def api_download_status(request):
+    """Return the status of a cart download job.
 
-    # Loop through files first to create a dictionary keyed by basenames. Each
-    # key has a list of paths pointing to itself. If there are multiple paths
-    # for a key, then it means these paths are not duplicated and need to be
-    # stored with hierarchy tree in the zip file.
-    hierarchical_struct = int(request.GET.get('hierarchical', 0))
-    files_info = {}
-    for f_opus_id in files:
-        if 'Current' not in files[f_opus_id]:
-            continue
-        files_version = files[f_opus_id]['Current']
-        for product_type in files_version:
-            for file_data in files_version[product_type]:
-                path = file_data['path']
-                pretty_name = path.split('/')[-1]
-                logical_path = path[path.index('/holdings')+9:]
-                if pretty_name not in files_info:
-                    files_info[pretty_name] = [logical_path]
-                elif logical_path not in files_info[pretty_name]:
-                    files_info[pretty_name].append(logical_path)
+    This is a PRIVATE API.
 
-    for f_opus_id in files:
-        if 'Current' not in files[f_opus_id]:
-            continue
-        files_version = files[f_opus_id]['Current']
-        for product_type in files_version:
-            for file_data in files_version[product_type]:
-                path = file_data['path']
-                url = file_data['url']
-                category = file_data['category']
-                product_type = file_data['full_name']
-                product_abbrev = file_data['short_name']
-                version_name = file_data['version_name']
-                checksum = file_data['checksum']
-                size = file_data['size']
-                pretty_name = path.split('/')[-1]
-                logical_path = path[path.index('/holdings')+9:]
-                mdigest = (f'{f_opus_id},{category},{product_type},'
-                          +f'{product_abbrev},{version_name},{logical_path},'
-                          +f'{checksum},{size}')
-                manifest_fp.write(mdigest+'\n')
+    Format: __cart/download/status.json
+    Arguments: jobid=<JOBID> as returned by __cart/download.json
 
-                if logical_path not in added:
-                    url_fp.write(url+'\n')
-                    filename = os.path.basename(path)
-                    # If hierarchical_struct is 1 or there are multiple paths
-                    # for the same file basename, we store files with hierarchy
-                    # tree in the zip file.
-                    if hierarchical_struct or len(files_info[pretty_name]) > 1:
-                        filename = logical_path
-                    if not url_file_only:
-                        try:
-                            if fmt == 'zip':
-                                archive_file.write(path, arcname=filename)
-                            else:
-                                archive_file.add(path, arcname=filename)
-                        except Exception as e:
-                            log.error('api_create_download threw exception '+
-                                      'for opus_id %s, product_type %s, '+
-                                      'file %s, pretty_name %s: %s',
-                                      f_opus_id, product_type, path,
-                                      pretty_name, str(e))
-                            errors.append('Error adding: ' + pretty_name)
-                    added.append(logical_path)
-
-    # Write errors to manifest file
-    if errors:
-        manifest_fp.write('Errors:\n')
-        for e in errors:
-            manifest_fp.write(e+'\n')
-
-    # Add manifests and checksum files to tarball and close everything up
-    manifest_fp.close()
-    url_fp.close()
-    if fmt == 'zip':
-        archive_file.write(manifest_file_name, arcname='manifest.csv')
-        archive_file.write(csv_file_name, arcname='data.csv')
-        archive_file.write(url_file_name, arcname='urls.txt')
-    else:
-        archive_file.add(manifest_file_name, arcname='manifest.csv')
-        archive_file.add(csv_file_name, arcname='data.csv')
-        archive_file.add(url_file_name, arcname='urls.txt')
-    archive_file.close()
+    Returned JSON is the same as __cart/download.json:
+        {'filename': url} when the archive is ready
+        {'error': message} if it couldn't be created
+        {'jobid': jobid, 'status': 'queued'|'running'} if it's not done yet
+    """
+    api_code = enter_api_call('api_download_status', request)
 
-    os.remove(csv_file_name)
-    os.remove(url_file_name)
+    if not request or request.GET is None:
+        ret = Http404(HTTP404_NO_REQUEST('/__cart/download/status.json'))
+        exit_api_call(api_code, ret)
+        raise ret
 
-    if return_directly:
-        response['Content-Disposition'] = ('attachment; filename='
-                                           + archive_base_file_name)
-        ret = response
-    else:
-        archive_url = settings.TAR_FILE_URL_PATH + archive_base_file_name
-        ret = json_response({'filename': archive_url})
+    job_id = request.GET.get('jobid', None)
+    job = None
+    if is_valid_download_job_id(job_id):
+        job = find_download_job(job_id)
+    if job is None or throw_random_http404_error():
+        log.error('api_download_status: Unknown download job %s', job_id)
+        ret = Http404(HTTP404_UNKNOWN_DOWNLOAD_JOB(job_id, request))
+        exit_api_call(api_code, ret)
+        raise ret
 
-    exit_api_call(api_code, '<Encoded zip file>')
+    ret = _download_job_response(job)
+    exit_api_call(api_code, ret)
     return ret
 
 
@@ -850,14 +845,7 @@ def _get_download_info(product_types, session_id):
             product_cats.append(key)
             cur_product_list = []
             product_cat_list.append((pretty_name, cur_product_list))
-        try:
-            entry = Definitions.objects.get(context__name='OPUS_PRODUCT_TYPE',
-                                            term=short_name)
-            tooltip = entry.definition
-        except Definitions.DoesNotExist:
-            log.error('No tooltip definition for OPUS_PRODUCT_TYPE "%s"',
-                      short_name)
-            tooltip = None
+        tooltip = get_def_for_tooltip(short_name, 'OPUS_PRODUCT_TYPE')
         product_dict_entry = {
             'slug_name': short_name,
             'tooltip': tooltip,
@@ -1357,7 +1345,9 @@ def _edit_cart_addall(request, session_id, recycle_bin, api_code):
         q = connection.ops.quote_name
 
         # We ignore recycle_bin here because it doesn't mean anything
-        count, user_query_table, err = get_result_count_helper(request, api_code)
+        count, user_query_table, err = get_result_count_helper(request,
+                                                               api_code,
+                                                               need_table=True)
         if err is not None:
             return err
 
@@ -1431,9 +1421,127 @@ def _edit_cart_addall(request, session_id, recycle_bin, api_code):
 ################################################################################
 
 
+def _get_download_members(files, hierarchical_struct):
+    """Return the manifest, URL list, and archive members for a download.
+
+    files is the result of get_pds_products. Returns the contents of
+    manifest.csv and urls.txt as strings and a list of
+    [path, arcname, opus_id, product_type, pretty_name] for each distinct
+    file that should be put into the archive.
+    """
+    # Loop through files first to create a dictionary keyed by basenames. Each
+    # key has a set of paths pointing to itself. If there are multiple paths
+    # for a key, then it means these paths are not duplicated and need to be
+    # stored with hierarchy tree in the zip file.
+    files_info = {}
+    for f_opus_id in files:
+        if 'Current' not in files[f_opus_id]:
+            continue
+        files_version = files[f_opus_id]['Current']
+        for product_type in files_version:
+            for file_data in files_version[product_type]:
+                path = file_data['path']
+                pretty_name = path.split('/')[-1]
+                logical_path = path[path.index('/holdings')+9:]
+                files_info.setdefault(pretty_name, set()).add(logical_path)
+
+    manifest = ['OPUS ID,Product Category,Product Type,'
+                +'Product Type Abbrev,'
+                +'Version,File Path,Checksum,Size\n']
+    urls = []
+    members = []
+    # Store the files' logical paths added to the archive.
+    added = set()
+    for f_opus_id in files:
+        if 'Current' not in files[f_opus_id]:
+            continue
+        files_version = files[f_opus_id]['Current']
+        for product_type in files_version:
+            for file_data in files_version[product_type]:
+                path = file_data['path']
+                url = file_data['url']
+                category = file_data['category']
+                product_type = file_data['full_name']
+                product_abbrev = file_data['short_name']
+                version_name = file_data['version_name']
+                checksum = file_data['checksum']
+                size = file_data['size']
+                pretty_name = path.split('/')[-1]
+                logical_path = path[path.index('/holdings')+9:]
+                mdigest = (f'{f_opus_id},{category},{product_type},'
+                          +f'{product_abbrev},{version_name},{logical_path},'
+                          +f'{checksum},{size}')
+                manifest.append(mdigest+'\n')
+
+                if logical_path not in added:
+                    urls.append(url+'\n')
+                    filename = os.path.basename(path)
+                    # If hierarchical_struct is 1 or there are multiple paths
+                    # for the same file basename, we store files with hierarchy
+                    # tree in the zip file.
+                    if hierarchical_struct or len(files_info[pretty_name]) > 1:
+                        filename = logical_path
+                    members.append([path, filename, f_opus_id, product_type,
+                                    pretty_name])
+                    added.add(logical_path)
+
+    return ''.join(manifest), ''.join(urls), members
+
+def _download_job_file_response(job, request):
+    """Return the archive built by a download job as the response.
+
+    If DOWNLOAD_X_SENDFILE_HEADER is set, the web server is asked to send the
+    file itself. Otherwise a FileResponse lets the WSGI server use its
+    file_wrapper (sendfile) if it has one. Either way the archive is never
+    read into memory.
+    """
+    if job is None or job['status'] != JOB_DONE: # pragma: no cover
+        log.error('api_create_download: Download job %s failed',
+                  job['job_id'] if job else None)
+        return HttpResponseServerError(HTTP500_INTERNAL_ERROR(request))
+    archive_file_name = job['spec']['archive_file_name']
+    fmt = job['spec']['fmt']
+    mime_type = settings.DOWNLOAD_FORMATS[fmt][0]
+    if settings.DOWNLOAD_X_SENDFILE_HEADER:
+        response = HttpResponse(content_type=mime_type)
+        response[settings.DOWNLOAD_X_SENDFILE_HEADER] = archive_file_name
+    else:
+        try:
+            archive_fp = open(archive_file_name, 'rb')
+        except OSError as e: # pragma: no cover
+            # Evicted between finding the job and opening it
+            log.error('api_create_download: Unable to open %s: %s',
+                      archive_file_name, str(e))
+            return HttpResponseServerError(HTTP500_INTERNAL_ERROR(request))
+        response = FileResponse(archive_fp, content_type=mime_type)
+    response['Content-Disposition'] = ('attachment; filename='
+                                       + os.path.basename(archive_file_name))
+    return response
+
+def _download_job_response(job):
+    "Return the __cart/download.json response for a download job."
+    if job is None: # pragma: no cover
+        return json_response({'error': 'Failed to create the download '
+                                       +'archive. Please try again.'})
+    if job['status'] == JOB_DONE:
+        return json_response({'filename': job['spec']['archive_url']})
+    if job['status'] == JOB_FAILED: # pragma: no cover
+        return json_response({'error': 'Failed to create the download '
+                                       +'archive. Please try again.'})
+    return json_response({'jobid': job['job_id'],
+                          'status': job['status']})
+
+
 def _csv_helper(request, opus_id, api_code=None):
-    "Create the data for a CSV file containing the cart data."
+    """Create the data for a CSV file containing the cart data.
+
+    The returned rows are an iterator that reads from the database as it
+    goes, on a connection of its own that is closed once it is used up.
+    """
     slugs = request.GET.get('cols', settings.DEFAULT_COLUMNS)
+    slug_list = cols_to_slug_list(slugs)
+    column_labels = labels_for_slugs(slug_list)
+
     (page_no, start_obs, limit,
      page, order, aux, error) = get_search_results_chunk(
                                                      request,
@@ -1441,11 +1549,10 @@ def _csv_helper(request, opus_id, api_code=None):
                                                      ignore_recycle_bin=True,
                                                      limit='all',
                                                      opus_id=opus_id,
+                                                     return_iterator=True,
                                                      api_code=api_code)
 
-    slug_list = cols_to_slug_list(slugs)
-
-    return labels_for_slugs(slug_list), page, error
+    return column_labels, page, error
 
 
 def _create_csv_file(request, csv_file_name, opus_id, api_code=None):
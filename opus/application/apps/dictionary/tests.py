@@ -1,2 +1,72 @@
+# dictionary/tests.py
+
 # from django.test import TestCase  removed because it deletes test table data after every test
-# from unittest import TestCase
+import logging
+import sys
+from unittest import TestCase
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from dictionary.views import (get_def_for_tooltip,
+                              get_more_info_url)
+
+class dictionaryTests(TestCase):
+
+    def setUp(self):
+        self.maxDiff = None
+        sys.tracebacklimit = 0 # default: 1000
+        logging.disable(logging.ERROR)
+
+    def tearDown(self):
+        sys.tracebacklimit = 1000 # default: 1000
+        logging.disable(logging.NOTSET)
+
+
+            ##################################################
+            ######### get_def_for_tooltip UNIT TESTS #########
+            ##################################################
+
+    def test__get_def_for_tooltip_product_type(self):
+        "[tests.py] get_def_for_tooltip: OPUS_PRODUCT_TYPE coiss_raw"
+        definition = get_def_for_tooltip('coiss_raw', 'OPUS_PRODUCT_TYPE')
+        self.assertTrue(definition.startswith('Raw image files (*.IMG) for Cassini ISS.'))
+
+    def test__get_def_for_tooltip_case(self):
+        "[tests.py] get_def_for_tooltip: case insensitive like the database"
+        definition = get_def_for_tooltip('COISS_RAW', 'opus_product_type')
+        self.assertEqual(definition,
+                         get_def_for_tooltip('coiss_raw', 'OPUS_PRODUCT_TYPE'))
+
+    def test__get_def_for_tooltip_bad_term(self):
+        "[tests.py] get_def_for_tooltip: unknown term"
+        definition = get_def_for_tooltip('xyzzy', 'OPUS_PRODUCT_TYPE')
+        self.assertIsNone(definition)
+
+    def test__get_def_for_tooltip_none(self):
+        "[tests.py] get_def_for_tooltip: no term"
+        definition = get_def_for_tooltip(None, None)
+        self.assertIsNone(definition)
+
+    def test__get_def_for_tooltip_no_queries(self):
+        "[tests.py] get_def_for_tooltip: no queries once loaded"
+        get_def_for_tooltip('coiss_raw', 'OPUS_PRODUCT_TYPE')
+        with CaptureQueriesContext(connection) as queries:
+            for term in ('coiss_raw', 'coiss_calib', 'xyzzy'):
+                get_def_for_tooltip(term, 'OPUS_PRODUCT_TYPE')
+        self.assertEqual(len(queries), 0)
+
+
+            ################################################
+            ######### get_more_info_url UNIT TESTS #########
+            ################################################
+
+    def test__get_more_info_url(self):
+        "[tests.py] get_more_info_url: OPUS_PRODUCT_TYPE coiss_raw"
+        url = get_more_info_url('coiss_raw', 'OPUS_PRODUCT_TYPE')
+        self.assertEqual(url, 'http://pds-rings.seti.org/__dictionary/index.php?term=coiss_raw&context=OPUS_PRODUCT_TYPE')
+
+    def test__get_more_info_url_bad_term(self):
+        "[tests.py] get_more_info_url: unknown term"
+        url = get_more_info_url('xyzzy', 'OPUS_PRODUCT_TYPE')
+        self.assertIsNone(url)
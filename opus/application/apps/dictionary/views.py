@@ -2,20 +2,48 @@ from dictionary.models import Definitions
 from django.shortcuts import render
 from django.http import JsonResponse
 
+from tools.db_utils import get_import_version
+
 import string
 
 import logging
 log = logging.getLogger(__name__)
 
+_DEFINITIONS = None
+
+def _definition_key(term, context):
+    # The definitions table uses a case-insensitive collation that ignores
+    # trailing spaces, so the lookups here do too
+    return ((context or '').lower().rstrip(' '), (term or '').lower().rstrip(' '))
+
+def _get_definitions():
+    """Return a dict of (context, term) -> definition for the whole dictionary.
+
+    The dictionary only changes when the import pipeline reloads it
+    (import/do_dictionary.py), which bumps the import version, so it is read
+    with a single query and kept until the import version changes. The keys
+    come from _definition_key.
+    """
+    global _DEFINITIONS
+    version = get_import_version()
+    entry = _DEFINITIONS
+    if entry is None or entry[0] != version:
+        definitions = {}
+        for context, term, definition in (Definitions.objects
+                                          .values_list('context_id', 'term',
+                                                       'definition')):
+            definitions[_definition_key(term, context)] = definition
+        entry = (version, definitions)
+        _DEFINITIONS = entry
+    return entry[1]
+
 def get_def_for_tooltip(term, context):
     "Get a dictionary definition for (i) tooltips in the OPUS UI"
-    try:
-        entry = Definitions.objects.get(context__name=context, term=term)
-        return entry.definition
-    except Definitions.DoesNotExist:
+    definition = _get_definitions().get(_definition_key(term, context))
+    if definition is None:
         log.error('No tooltip definition for context "%s" term "%s"',
                   context, term)
-        return None
+    return definition
 
 def get_more_info_url(term, context):
     "Return the url of the page for this definition."
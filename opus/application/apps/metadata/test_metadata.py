@@ -13,7 +13,8 @@ from metadata.views import (api_get_fields,
                             api_get_result_count_internal,
                             api_get_range_endpoints,
                             api_get_range_endpoints_internal,
-                            api_get_result_count)
+                            api_get_result_count,
+                            get_result_count_helper)
 
 import settings
 
@@ -71,6 +72,17 @@ class MetadataTests(TestCase):
             r'Internal error \(No request was provided\) for /api/meta/result_count.json'):
             api_get_result_count_internal(request)
 
+    def test__get_result_count_helper_no_selections(self):
+        "[test_metadata.py] get_result_count_helper: no selections matches query table"
+        request = self.factory.get('/api/meta/result_count.json')
+        count, _, err = get_result_count_helper(request, None)
+        self.assertIsNone(err)
+        table_count, table, err = get_result_count_helper(request, None,
+                                                          need_table=True)
+        self.assertIsNone(err)
+        self.assertIsNotNone(table)
+        self.assertEqual(count, table_count)
+
 
             ##################################################
             ######### api_get_mult_counts UNIT TESTS #########
@@ -6,6 +6,7 @@ from metadata.views import (
     api_get_result_count_internal,
     api_get_mult_counts,
     api_get_mult_counts_internal,
+    api_get_mult_counts_batch,
     api_get_range_endpoints,
     api_get_range_endpoints_internal,
     api_get_fields,
@@ -17,6 +18,7 @@ urlpatterns = [
 
     url(r'^api/meta/mults/(?P<slug>[-\w]+).(?P<fmt>json|html|csv)$', api_get_mult_counts),
     url(r'^__api/meta/mults/(?P<slug>[-\w]+).json$', api_get_mult_counts_internal),
+    url(r'^__api/meta/mults.json$', api_get_mult_counts_batch),
 
     url(r'^api/meta/range/endpoints/(?P<slug>[-\w]+).(?P<fmt>json|html|csv)$', api_get_range_endpoints),
     url(r'^__api/meta/range/endpoints/(?P<slug>[-\w]+).json$', api_get_range_endpoints_internal),
@@ -27,7 +27,6 @@ import settings
 from django.apps import apps
 from django.db import connection, DatabaseError
 from django.core.cache import cache
-from django.core.exceptions import ObjectDoesNotExist
 from django.db.models import Max, Min, Count
 from django.http import Http404, HttpResponseServerError
 from django.shortcuts import render_to_response
@@ -59,6 +58,7 @@ from tools.app_utils import (csv_response,
                              HTTP500_DATABASE_ERROR,
                              HTTP500_INTERNAL_ERROR,
                              HTTP500_SEARCH_CACHE_FAILED)
+from tools.db_utils import get_mult_label_map, get_precomputed_metadata
 
 from opus_support import (format_unit_value,
                           get_default_unit,
@@ -233,34 +233,12 @@ def api_get_mult_counts(request, slug, fmt, internal=False):
         mults = cached_val
     else:
         mult_name = get_mult_name(param_qualified_name)
-        try:
-            mult_model = apps.get_model('search',
-                                        mult_name.title().replace('_',''))
-            if throw_random_http500_error(): # pragma: no cover
-                raise LookupError
-        except LookupError: # pragma: no cover
-            log.error('api_get_mult_counts: Could not get_model for %s',
-                      mult_name.title().replace('_',''))
-            ret = HttpResponseServerError(HTTP500_INTERNAL_ERROR(request))
-            exit_api_call(api_code, ret)
-            return ret
-
-        try:
-            table_model = apps.get_model('search',
-                                         table_name.title().replace('_',''))
-            if throw_random_http500_error(): # pragma: no cover
-                raise LookupError
-        except LookupError: # pragma: no cover
-            log.error('api_get_mult_counts: Could not get_model for %s',
-                      table_name.title().replace('_',''))
-            ret = HttpResponseServerError(HTTP500_INTERNAL_ERROR(request))
-            exit_api_call(api_code, ret)
-            return ret
-
-        results = (table_model.objects.values(mult_name)
-                   .annotate(Count(mult_name)))
-
-        user_table = get_user_query_table(selections, extras, api_code=api_code)
+        # Without selections we count the whole table, which the import
+        # pipeline has usually done for us already
+        user_table = None
+        if selections:
+            user_table = get_user_query_table(selections, extras,
+                                              api_code=api_code)
 
         if ((selections and not user_table) or
             throw_random_http500_error()): # pragma: no cover
@@ -271,41 +249,24 @@ def api_get_mult_counts(request, slug, fmt, internal=False):
             exit_api_call(api_code, ret)
             return ret
 
-        if selections:
-            # selections are constrained so join in the user_table
-            if table_name == 'obs_general':
-                where = [connection.ops.quote_name(table_name) + '.id='
-                         + connection.ops.quote_name(user_table) + '.id']
-            else:
-                where = [connection.ops.quote_name(table_name)
-                         + '.obs_general_id='
-                         + connection.ops.quote_name(user_table) + '.id']
-            results = results.extra(where=where, tables=[user_table])
-
-        mult_result_list = []
-        for row in results:
-            mult_id = row[mult_name]
-            try:
-                mult = mult_model.objects.get(id=mult_id)
-                mult_disp_order = mult.disp_order
-                mult_label = mult.label
-                if throw_random_http500_error(): # pragma: no cover
-                    raise ObjectDoesNotExist
-            except ObjectDoesNotExist: # pragma: no cover
-                log.error('api_get_mult_counts: Could not find mult entry for '
-                          +'mult_model %s id %s', str(mult_model), str(mult_id))
-                ret = HttpResponseServerError(HTTP500_INTERNAL_ERROR(request))
-                exit_api_call(api_code, ret)
-                return ret
-
-            mult_result_list.append((mult_disp_order,
-                                     (mult_label,
-                                      row[mult_name + '__count'])))
-        mult_result_list.sort()
+        # selections are constrained so join in the user_table
+        join_table = user_table if selections else None
+        if settings.MULT_COUNTS_USE_JOIN and join_table:
+            mult_result_list = _get_mult_counts_join(table_name, mult_name,
+                                                     join_table)
+        else:
+            mult_result_lists = _get_mult_counts_label_map(table_name,
+                                                           [mult_name],
+                                                           join_table)
+            mult_result_list = (None if mult_result_lists is None
+                                else mult_result_lists[mult_name])
+        if (mult_result_list is None or
+            throw_random_http500_error()): # pragma: no cover
+            ret = HttpResponseServerError(HTTP500_INTERNAL_ERROR(request))
+            exit_api_call(api_code, ret)
+            return ret
 
-        mults = OrderedDict()  # info to return
-        for _, mult_info in mult_result_list:
-            mults[mult_info[0]] = mult_info[1]
+        mults = _mult_result_list_to_mults(mult_result_list)
 
         cache.set(cache_key, mults)
 
@@ -340,6 +301,270 @@ def api_get_mult_counts_internal(request, slug):
     return api_get_mult_counts(request, slug, 'json', internal=True)
 
 
+@never_cache
+def api_get_mult_counts_batch(request):
+    r"""Return the mults for several slugs along with result counts.
+
+    This is a PRIVATE API.
+
+    The results are identical to calling __api/meta/mults/<slug>.json for
+    each slug, but the URL is only parsed once, each distinct search is only
+    resolved to a cache table once, and mults that live in the same obs_
+    table and share a search are counted with a single scan of that table.
+    Mults that are already in the cache are not recomputed.
+
+    Format: __api/meta/mults.json
+    Arguments: Normal search arguments
+               slugs=<slug1>,<slug2>,...
+               reqno=<N>
+
+    Can return JSON only.
+
+    Returned JSON:
+        {'mults': {slug1: mults1, slug2: mults2, ...}, 'reqno': reqno}
+
+        Each mults is a list of entries pairing mult name and result count.
+    """
+    api_code = enter_api_call('api_get_mult_counts_batch', request)
+
+    if not request or request.GET is None:
+        ret = Http404(HTTP404_NO_REQUEST('/__api/meta/mults.json'))
+        exit_api_call(api_code, ret)
+        raise ret
+
+    slugs = [x for x in request.GET.get('slugs', '').split(',') if x]
+    if not slugs or throw_random_http404_error():
+        log.error('api_get_mult_counts_batch: No slugs given, URL %s',
+                  request.GET)
+        ret = Http404(HTTP404_UNKNOWN_SLUG(None, request))
+        exit_api_call(api_code, ret)
+        raise ret
+
+    reqno = get_reqno(request)
+    if reqno is None or throw_random_http404_error():
+        log.error('api_get_mult_counts_batch: Missing or badly formatted reqno')
+        ret = Http404(HTTP404_BAD_OR_MISSING_REQNO(request))
+        exit_api_call(api_code, ret)
+        raise ret
+
+    (selections, extras) = url_to_search_params(request.GET)
+    if selections is None or throw_random_http404_error():
+        log.error('api_get_mult_counts_batch: Failed to get selections for '
+                  +'slugs %s, URL %s', str(slugs), request.GET)
+        ret = Http404(HTTP404_SEARCH_PARAMS_INVALID(request))
+        exit_api_call(api_code, ret)
+        raise ret
+
+    all_mults = OrderedDict()
+    # (cache_num, table_name) -> list of (slug, mult_name, cache_key)
+    to_compute = OrderedDict()
+    # cache_num -> selections for that cache_num
+    cache_num_selections = {}
+    # param_qualified_name removed from selections (or None) -> cache_num
+    cache_nums = {}
+
+    for slug in slugs:
+        param_info = get_param_info_by_slug(slug, 'col')
+        if not param_info or throw_random_http404_error():
+            log.error('api_get_mult_counts_batch: Could not find param_info '
+                      +'entry for slug %s *** Selections %s *** Extras %s',
+                      str(slug), str(selections), str(extras))
+            ret = Http404(HTTP404_UNKNOWN_SLUG(slug, request))
+            exit_api_call(api_code, ret)
+            raise ret
+
+        table_name = param_info.category_name
+        param_qualified_name = param_info.param_qualified_name()
+
+        # We want mults for a param as they would be without itself. Every
+        # slug that isn't in the selections shares the same search.
+        removed_name = (param_qualified_name
+                        if param_qualified_name in selections else None)
+        if removed_name not in cache_nums:
+            slug_selections = selections
+            if removed_name is not None:
+                slug_selections = selections.copy()
+                del slug_selections[removed_name]
+            cache_num, _ = set_user_search_number(slug_selections, extras)
+            if (cache_num is None or
+                throw_random_http500_error()): # pragma: no cover
+                log.error('api_get_mult_counts_batch: Failed to create '
+                          +'user_selections entry for *** Selections %s '
+                          +'*** Extras %s', str(slug_selections), str(extras))
+                ret = HttpResponseServerError(HTTP500_DATABASE_ERROR(request))
+                exit_api_call(api_code, ret)
+                return ret
+            cache_nums[removed_name] = cache_num
+            cache_num_selections[cache_num] = slug_selections
+        cache_num = cache_nums[removed_name]
+
+        # Same cache key as api_get_mult_counts so the two share results
+        cache_key = (settings.CACHE_SERVER_PREFIX + settings.CACHE_KEY_PREFIX
+                     + ':mults_' + param_qualified_name
+                     + ':' + str(cache_num))
+        all_mults[slug] = cache.get(cache_key)
+        if all_mults[slug] is None:
+            mult_name = get_mult_name(param_qualified_name)
+            to_compute.setdefault((cache_num, table_name), []).append(
+                                                (slug, mult_name, cache_key))
+
+    for (cache_num, table_name), entries in to_compute.items():
+        slug_selections = cache_num_selections[cache_num]
+        user_table = None
+        if slug_selections:
+            user_table = get_user_query_table(slug_selections, extras,
+                                              api_code=api_code)
+        if ((slug_selections and not user_table) or
+            throw_random_http500_error()): # pragma: no cover
+            log.error('api_get_mult_counts_batch: has selections but no '
+                      +'user_table found *** Selections %s *** Extras %s',
+                      str(slug_selections), str(extras))
+            ret = HttpResponseServerError(HTTP500_SEARCH_CACHE_FAILED(request))
+            exit_api_call(api_code, ret)
+            return ret
+
+        join_table = user_table if slug_selections else None
+        mult_names = list(OrderedDict.fromkeys(x[1] for x in entries))
+        mult_result_lists = _get_mult_counts_label_map(table_name, mult_names,
+                                                       join_table)
+        if (mult_result_lists is None or
+            throw_random_http500_error()): # pragma: no cover
+            ret = HttpResponseServerError(HTTP500_INTERNAL_ERROR(request))
+            exit_api_call(api_code, ret)
+            return ret
+
+        for slug, mult_name, cache_key in entries:
+            mults = _mult_result_list_to_mults(
+                                        list(mult_result_lists[mult_name]))
+            cache.set(cache_key, mults)
+            all_mults[slug] = mults
+
+    data = {'mults': all_mults,
+            'reqno': reqno}
+
+    ret = json_response(data)
+    exit_api_call(api_code, ret)
+    return ret
+
+
+def _mult_result_list_to_mults(mult_result_list):
+    "Sort a list of (disp_order, (label, count)) into an OrderedDict"
+    mult_result_list.sort()
+
+    mults = OrderedDict()  # info to return
+    for _, mult_info in mult_result_list:
+        mults[mult_info[0]] = mult_info[1]
+    return mults
+
+def _get_mult_counts_label_map(table_name, mult_names, user_table):
+    """Count the values of mult columns in table_name.
+
+    The counts for all the columns in mult_names are found with a single
+    GROUP BY over the table, joined with user_table if given. Without a
+    user_table the counts precomputed by the import pipeline are used if they
+    are all available. The labels and disp_orders are filled in from the
+    in-memory mult label maps so only the GROUP BY touches the database.
+
+    Returns a dict keyed by mult_name containing lists of
+    (disp_order, (label, count)), or None on error.
+    """
+    try:
+        table_model = apps.get_model('search',
+                                     table_name.title().replace('_',''))
+    except LookupError: # pragma: no cover
+        log.error('api_get_mult_counts: Could not get_model for %s',
+                  table_name.title().replace('_',''))
+        return None
+
+    label_maps = {}
+    for mult_name in mult_names:
+        label_map = get_mult_label_map(mult_name)
+        if label_map is None: # pragma: no cover
+            return None
+        label_maps[mult_name] = label_map
+
+    counts = None
+    if not user_table:
+        counts = {}
+        for mult_name in mult_names:
+            precomputed = get_precomputed_metadata('mult:'+mult_name)
+            if precomputed is None:
+                counts = None
+                break
+            counts[mult_name] = dict(precomputed)
+
+    if counts is None:
+        results = (table_model.objects.values(*mult_names)
+                   .annotate(mult_count=Count('pk')))
+
+        if user_table:
+            if table_name == 'obs_general':
+                where = [connection.ops.quote_name(table_name) + '.id='
+                         + connection.ops.quote_name(user_table) + '.id']
+            else:
+                where = [connection.ops.quote_name(table_name)
+                         + '.obs_general_id='
+                         + connection.ops.quote_name(user_table) + '.id']
+            results = results.extra(where=where, tables=[user_table])
+
+        # With more than one column, each row is a combination of values, so
+        # the counts for each column have to be summed over the other columns
+        counts = {mult_name: {} for mult_name in mult_names}
+        for row in results:
+            for mult_name in mult_names:
+                mult_id = row[mult_name]
+                counts[mult_name][mult_id] = (counts[mult_name].get(mult_id, 0)
+                                              + row['mult_count'])
+
+    ret = {}
+    for mult_name in mult_names:
+        mult_result_list = []
+        for mult_id, count in counts[mult_name].items():
+            mult = label_maps[mult_name].get(mult_id)
+            if mult is None: # pragma: no cover
+                log.error('api_get_mult_counts: Could not find mult entry for '
+                          +'mult table %s id %s', mult_name, str(mult_id))
+                return None
+            mult_label, mult_disp_order, _ = mult
+            mult_result_list.append((mult_disp_order, (mult_label, count)))
+        ret[mult_name] = mult_result_list
+    return ret
+
+def _get_mult_counts_join(table_name, mult_name, user_table):
+    """Count the mult values in table_name, joined with user_table if given.
+
+    The mult table is joined into the GROUP BY so labels, disp_orders, and
+    counts all come back from a single query.
+
+    Returns a list of (disp_order, (label, count)), or None on error.
+    """
+    q_table_name = connection.ops.quote_name(table_name)
+    q_mult_name = connection.ops.quote_name(mult_name)
+    sql = 'SELECT '+q_mult_name+'.label, '+q_mult_name+'.disp_order, '
+    sql += 'COUNT(*) FROM '+q_table_name
+    if user_table:
+        q_user_table = connection.ops.quote_name(user_table)
+        sql += ' INNER JOIN '+q_user_table+' ON '
+        if table_name == 'obs_general':
+            sql += q_table_name+'.id='+q_user_table+'.id'
+        else:
+            sql += q_table_name+'.obs_general_id='+q_user_table+'.id'
+    sql += ' INNER JOIN '+q_mult_name+' ON '
+    sql += q_table_name+'.'+q_mult_name+'='+q_mult_name+'.id'
+    sql += ' GROUP BY '+q_mult_name+'.id'
+
+    cursor = connection.cursor()
+    try:
+        cursor.execute(sql)
+        rows = cursor.fetchall()
+    except DatabaseError as e: # pragma: no cover
+        log.error('api_get_mult_counts: "%s" failed with %s', sql, str(e))
+        return None
+
+    return [(disp_order, (label, count))
+            for label, disp_order, count in rows]
+
+
 @never_cache
 def api_get_range_endpoints(request, slug, fmt, internal=False):
     r"""Compute and return range widget endpoints (min, max, nulls)
@@ -504,12 +729,16 @@ def api_get_range_endpoints(request, slug, fmt, internal=False):
                                                       tables=[user_table])
                                                .count())
         else:
-            # There are no selections, so hit the whole table
-            range_endpoints = results.all().aggregate(min=Min(param1),
-                                                      max=Max(param2))
-            where = param1 + ' IS NULL AND ' + param2 + ' IS NULL'
-            range_endpoints['nulls'] = (results.all().extra(where=[where])
-                                                     .count())
+            # There are no selections, so use the whole table. The import
+            # pipeline has usually done this for us already.
+            range_endpoints = get_precomputed_metadata(
+                                        'range:'+qualified_param_name_no_num)
+            if range_endpoints is None:
+                range_endpoints = results.all().aggregate(min=Min(param1),
+                                                          max=Max(param2))
+                where = param1 + ' IS NULL AND ' + param2 + ' IS NULL'
+                range_endpoints['nulls'] = (results.all().extra(where=[where])
+                                                         .count())
 
         # The returned range endpoints are converted to the destination
         # unit
@@ -636,7 +865,13 @@ def api_get_fields(request, fmt, slug=None):
 
 # This routine is public because it's called by _edit_cart_addall
 # in cart/views.py
-def get_result_count_helper(request, api_code):
+def get_result_count_helper(request, api_code, need_table=False):
+    """Return (count, user_query_table, error) for the search in request.
+
+    If need_table is False and there are no selections, the count precomputed
+    by the import pipeline is returned (if available) without creating the
+    user query table, and user_query_table is None.
+    """
     (selections, extras) = url_to_search_params(request.GET)
     if selections is None or throw_random_http404_error():
         log.error('get_result_count_helper: Could not find selections for '
@@ -645,6 +880,11 @@ def get_result_count_helper(request, api_code):
         exit_api_call(api_code, ret)
         raise ret
 
+    if not selections and not need_table:
+        count = get_precomputed_metadata('result_count')
+        if count is not None:
+            return count, None, None
+
     table = get_user_query_table(selections, extras, api_code=api_code)
 
     if not table or throw_random_http500_error(): # pragma: no cover
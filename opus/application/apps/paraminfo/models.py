@@ -3,7 +3,7 @@ from dictionary.views import get_def_for_tooltip
 
 import json
 
-from search.models import TableNames
+from paraminfo.registry import lookup_table_label
 
 import settings
 
@@ -40,6 +40,9 @@ class ParamInfo(models.Model):
     sub_heading = models.CharField(max_length=150, blank=True, null=True)
     timestamp = models.DateTimeField()
 
+    # (form_type, parsed form_type) filled in by parsed_form_type()
+    _parsed_form_type = None
+
     class Meta:
         db_table = ('param_info')
         ordering = ('category_name', 'sub_heading', 'disp_order')
@@ -50,6 +53,18 @@ class ParamInfo(models.Model):
     def param_qualified_name(self):
         return self.category_name + '.' + self.name
 
+    def parsed_form_type(self):
+        """Return (form_type, form_type_format, form_type_unit_id).
+
+        The parsed value is remembered along with the string it came from, so
+        it stays correct even if form_type is changed on this instance.
+        """
+        cached = self._parsed_form_type
+        if cached is None or cached[0] != self.form_type:
+            cached = (self.form_type, parse_form_type(self.form_type))
+            self._parsed_form_type = cached
+        return cached[1]
+
     def get_tooltip(self):
         definition = get_def_for_tooltip(self.dict_name, self.dict_context)
         return definition
@@ -63,8 +78,7 @@ class ParamInfo(models.Model):
         return definition
 
     def get_link_tooltip(self):
-        table_label = (TableNames.objects
-                      .get(table_name=self.category_name).label)
+        table_label = lookup_table_label(self.category_name)
         return (f'This field is a link to one available under {table_label}. '+
                 'It is provided here for your convenience.')
 
@@ -73,8 +87,7 @@ class ParamInfo(models.Model):
         if self.label is None: # pragma: no cover
             return None
 
-        pretty_name = (TableNames.objects
-                       .get(table_name=self.category_name).label)
+        pretty_name = lookup_table_label(self.category_name)
         pretty_name = pretty_name.replace(' Surface Geometry Constraints', '')
         pretty_name = pretty_name.replace(' Geometry Constraints', '')
         pretty_name = pretty_name.replace(' Mission Constraints', '')
@@ -90,8 +103,7 @@ class ParamInfo(models.Model):
         if self.label_results is None:
             return None
 
-        pretty_name = (TableNames.objects
-                       .get(table_name=self.category_name).label)
+        pretty_name = lookup_table_label(self.category_name)
         pretty_name = pretty_name.replace(' Surface Geometry Constraints', '')
         pretty_name = pretty_name.replace(' Geometry Constraints', '')
         pretty_name = pretty_name.replace(' Mission Constraints', '')
@@ -109,7 +121,7 @@ class ParamInfo(models.Model):
     def get_units(self):
         # Put parentheses around units (units)
         (form_type, form_type_format,
-         form_type_unit_id) = parse_form_type(self.form_type)
+         form_type_unit_id) = self.parsed_form_type()
         if form_type_unit_id and display_result_unit(form_type_unit_id):
             default_unit = get_default_unit(form_type_unit_id)
             display_name = get_unit_display_name(form_type_unit_id,
@@ -129,12 +141,12 @@ class ParamInfo(models.Model):
 
     def is_string(self):
         (form_type, form_type_format,
-         form_type_unit_id) = parse_form_type(self.form_type)
+         form_type_unit_id) = self.parsed_form_type()
         return form_type == 'STRING'
 
     def is_string_or_mult(self):
         (form_type, form_type_format,
-         form_type_unit_id) = parse_form_type(self.form_type)
+         form_type_unit_id) = self.parsed_form_type()
         return form_type == 'STRING' or form_type in settings.MULT_FORM_TYPES
 
     def get_ranges_info(self):
@@ -0,0 +1,192 @@
+################################################################################
+#
+# paraminfo/registry.py
+#
+# An in-memory copy of the param_info and table_names tables.
+#
+# Nearly every API call has to translate slugs and qualified names into
+# ParamInfo entries, often dozens of times per request. Rather than asking
+# the database each time, each server process builds this registry once and
+# rebuilds it only when the import pipeline bumps the import version.
+#
+################################################################################
+
+import copy
+
+from django.apps import apps
+
+from tools.db_utils import get_import_version
+
+import settings
+
+import logging
+log = logging.getLogger(__name__)
+
+
+_SLUG_SOURCES = ('col', 'widget', 'qtype', 'search')
+
+
+class ParamInfoRegistry(object):
+    """All ParamInfo and TableNames entries indexed for fast lookup.
+
+    The registry is never modified once built. The ParamInfo instances it
+    holds are shared by everyone, so the public lookup functions below hand
+    out copies that callers are free to modify.
+    """
+
+    def __init__(self, version):
+        param_info_model = apps.get_model('paraminfo', 'ParamInfo')
+        table_names_model = apps.get_model('search', 'TableNames')
+
+        self.version = version
+
+        self.table_labels = {t.table_name: t.label
+                             for t in table_names_model.objects.all()}
+
+        # In the model's default ordering
+        self.param_infos = tuple(param_info_model.objects.all())
+
+        by_slug = {}
+        by_old_slug = {}
+        by_qualified_name = {}
+        for pi in self.param_infos:
+            # Precompute the parsed form_type so nobody has to parse it again
+            pi.parsed_form_type()
+            # The first entry wins, just like the old .get() would have had
+            # if there were duplicates (which there shouldn't be)
+            if pi.slug:
+                by_slug.setdefault(pi.slug, pi)
+            if pi.old_slug:
+                by_old_slug.setdefault(pi.old_slug, pi)
+            by_qualified_name.setdefault((pi.category_name, pi.name), pi)
+        self._by_slug = by_slug
+        self._by_old_slug = by_old_slug
+        self._by_qualified_name = by_qualified_name
+
+        # The fields shown for each category on the Details page, in order
+        results_by_category = {}
+        for pi in sorted(self.param_infos, key=lambda x: x.disp_order):
+            if pi.display_results == 1:
+                results_by_category.setdefault(pi.category_name, []).append(pi)
+        self._results_by_category = results_by_category
+
+        # Every slug that can possibly be resolved is one of the known slugs
+        # or old slugs with a numeric suffix removed or added. Resolve them
+        # all now for each source so a lookup is a single dict access.
+        candidates = set()
+        for slug in list(by_slug.keys()) + list(by_old_slug.keys()):
+            candidates.add(slug)
+            candidates.add(slug+'1')
+            candidates.add(slug+'2')
+            if slug[-1] in ('1', '2'):
+                candidates.add(slug[:-1])
+        self._by_source = {}
+        for source in _SLUG_SOURCES:
+            resolved = {}
+            for slug in candidates:
+                pi = self._resolve_slug(slug, source)
+                if pi is not None:
+                    resolved[slug] = pi
+            self._by_source[source] = resolved
+
+    def _get_current_or_old(self, slug):
+        ret = self._by_slug.get(slug)
+        if ret is None:
+            ret = self._by_old_slug.get(slug)
+        return ret
+
+    def _resolve_slug(self, slug, source):
+        # This implements the rules described in
+        # search.views.get_param_info_by_slug
+        if source == 'qtype' and slug[-1] in ('1', '2'):
+            return None
+
+        ret = self._get_current_or_old(slug)
+        if ret is not None:
+            if source == 'search' and slug[-1] not in ('1', '2'):
+                # For a single-column range, the slug we were given MUST end
+                # in a '1' or '2' - but for non-range types, it's OK to not
+                # have the '1' or '2'.
+                if ret.parsed_form_type()[0] in settings.RANGE_FORM_TYPES:
+                    return None
+            return ret
+
+        # For widgets, if this is a multi-column range, return the version
+        # with the '1' suffix. Q-types can never have a '1' or '2' suffix, but
+        # the database entries might.
+        if source in ('widget', 'qtype'):
+            return self._get_current_or_old(slug+'1')
+
+        # Searching on a single-column range is done with '1' or '2' suffixes
+        # even though the database entry is just a single column without a
+        # numeric suffix.
+        if source == 'search' and slug[-1] in ('1', '2'):
+            ret = self._get_current_or_old(slug[:-1])
+            if (ret is not None and
+                ret.parsed_form_type()[0] not in settings.RANGE_FORM_TYPES):
+                return None
+            return ret
+
+        return None
+
+    def by_slug(self, slug, source):
+        "Return the shared ParamInfo for a slug, or None."
+        return self._by_source[source].get(slug)
+
+    def by_qualified_name(self, category_name, name):
+        "Return the shared ParamInfo for category_name.name, or None."
+        return self._by_qualified_name.get((category_name, name))
+
+    def results_param_infos(self, category_name):
+        "Return the shared ParamInfos displayed in results for a category."
+        return self._results_by_category.get(category_name, [])
+
+    def table_label(self, table_name):
+        "Return the table_names label for a table, or None."
+        return self.table_labels.get(table_name)
+
+
+_REGISTRY = None
+
+def get_param_info_registry():
+    """Return the registry, rebuilding it if the import version has changed.
+
+    Two threads may occasionally both rebuild the registry, but since a new
+    registry is only published by a single assignment once it is complete,
+    nobody ever sees a partial one.
+    """
+    global _REGISTRY
+    version = get_import_version()
+    registry = _REGISTRY
+    if registry is None or registry.version != version:
+        registry = ParamInfoRegistry(version)
+        _REGISTRY = registry
+        log.debug('Built ParamInfo registry for import version "%s": '
+                  +'%d entries', version, len(registry.param_infos))
+    return registry
+
+def lookup_param_info_by_slug(slug, source):
+    "Return a private copy of the ParamInfo for a slug, or None."
+    pi = get_param_info_registry().by_slug(slug, source)
+    if pi is None:
+        return None
+    return copy.copy(pi)
+
+def lookup_param_info_by_qualified_name(category_name, name):
+    "Return a private copy of the ParamInfo for category_name.name, or None."
+    pi = get_param_info_registry().by_qualified_name(category_name, name)
+    if pi is None:
+        return None
+    return copy.copy(pi)
+
+def lookup_results_param_infos(category_name):
+    """Return private copies of the ParamInfos displayed for a category.
+
+    These are the entries with display_results set, ordered by disp_order.
+    """
+    return [copy.copy(pi) for pi in
+            get_param_info_registry().results_param_infos(category_name)]
+
+def lookup_table_label(table_name):
+    "Return the table_names label for a table, or None."
+    return get_param_info_registry().table_label(table_name)
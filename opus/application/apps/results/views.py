@@ -30,9 +30,9 @@
 ################################################################################
 
 from collections import OrderedDict
+import hashlib
 import json
 import logging
-import os
 import time
 
 import settings
@@ -44,9 +44,11 @@ from django.http import Http404, HttpResponseServerError
 from django.shortcuts import render
 from django.views.decorators.cache import never_cache
 
+from MySQLdb.cursors import SSCursor
+
 from metadata.views import (get_cart_count,
                             get_result_count_helper)
-from paraminfo.models import ParamInfo
+from paraminfo.registry import lookup_results_param_infos
 from search.models import Partables, TableNames
 from search.views import (get_param_info_by_slug,
                           get_user_query_table,
@@ -56,6 +58,7 @@ from search.views import (get_param_info_by_slug,
 from tools.app_utils import (cols_to_slug_list,
                              convert_ring_obs_id_to_opus_id,
                              csv_response,
+                             csv_streaming_response,
                              download_filename,
                              enter_api_call,
                              exit_api_call,
@@ -63,6 +66,7 @@ from tools.app_utils import (cols_to_slug_list,
                              get_reqno,
                              get_session_id,
                              json_response,
+                             json_streaming_response,
                              throw_random_http404_error,
                              throw_random_http500_error,
                              HTTP404_BAD_LIMIT,
@@ -81,11 +85,14 @@ from tools.app_utils import (cols_to_slug_list,
                              HTTP500_DATABASE_ERROR,
                              HTTP500_INTERNAL_ERROR,
                              HTTP500_SEARCH_CACHE_FAILED)
-from tools.db_utils import (query_table_for_opus_id,
+from tools.db_utils import (get_import_version,
+                            query_table_for_opus_id,
+                            query_tables_for_opus_id,
                             lookup_pretty_value_for_mult)
 from tools.file_utils import get_pds_preview_images, get_pds_products
 
 from opus_support import (format_unit_value,
+                          get_column_formatter,
                           parse_form_type)
 
 log = logging.getLogger(__name__)
@@ -294,7 +301,7 @@ def api_get_data(request, fmt):
 
     Format: api/data.(?P<fmt>json|html|csv)
             __api/data.(?P<fmt>csv)
-    Arguments: limit=<N>
+    Arguments: limit=<N> or limit=all
                page=<N>  OR  startobs=<N> (1-based)
                order=<column>[,<column>...]
                Normal search and selected-column arguments
@@ -336,6 +343,10 @@ def api_get_data(request, fmt):
                 <td>1.9200</td>
             </tr>
         </table>
+
+    With limit=all, JSON and CSV results are streamed to the client as they
+    are read from the database rather than being assembled in memory first.
+    In this case 'count' is the last entry in the returned JSON.
     """
     api_code = enter_api_call('api_get_data', request)
 
@@ -352,6 +363,9 @@ def api_get_data(request, fmt):
         exit_api_call(api_code, ret)
         raise ret
 
+    if request.GET.get('limit', None) == 'all' and fmt in ('csv', 'json'):
+        return _api_get_data_streaming(request, fmt, cols, labels, api_code)
+
     (page_no, start_obs, limit,
      page, order, aux, error) = get_search_results_chunk(
                                                      request,
@@ -401,6 +415,44 @@ def api_get_data(request, fmt):
     return ret
 
 
+def _api_get_data_streaming(request, fmt, cols, labels, api_code):
+    "Return a streaming response with all the data for a search (limit=all)."
+    result_count, _, err = get_result_count_helper(request, api_code)
+    if err is not None: # pragma: no cover
+        exit_api_call(api_code, err)
+        return err
+
+    (page_no, start_obs, limit,
+     page, order, aux, error) = get_search_results_chunk(
+                                                     request,
+                                                     cols=cols,
+                                                     limit='all',
+                                                     return_iterator=True,
+                                                     api_code=api_code)
+    if error is not None:
+        return get_search_results_chunk_error_handler(error, api_code)
+
+    if fmt == 'csv':
+        csv_filename = download_filename(None, 'data')
+        ret = csv_streaming_response(csv_filename, page, labels)
+        exit_api_call(api_code, ret)
+        return ret
+
+    data = {}
+    if page_no is not None:
+        data['page_no'] = page_no # Backwards compatibility
+    if start_obs is not None:
+        data['start_obs'] = start_obs
+    data['limit'] = limit
+    data['available'] = result_count
+    data['order'] = order
+    data['labels'] = labels
+    data['columns'] = labels # Backwards compatibility
+    ret = json_streaming_response(data, 'page', page, count_key='count')
+    exit_api_call(api_code, ret)
+    return ret
+
+
 @never_cache
 def api_get_metadata(request, opus_id, fmt):
     r"""Return all metadata, sorted by category, for this opus_id.
@@ -529,31 +581,34 @@ def get_metadata(request, opus_id, fmt, api_name, return_db_names, internal):
         exit_api_call(api_code, ret)
         return ret
 
-    # Make sure it's a valid OPUS ID
-    try:
-        results = query_table_for_opus_id('obs_general', opus_id)
-        if throw_random_http500_error(): # pragma: no cover
-            raise LookupError
-    except LookupError: # pragma: no cover
-        log.error('api_get_metadata: Could not find data model for obs_general')
-        ret = HttpResponseServerError(HTTP500_INTERNAL_ERROR(request))
-        exit_api_call(api_code, ret)
-        return ret
-    if len(results) == 0 or throw_random_http404_error():
-        log.error('get_metadata: Error searching for opus_id "%s"',
-                  opus_id)
-        ret = Http404(HTTP404_UNKNOWN_OPUS_ID(opus_id, request))
-        exit_api_call(api_code, ret)
-        raise ret
-
     cats = request.GET.get('cats', False)
     url_cols = request.GET.get('url_cols', False)
 
+    # The rendered metadata only changes when there's a new import. We hash
+    # the arguments because the user may have included characters that aren't
+    # allowed in a cache key.
+    args_hash = hashlib.md5(str.encode(str(cats)+':'+str(url_cols))).hexdigest()
+    cache_key = (settings.CACHE_SERVER_PREFIX + settings.CACHE_KEY_PREFIX
+                 + ':metadata:' + get_import_version() + ':' + api_name + ':'
+                 + opus_id + ':' + fmt + ':' + args_hash)
+    if settings.METADATA_CACHE_RESPONSES:
+        cached_val = cache.get(cache_key)
+        if cached_val is not None:
+            if fmt == 'csv':
+                # The cached value is the rows, so the file name stays current
+                csv_filename = download_filename(opus_id, 'metadata')
+                ret = csv_response(csv_filename, cached_val)
+            else:
+                ret = cached_val
+            exit_api_call(api_code, ret)
+            return ret
+
     # Holds data struct to be returned
     data = OrderedDict()
     # Holds all the param info objects keyed by table label
     data_all_info = OrderedDict()
 
+    bad_cats = False
     if cats == '':
         all_tables = []
     elif not cats:
@@ -569,122 +624,133 @@ def get_metadata(request, opus_id, fmt, api_name, return_db_names, internal):
                        TableNames.objects.filter(table_name__in=cat_list,
                                                  display='Y'))
                                          .order_by('disp_order'))
-        if len(all_tables) != len(cat_list) or throw_random_http404_error():
-            log.error('get_metadata: Unknown category name in "%s"',
-                      cats)
-            ret = Http404(HTTP404_UNKNOWN_CATEGORY(request))
-            exit_api_call(api_code, ret)
-            raise ret
+        # We report a bad OPUS ID before a bad category
+        bad_cats = len(all_tables) != len(cat_list)
 
-    # Now find all params and their values in each of these tables
+    # Find all params in each of these tables, and the columns we need to
+    # fetch for them
+    table_info = [] # (table_label, table_name, param_info_list)
+    table_columns = OrderedDict()
     for table in all_tables:
         table_label = table.label
         table_name = table.table_name
-        model_name = ''.join(table_name.title().split('_'))
         all_info = OrderedDict() # Holds all the param info objects
 
-        # Make a list of all slugs and another of all param_names in this table
-        param_info_list = list(ParamInfo.objects
-                               .filter(category_name=table_name,
-                                       display_results=1)
-                               .order_by('disp_order'))
-        if param_info_list:
-            all_param_names = []
-            for param_info in param_info_list:
-                if param_info.referred_slug is not None:
-                    referred_slug = param_info.referred_slug
-                    param_info = get_param_info_by_slug(referred_slug, 'col')
-                    param_info.label = param_info.body_qualified_label()
-                    param_info.label_results = (
-                                param_info.body_qualified_label_results(True))
-                    param_info.referred_slug = referred_slug
-                else:
-                    all_param_names.append(param_info.name)
+        param_info_list = lookup_results_param_infos(table_name)
+        if not param_info_list:
+            continue
+        columns = []
+        for idx, param_info in enumerate(param_info_list):
+            if param_info.referred_slug is not None:
+                referred_slug = param_info.referred_slug
+                param_info = get_param_info_by_slug(referred_slug, 'col')
+                param_info.label = param_info.body_qualified_label()
+                param_info.label_results = (
+                            param_info.body_qualified_label_results(True))
+                # Assign referred_slug. This will be used to determine if
+                # the param info is from referred_slug, and we will use
+                # the slug to get the metadata result later.
+                param_info.referred_slug = referred_slug
+                param_info_list[idx] = param_info
+            else:
+                columns.append(param_info.name)
+                form_type = param_info.parsed_form_type()[0]
+                if (form_type in settings.MULT_FORM_TYPES and
+                    not return_db_names):
+                    columns.append(
+                            get_mult_name(param_info.param_qualified_name()))
 
-                if return_db_names:
-                    all_info[param_info.name] = param_info
-                else:
-                    all_info[param_info.slug] = param_info
-            # Store all param info objects for current table
-            data_all_info[table_label] = all_info
+            if return_db_names:
+                all_info[param_info.name] = param_info
+            else:
+                all_info[param_info.slug] = param_info
+        # Store all param info objects for current table
+        data_all_info[table_label] = all_info
+        table_info.append((table_label, table_name, param_info_list))
+        table_columns[table_name] = columns
+
+    # Fetch every table's row for this observation at once. This also makes
+    # sure it's a valid OPUS ID.
+    try:
+        rows = query_tables_for_opus_id(opus_id, table_columns)
+        if throw_random_http500_error(): # pragma: no cover
+            raise DatabaseError('random')
+    except DatabaseError as e: # pragma: no cover
+        log.error('get_metadata: Error retrieving metadata for opus_id "%s": '
+                  +'%s', opus_id, str(e))
+        ret = HttpResponseServerError(HTTP500_DATABASE_ERROR(request))
+        exit_api_call(api_code, ret)
+        return ret
+    if rows is None or throw_random_http404_error():
+        log.error('get_metadata: Error searching for opus_id "%s"',
+                  opus_id)
+        ret = Http404(HTTP404_UNKNOWN_OPUS_ID(opus_id, request))
+        exit_api_call(api_code, ret)
+        raise ret
 
-            try:
-                results = query_table_for_opus_id(table_name, opus_id)
-                if throw_random_http500_error(): # pragma: no cover
-                    raise LookupError
-            except LookupError: # pragma: no cover
-                log.error('api_get_metadata: Could not find data model for '
-                          +'category %s', model_name)
-                ret = HttpResponseServerError(HTTP500_INTERNAL_ERROR(request))
-                exit_api_call(api_code, ret)
-                return ret
-
-            result_vals = results.values(*all_param_names)
-            if not result_vals:
-                # This is normal - we're looking at ALL tables so many won't
-                # have this OPUS_ID in them.
-                continue
-            result_vals = result_vals[0]
-            ordered_results = OrderedDict()
-            for param_info in param_info_list:
-                if param_info.referred_slug is not None:
-                    referred_slug = param_info.referred_slug
-                    param_info = get_param_info_by_slug(referred_slug, 'col')
-                    param_info.label = param_info.body_qualified_label()
-                    param_info.label_results = (
-                                param_info.body_qualified_label_results(True))
-                    # Assign referred_slug. This will be used to determine if
-                    # the param info is from referred_slug, and we will use
-                    # the slug to get the metadata result later.
-                    param_info.referred_slug = referred_slug
-
-                (form_type, form_type_format,
-                 form_type_unit_id) = parse_form_type(param_info.form_type)
+    if bad_cats or throw_random_http404_error():
+        log.error('get_metadata: Unknown category name in "%s"',
+                  cats)
+        ret = Http404(HTTP404_UNKNOWN_CATEGORY(request))
+        exit_api_call(api_code, ret)
+        raise ret
 
-                if (form_type in settings.MULT_FORM_TYPES and
-                    not return_db_names):
-                    mult_name = get_mult_name(param_info.param_qualified_name())
-                    mult_val = results.values(mult_name)[0][mult_name]
-                    result = lookup_pretty_value_for_mult(param_info,
-                                                          mult_val,
-                                                         cvt_null=(fmt!='json'))
-                else:
-                    result = result_vals.get(param_info.name, None)
-                    # If this is the param info from referred_slug, we will get
-                    # the result data from _get_metadata_by_slugs.
-                    if result is None and param_info.referred_slug:
-                        r_data = _get_metadata_by_slugs(
-                                                    request, opus_id,
-                                                    param_info.referred_slug,
-                                                    'raw_data',
-                                                    return_db_names,
-                                                    internal,
-                                                    api_code)
-                        result = r_data[0].get(param_info.referred_slug, None)
-                        if (result == 'N/A' and fmt == 'json' and
-                            form_type != 'STRING'):
-                            result = None
-                    elif (result is None and fmt != 'json' and
-                          form_type != 'STRING'):
-                        result = 'N/A'
-                    else:
-                        # Result is returned in proper format in the default
-                        # unit
-                        result = format_unit_value(result,
-                                                   form_type_format,
-                                                   form_type_unit_id,
-                                                   None)
-
-                if fmt == 'csv':
-                    index = param_info.fully_qualified_label_results()
-                elif return_db_names:
-                    index = param_info.name
+    # Now find the values of all the params in each of these tables
+    for table_label, table_name, param_info_list in table_info:
+        result_vals = rows[table_name]
+        if result_vals is None:
+            # This is normal - we're looking at ALL tables so many won't
+            # have this OPUS_ID in them.
+            continue
+        ordered_results = OrderedDict()
+        for param_info in param_info_list:
+            (form_type, form_type_format,
+             form_type_unit_id) = param_info.parsed_form_type()
+
+            if (form_type in settings.MULT_FORM_TYPES and
+                not return_db_names):
+                mult_name = get_mult_name(param_info.param_qualified_name())
+                mult_val = result_vals.get(mult_name, None)
+                result = lookup_pretty_value_for_mult(param_info,
+                                                      mult_val,
+                                                     cvt_null=(fmt!='json'))
+            else:
+                result = result_vals.get(param_info.name, None)
+                # If this is the param info from referred_slug, we will get
+                # the result data from _get_metadata_by_slugs.
+                if result is None and param_info.referred_slug:
+                    r_data = _get_metadata_by_slugs(
+                                                request, opus_id,
+                                                param_info.referred_slug,
+                                                'raw_data',
+                                                return_db_names,
+                                                internal,
+                                                api_code)
+                    result = r_data[0].get(param_info.referred_slug, None)
+                    if (result == 'N/A' and fmt == 'json' and
+                        form_type != 'STRING'):
+                        result = None
+                elif (result is None and fmt != 'json' and
+                      form_type != 'STRING'):
+                    result = 'N/A'
                 else:
-                    index = param_info.slug
-                if index:
-                    ordered_results[index] = result
+                    # Result is returned in proper format in the default
+                    # unit
+                    result = format_unit_value(result,
+                                               form_type_format,
+                                               form_type_unit_id,
+                                               None)
+
+            if fmt == 'csv':
+                index = param_info.fully_qualified_label_results()
+            elif return_db_names:
+                index = param_info.name
+            else:
+                index = param_info.slug
+            if index:
+                ordered_results[index] = result
 
-            data[table_label] = ordered_results
+        data[table_label] = ordered_results
 
     if fmt == 'csv':
         csv_data = []
@@ -699,6 +765,7 @@ def get_metadata(request, opus_id, fmt, api_name, return_db_names, internal):
             csv_data.append(row_data)
         csv_filename = download_filename(opus_id, 'metadata')
         ret = csv_response(csv_filename, csv_data)
+        cached_val = csv_data
     elif fmt == 'html':
         context = {'data': data,
                    'data_all_info': data_all_info,
@@ -709,14 +776,19 @@ def get_metadata(request, opus_id, fmt, api_name, return_db_names, internal):
         else:
             ret = render(request, 'results/detail_metadata.html',
                          context)
+        cached_val = ret
     elif fmt == 'json':
         ret = json_response(data)
+        cached_val = ret
     else: # pragma: no cover
         log.error('get_metadata: Unknown format "%s"', fmt)
         ret = Http404(HTTP404_UNKNOWN_FORMAT(fmt, request))
         exit_api_call(api_code, ret)
         raise ret
 
+    if settings.METADATA_CACHE_RESPONSES:
+        cache.set(cache_key, cached_val)
+
     exit_api_call(api_code, ret)
     return ret
 
@@ -1272,6 +1344,7 @@ def get_search_results_chunk(request, use_cart=None,
                              return_ringobsids=False,
                              return_filespecs=False,
                              return_cart_states=False,
+                             return_iterator=False,
                              api_code=None):
     """Return a page of results.
 
@@ -1305,6 +1378,15 @@ def get_search_results_chunk(request, use_cart=None,
                             with the returned data indicating if the given
                             observation is in the current cart table for
                             this session.
+        return_iterator     Instead of a list, return the results as an
+                            iterator that reads and formats the rows from
+                            the database a chunk at a time. This keeps
+                            memory use flat for very large results. The
+                            query isn't run until the iterator is first
+                            used, so nothing else may use the database
+                            connection until the iterator is exhausted.
+                            Can't be used with any of the return_* options
+                            above.
 
         Returns:
 
@@ -1475,8 +1557,6 @@ def get_search_results_chunk(request, use_cart=None,
 
     q = connection.ops.quote_name
 
-    temp_table_name = None
-    drop_temp_table = False
     params = []
     if not use_cart:
         # This is for a search query
@@ -1503,37 +1583,6 @@ def get_search_results_chunk(request, use_cart=None,
                       str(selections), str(extras))
             return error_return(500, HTTP500_SEARCH_CACHE_FAILED(request))
 
-        # First we create a temporary table that contains only those ids
-        # in the limit window that we care about (if there's a limit window).
-        # Then we use that temporary table (or the original cache table) to
-        # extract data from all our data tables.
-        drop_temp_table = True
-        pid_sfx = str(os.getpid())
-        time1 = time.time()
-        time_sfx = ('%.6f' % time1).replace('.', '_')
-        temp_table_name = 'temp_'+user_query_table
-        temp_table_name += '_'+pid_sfx+'_'+time_sfx
-        temp_sql = 'CREATE TEMPORARY TABLE '
-        temp_sql += q(temp_table_name)
-        temp_sql += ' SELECT sort_order, id FROM '+q(user_query_table)
-        temp_sql += ' ORDER BY sort_order'
-        if limit == 'all':
-            temp_sql += ' LIMIT '+str(settings.SQL_MAX_LIMIT)
-        else:
-            temp_sql += ' LIMIT '+str(limit)
-        temp_sql += ' OFFSET '+str(offset)
-        cursor = connection.cursor()
-        try:
-            cursor.execute(temp_sql)
-            if throw_random_http500_error():
-                raise DatabaseError
-        except DatabaseError as e:
-            log.error('get_search_results_chunk: "%s" returned %s',
-                      temp_sql, str(e))
-            return error_return(500, HTTP500_DATABASE_ERROR(request))
-        log.debug('get_search_results_chunk SQL (%.2f secs): %s',
-                  time.time()-time1, temp_sql)
-
         sql = 'SELECT '
         sql += ','.join([q(x.split('.')[0])+'.'+
                          q(x.split('.')[1])
@@ -1558,9 +1607,9 @@ def get_search_results_chunk(request, use_cart=None,
 
         # But the cache table is an INNER JOIN because we only want opus_ids
         # that appear in the cache table to cause result rows
-        sql += ' INNER JOIN '+q(temp_table_name)
+        sql += ' INNER JOIN '+q(user_query_table)
         sql += ' ON '+q('obs_general')+'.'+q('id')+'='
-        sql += q(temp_table_name)+'.'+q('id')
+        sql += q(user_query_table)+'.'+q('id')
 
         # Maybe join in the cart table if we need cart_state
         if return_cart_states:
@@ -1571,8 +1620,21 @@ def get_search_results_chunk(request, use_cart=None,
             sql += q('session_id')+'=%s'
             params.append(session_id)
 
+        # The cache table's sort_order is a dense AUTO_INCREMENT primary key
+        # starting at 1, so the rows we want are just a range of sort_order.
+        # Unlike LIMIT/OFFSET, this lets MySQL go straight to the first row
+        # no matter how deep into the results we are.
+        sql += ' WHERE '+q(user_query_table)+'.'+q('sort_order')
+        if limit == 'all':
+            sql += ' > %s'
+            params.append(offset)
+        else:
+            sql += ' BETWEEN %s AND %s'
+            params.append(offset+1)
+            params.append(offset+limit)
+
         sql += ' ORDER BY '
-        sql += q(temp_table_name)+'.sort_order'
+        sql += q(user_query_table)+'.'+q('sort_order')
     else:
         # This is for a cart
         order_params, order_descending_params = parse_order_slug(all_order)
@@ -1626,6 +1688,31 @@ def get_search_results_chunk(request, use_cart=None,
             sql += ' LIMIT '+str(limit)
         sql += ' OFFSET '+str(offset)
 
+    formatters = [_make_column_formatter(form_type_format, form_type_unit_id)
+                  for (form_type_format, form_type_unit_id)
+                  in form_type_formats]
+
+    if return_iterator:
+        assert not (return_opusids or return_ringobsids or return_filespecs or
+                    return_cart_states)
+        time1 = time.time()
+        db_connection = None
+        try:
+            db_connection, cursor = _execute_streaming_query(sql, params)
+            if throw_random_http500_error():
+                raise DatabaseError
+        except DatabaseError as e:
+            if db_connection is not None:
+                db_connection.close()
+            log.error('get_search_results_chunk: "%s" + "%s" returned %s',
+                      sql, params, str(e))
+            return error_return(500, HTTP500_DATABASE_ERROR(request))
+        log.debug('get_search_results_chunk SQL (streaming, %.2f secs): %s',
+                  time.time()-time1, sql)
+        results = _iterate_search_results(db_connection, cursor, sql, params,
+                                          formatters)
+        return (page_no, start_obs, limit, results, all_order, {}, None)
+
     time1 = time.time()
 
     cursor = connection.cursor()
@@ -1647,17 +1734,6 @@ def get_search_results_chunk(request, use_cart=None,
     log.debug('get_search_results_chunk SQL (%.2f secs): %s',
               time.time()-time1, sql)
 
-    if drop_temp_table:
-        sql = 'DROP TABLE '+q(temp_table_name)
-        try:
-            cursor.execute(sql)
-            if throw_random_http500_error():
-                raise DatabaseError
-        except DatabaseError as e:
-            log.error('get_search_results_chunk: "%s" returned %s',
-                      sql, str(e))
-            return error_return(500, HTTP500_DATABASE_ERROR(request))
-
     if return_opusids:
         # Return a simple list of opus_ids
         opus_id_index = column_names.index('obs_general.opus_id')
@@ -1689,20 +1765,9 @@ def get_search_results_chunk(request, use_cart=None,
     if added_extra_columns:
         results = [o[:-added_extra_columns] for o in results]
 
-    # There might be real None entries, which means the join returned null
-    # data. Replace these so they look prettier.
-    results = [[x if x is not None else 'N/A' for x in r] for r in results]
-
-    # If pi_form_type has format, we format the results
-    for idx, (form_type_format, form_type_unit_id) in enumerate(form_type_formats):
-        for entry in results:
-            if entry[idx] != 'N/A':
-                # Result is returned in proper format converted to
-                # the given unit
-                entry[idx] = format_unit_value(entry[idx],
-                                               form_type_format,
-                                               form_type_unit_id,
-                                               None)
+    # Format the results in the proper format converted to the given unit,
+    # one column at a time
+    results = _format_result_rows(results, formatters)
 
     aux_dict = {}
     if return_opusids:
@@ -1717,6 +1782,78 @@ def get_search_results_chunk(request, use_cart=None,
     return (page_no, start_obs, limit, results, all_order, aux_dict, None)
 
 
+def _make_column_formatter(form_type_format, form_type_unit_id):
+    """Return a function that formats a whole result column.
+
+    There might be real None entries, which means the join returned null
+    data. These are replaced with 'N/A' so they look prettier. Everything
+    else is formatted by the column formatter compiled by opus_support.
+    """
+    column_formatter = get_column_formatter(form_type_format,
+                                            form_type_unit_id, None)
+    def _formatter(vals):
+        return [x if x is not None else 'N/A'
+                for x in column_formatter(vals)]
+    return _formatter
+
+def _format_result_rows(rows, formatters):
+    """Format a list of result rows column by column.
+
+    Any extra columns beyond the formatters (opus_id added because there
+    were no columns) are dropped.
+    """
+    columns = [formatter([row[idx] for row in rows])
+               for idx, formatter in enumerate(formatters)]
+    return [[column[row_idx] for column in columns]
+            for row_idx in range(len(rows))]
+
+def _execute_streaming_query(sql, params):
+    """Run a results query on a server-side cursor of its own.
+
+    The query gets a new database connection, because nothing else can use
+    a connection until its unbuffered result set has been read to the end,
+    and the rest of the request (including the session middleware) still
+    needs the default one. Returns the connection and the executed cursor;
+    raises DatabaseError if the query fails.
+    """
+    with connection.wrap_database_errors:
+        db_connection = connection.get_new_connection(
+                                        connection.get_connection_params())
+        try:
+            cursor = db_connection.cursor(SSCursor)
+            cursor.execute(sql, params)
+        except:
+            db_connection.close()
+            raise
+    return db_connection, cursor
+
+def _iterate_search_results(db_connection, cursor, sql, params, formatters):
+    """Yield the formatted rows of an executed streaming query a chunk at a
+    time.
+
+    Any extra columns beyond the formatters (opus_id added because there
+    were no columns) are dropped. A database error part way through is
+    re-raised so the response is cut off instead of looking complete. The
+    connection is closed when the rows run out or the iterator is discarded.
+    """
+    try:
+        while True:
+            try:
+                with connection.wrap_database_errors:
+                    rows = cursor.fetchmany(settings.SQL_STREAMING_FETCH_SIZE)
+            except DatabaseError as e: # pragma: no cover
+                log.error('get_search_results_chunk: fetch for "%s" + "%s" '
+                          +'returned %s', sql, params, str(e))
+                raise
+            if not rows:
+                break
+            yield from _format_result_rows(rows, formatters)
+    finally:
+        # Closing the connection rather than the cursor, because closing an
+        # SSCursor reads any remaining rows first
+        db_connection.close()
+
+
 def _get_metadata_by_slugs(request, opus_id, cols, fmt, use_param_names,
                            internal, api_code):
     "Returns results for specified slugs."
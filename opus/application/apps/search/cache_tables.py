@@ -0,0 +1,185 @@
+################################################################################
+#
+# search/cache_tables.py
+#
+# Lifecycle management for the cache_NNN tables that hold search results.
+#
+# Every distinct search gets an entry in user_searches and a cache_NNN table
+# (see get_user_query_table). Left alone these pile up by the tens of
+# thousands between imports, so we keep track of when each one was last used
+# (the timestamp column of user_searches) and how many rows it holds
+# (row_count), and evict_cache_tables drops the least recently used ones when
+# there are more than CACHE_TABLE_MAX_COUNT tables or more than
+# CACHE_TABLE_MAX_ROWS rows in all of them.
+#
+# A request must never have its table dropped out from under it:
+#   - Every request touches its user_searches entry before using the table
+#     (at most once every CACHE_TABLE_TOUCH_INTERVAL seconds per table).
+#   - An entry is only deleted if it hasn't been touched for
+#     CACHE_TABLE_MIN_AGE seconds, which is far longer than any request, and
+#     the check and the delete are a single statement. The table is only
+#     dropped if the delete succeeded.
+#   - If a request's touch finds its entry gone, the request makes a new
+#     entry (and thus a new table) instead.
+#
+################################################################################
+
+import time
+
+from django.core.cache import cache
+from django.db import connection, DatabaseError
+
+import settings
+
+import logging
+log = logging.getLogger(__name__)
+
+
+def get_user_search_table_name(num):
+    """ pass cache_no, returns user search table name"""
+    return 'cache_' + str(num)
+
+def user_search_number_cache_key(selections_hash, qtypes_hash, units_hash,
+                                 order_hash):
+    "Return the memory cache key for a user_searches entry's id."
+    return (settings.CACHE_SERVER_PREFIX + settings.CACHE_KEY_PREFIX
+            +':usersearchno:selections_hash:' + str(selections_hash)
+            +':qtypes_hash:' + str(qtypes_hash)
+            +':units_hash:' + str(units_hash)
+            +':order_hash:' + str(order_hash))
+
+def cache_table_cache_key(num):
+    "Return the memory cache key that says cache table num exists."
+    return (settings.CACHE_SERVER_PREFIX + settings.CACHE_KEY_PREFIX
+            + ':cache_table:' + str(num))
+
+def _cache_table_touch_cache_key(num):
+    return (settings.CACHE_SERVER_PREFIX + settings.CACHE_KEY_PREFIX
+            + ':cache_table_touch:' + str(num))
+
+def touch_user_search(num):
+    """Record that the cache table for user_searches entry num is being used.
+
+    Returns False if the entry no longer exists because its table was
+    evicted, in which case the caller must get a new entry. To keep this
+    cheap, the database is only updated once every CACHE_TABLE_TOUCH_INTERVAL
+    seconds per table.
+    """
+    touch_key = _cache_table_touch_cache_key(num)
+    if cache.get(touch_key):
+        return True
+    q = connection.ops.quote_name
+    sql = ('UPDATE '+q('user_searches')+' SET '+q('timestamp')
+           +'=CURRENT_TIMESTAMP WHERE '+q('id')+'=%s')
+    cursor = connection.cursor()
+    cursor.execute(sql, [num])
+    # Django asks MySQL for the number of matched (not changed) rows
+    if cursor.rowcount == 0:
+        return False
+    cache.set(touch_key, True, settings.CACHE_TABLE_TOUCH_INTERVAL)
+    return True
+
+def set_cache_table_row_count(num, row_count):
+    "Record the number of rows in cache table num."
+    q = connection.ops.quote_name
+    sql = ('UPDATE '+q('user_searches')+' SET '+q('row_count')+'=%s'
+           +' WHERE '+q('id')+'=%s')
+    cursor = connection.cursor()
+    try:
+        cursor.execute(sql, [row_count, num])
+    except DatabaseError as e: # pragma: no cover
+        log.error('set_cache_table_row_count: "%s" failed with %s',
+                  sql, str(e))
+
+def evict_cache_tables(max_count=None, max_rows=None, min_age=None):
+    """Drop the least recently used cache tables until there are few enough.
+
+    The limits default to CACHE_TABLE_MAX_COUNT, CACHE_TABLE_MAX_ROWS, and
+    CACHE_TABLE_MIN_AGE. Tables used within the last min_age seconds are never
+    dropped. Cache tables that no longer have a user_searches entry are
+    dropped too. Returns the number of tables dropped.
+    """
+    if max_count is None:
+        max_count = settings.CACHE_TABLE_MAX_COUNT
+    if max_rows is None:
+        max_rows = settings.CACHE_TABLE_MAX_ROWS
+    if min_age is None:
+        min_age = settings.CACHE_TABLE_MIN_AGE
+
+    time1 = time.time()
+    q = connection.ops.quote_name
+    cursor = connection.cursor()
+
+    # Most recently used first. Entries that have never been touched are
+    # treated as the oldest.
+    cursor.execute('SELECT '+q('id')+','+q('selections_hash')+','
+                   +q('qtypes_hash')+','+q('units_hash')+','
+                   +q('order_hash')+','+q('row_count')
+                   +' FROM '+q('user_searches')
+                   +' ORDER BY '+q('timestamp')+' IS NULL,'
+                   +q('timestamp')+' DESC,'+q('id')+' DESC')
+    entries = cursor.fetchall()
+    known_nums = set([entry[0] for entry in entries])
+    max_num = max(known_nums) if known_nums else 0
+
+    total_count = 0
+    total_rows = 0
+    victims = []
+    for entry in entries:
+        row_count = entry[5] or 0
+        # The newest entry is always kept, because MySQL might reuse its id
+        # after a restart and its number is part of other memory cache keys
+        if entry[0] != max_num and (total_count+1 > max_count or
+                                    total_rows+row_count > max_rows):
+            victims.append(entry)
+        else:
+            total_count += 1
+            total_rows += row_count
+
+    delete_sql = ('DELETE FROM '+q('user_searches')+' WHERE '+q('id')+'=%s'
+                  +' AND ('+q('timestamp')+' IS NULL OR '+q('timestamp')
+                  +' <= NOW() - INTERVAL %s SECOND)')
+    num_dropped = 0
+    for (num, selections_hash, qtypes_hash, units_hash, order_hash,
+         row_count) in victims:
+        cursor.execute(delete_sql, [num, min_age])
+        if cursor.rowcount == 0:
+            # Used recently (or evicted by someone else) - leave it alone
+            continue
+        cache.delete_many([user_search_number_cache_key(selections_hash,
+                                                        qtypes_hash,
+                                                        units_hash,
+                                                        order_hash),
+                           cache_table_cache_key(num),
+                           _cache_table_touch_cache_key(num)])
+        log.info('Evicting cache table %s (%s rows)',
+                 get_user_search_table_name(num), row_count)
+        _drop_cache_table(cursor, num)
+        num_dropped += 1
+
+    # Tables left behind by an eviction that died part way through. A table
+    # with a number above every entry we saw might belong to a search that
+    # was started after we looked, so those are left alone.
+    cursor.execute('SHOW TABLES LIKE %s', ['cache\\_%'])
+    for (table_name,) in cursor.fetchall():
+        num_str = table_name[len('cache_'):]
+        if not num_str.isdigit():
+            continue
+        num = int(num_str)
+        if num in known_nums or num > max_num:
+            continue
+        log.info('Dropping orphaned cache table %s', table_name)
+        _drop_cache_table(cursor, num)
+        num_dropped += 1
+
+    log.info('evict_cache_tables: Dropped %d of %d tables in %.2f secs',
+             num_dropped, len(entries), time.time()-time1)
+    return num_dropped
+
+def _drop_cache_table(cursor, num):
+    sql = ('DROP TABLE IF EXISTS '
+           +connection.ops.quote_name(get_user_search_table_name(num)))
+    try:
+        cursor.execute(sql)
+    except DatabaseError as e: # pragma: no cover
+        log.error('evict_cache_tables: "%s" failed with %s', sql, str(e))
@@ -7022,6 +7022,7 @@ class UserSearches(models.Model):
     units_hash = models.CharField(max_length=32, blank=True, null=True)
     order_json = models.TextField(blank=True, null=True)
     order_hash = models.CharField(max_length=32, blank=True, null=True)
+    row_count = models.PositiveIntegerField(blank=True, null=True)
     timestamp = models.DateTimeField(blank=True, null=True)
 
     class Meta:
@@ -11,12 +11,17 @@ from django.db import connection
 from django.http import Http404, QueryDict
 from django.test import RequestFactory
 
+from search.cache_tables import evict_cache_tables
 from search.views import (api_normalize_input,
                           api_string_search_choices,
                           construct_query_string,
+                          find_base_user_search,
                           get_longitude_query,
+                          get_param_info_by_slug,
                           get_range_query,
                           get_string_query,
+                          get_user_query_table,
+                          is_single_column_range,
                           set_user_search_number,
                           url_to_search_params)
 import settings
@@ -3529,6 +3534,150 @@ class searchTests(TestCase):
         self.assertEqual(num2, (2, True))
 
 
+            ##################################################
+            ######### evict_cache_tables UNIT TESTS #########
+            ##################################################
+
+    def _cache_table_exists(self, table_name):
+        cursor = connection.cursor()
+        cursor.execute('SHOW TABLES LIKE %s', [table_name])
+        return cursor.fetchone() is not None
+
+    def test__evict_cache_tables_max_count(self):
+        "[test_search.py] evict_cache_tables: max count"
+        tables = []
+        for planet in ('JUPITER', 'SATURN', 'URANUS'):
+            selections, extras = url_to_search_params(
+                                            QueryDict('planet='+planet))
+            tables.append(get_user_query_table(selections, extras))
+        self.assertEqual(tables, ['cache_1', 'cache_2', 'cache_3'])
+        cursor = connection.cursor()
+        cursor.execute('SELECT row_count FROM user_searches WHERE id=2')
+        self.assertGreater(cursor.fetchone()[0], 0)
+        self.assertEqual(evict_cache_tables(max_count=1, min_age=0), 2)
+        self.assertFalse(self._cache_table_exists('cache_1'))
+        self.assertFalse(self._cache_table_exists('cache_2'))
+        self.assertTrue(self._cache_table_exists('cache_3'))
+        # An evicted search gets a new table
+        selections, extras = url_to_search_params(QueryDict('planet=JUPITER'))
+        table = get_user_query_table(selections, extras)
+        self.assertEqual(table, 'cache_4')
+        self.assertTrue(self._cache_table_exists('cache_4'))
+
+    def test__evict_cache_tables_min_age(self):
+        "[test_search.py] evict_cache_tables: recently used tables are kept"
+        for planet in ('JUPITER', 'SATURN'):
+            selections, extras = url_to_search_params(
+                                            QueryDict('planet='+planet))
+            get_user_query_table(selections, extras)
+        self.assertEqual(evict_cache_tables(max_count=0, min_age=3600), 0)
+        self.assertTrue(self._cache_table_exists('cache_1'))
+        self.assertTrue(self._cache_table_exists('cache_2'))
+
+
+            ##########################################################
+            ######### get_user_query_table derived UNIT TESTS #########
+            ##########################################################
+
+    def _full_search_ids(self, selections, extras):
+        sql, params = construct_query_string(selections, extras)
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+    def _cache_table_ids(self, table_name):
+        cursor = connection.cursor()
+        cursor.execute('SELECT id FROM '+connection.ops.quote_name(table_name)
+                       +' ORDER BY sort_order')
+        return [row[0] for row in cursor.fetchall()]
+
+    def test__get_user_query_table_derived_added_constraint(self):
+        "[test_search.py] get_user_query_table: derived from smaller search"
+        settings.SEARCH_REUSE_CACHE_TABLES = True
+        selections, extras = url_to_search_params(QueryDict(
+                                            'planet=SATURN&target=PAN'))
+        self.assertEqual(find_base_user_search(selections, extras),
+                         (None, None, None))
+        selections1, extras1 = url_to_search_params(QueryDict(
+                                            'planet=SATURN'))
+        self.assertEqual(get_user_query_table(selections1, extras1),
+                         'cache_1')
+        self.assertEqual(find_base_user_search(selections, extras),
+                         (1, {'obs_general.target_name': ['PAN']}, True))
+        self.assertEqual(get_user_query_table(selections, extras), 'cache_2')
+        self.assertEqual(self._cache_table_ids('cache_2'),
+                         self._full_search_ids(selections, extras))
+
+    def test__get_user_query_table_derived_new_order(self):
+        "[test_search.py] get_user_query_table: derived by re-sorting"
+        settings.SEARCH_REUSE_CACHE_TABLES = True
+        selections1, extras1 = url_to_search_params(QueryDict(
+                                            'planet=SATURN'))
+        self.assertEqual(get_user_query_table(selections1, extras1),
+                         'cache_1')
+        selections, extras = url_to_search_params(QueryDict(
+                                    'planet=SATURN&order=-time1,opusid'))
+        self.assertEqual(find_base_user_search(selections, extras),
+                         (1, {}, False))
+        self.assertEqual(get_user_query_table(selections, extras), 'cache_2')
+        self.assertEqual(self._cache_table_ids('cache_2'),
+                         self._full_search_ids(selections, extras))
+
+
+            ####################################################
+            ######### get_param_info_by_slug UNIT TESTS #########
+            ####################################################
+
+    def test__get_param_info_by_slug_col(self):
+        "[test_search.py] get_param_info_by_slug: col"
+        pi = get_param_info_by_slug('planet', 'col')
+        self.assertEqual(pi.category_name, 'obs_general')
+        self.assertEqual(pi.name, 'planet_id')
+
+    def test__get_param_info_by_slug_col_old_slug(self):
+        "[test_search.py] get_param_info_by_slug: col old slug"
+        pi = get_param_info_by_slug('instrumentid', 'col')
+        self.assertEqual(pi.slug, 'instrument')
+
+    def test__get_param_info_by_slug_widget_multi_column(self):
+        "[test_search.py] get_param_info_by_slug: widget multi-column range"
+        pi = get_param_info_by_slug('time', 'widget')
+        self.assertEqual(pi.name, 'time1')
+
+    def test__get_param_info_by_slug_qtype(self):
+        "[test_search.py] get_param_info_by_slug: qtype"
+        pi = get_param_info_by_slug('time', 'qtype')
+        self.assertEqual(pi.name, 'time1')
+
+    def test__get_param_info_by_slug_search_single_column(self):
+        "[test_search.py] get_param_info_by_slug: search single-column range"
+        pi = get_param_info_by_slug('observationduration2', 'search')
+        self.assertEqual(pi.name, 'observation_duration')
+
+    def test__get_param_info_by_slug_search_single_column_bad(self):
+        "[test_search.py] get_param_info_by_slug: search single-column range no suffix"
+        pi = get_param_info_by_slug('observationduration', 'search')
+        self.assertIsNone(pi)
+
+    def test__get_param_info_by_slug_bad(self):
+        "[test_search.py] get_param_info_by_slug: unknown slug"
+        pi = get_param_info_by_slug('xyzzy', 'col')
+        self.assertIsNone(pi)
+
+    def test__get_param_info_by_slug_copy(self):
+        "[test_search.py] get_param_info_by_slug: modifying result is private"
+        pi = get_param_info_by_slug('planet', 'col')
+        pi.label = 'fred'
+        pi2 = get_param_info_by_slug('planet', 'col')
+        self.assertNotEqual(pi2.label, 'fred')
+
+    def test__is_single_column_range(self):
+        "[test_search.py] is_single_column_range: single and multi column"
+        self.assertTrue(
+            is_single_column_range('obs_general.observation_duration2'))
+        self.assertFalse(is_single_column_range('obs_general.time1'))
+
+
     # ##  set_user_search_number
     # def test__set_user_search_number(self):
     #     no = set_user_search_number(self.selections)
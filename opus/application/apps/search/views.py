@@ -25,7 +25,14 @@ from django.db.models import Q
 from django.db.utils import IntegrityError
 from django.http import Http404, HttpResponseServerError
 
-from paraminfo.models import ParamInfo
+from paraminfo.registry import (get_param_info_registry,
+                                lookup_param_info_by_qualified_name,
+                                lookup_param_info_by_slug)
+from search.cache_tables import (cache_table_cache_key,
+                                 get_user_search_table_name,
+                                 set_cache_table_row_count,
+                                 touch_user_search,
+                                 user_search_number_cache_key)
 from search.models import UserSearches
 from tools.app_utils import (enter_api_call,
                              exit_api_call,
@@ -53,7 +60,6 @@ from opus_support import (convert_from_default_unit,
                           format_unit_value,
                           get_default_unit,
                           get_valid_units,
-                          parse_form_type,
                           parse_unit_value)
 
 log = logging.getLogger(__name__)
@@ -577,7 +583,7 @@ def url_to_search_params(request_get, allow_errors=False,
             param_qualified_name = 'obs_general.opus_id'
         param_qualified_name_no_num = strip_numeric_suffix(param_qualified_name)
         (form_type, form_type_format,
-         form_type_unit_id) = parse_form_type(param_info.form_type)
+         form_type_unit_id) = param_info.parsed_form_type()
         valid_units = get_valid_units(form_type_unit_id)
 
         if param_info.slug: # Should always be true # pragma: no cover
@@ -942,6 +948,9 @@ def get_user_query_table(selections, extras, api_code=None):
     - Look in the "user_searches" table to see if this search has already
       been requested before. If so, retrieve the cache table number. If not,
       create the entry in "user_searches", which assigns a cache table number.
+    - Mark the entry as recently used so evict_cache_tables leaves the table
+      alone while we use it. If the entry has just been evicted, start over
+      with a new entry.
     - See if the cache table name has been cached in memory. (This means that
       we are SURE the table actually exists and don't have to check again)
       - If so, return the cached table name.
@@ -971,6 +980,14 @@ def get_user_query_table(selections, extras, api_code=None):
 
     # Create a cache key
     cache_table_num, cache_new_flag = set_user_search_number(selections, extras)
+    if cache_table_num is None or not touch_user_search(cache_table_num):
+        # The entry was evicted while we were looking it up, so make a new one
+        cache_table_num, cache_new_flag = set_user_search_number(
+                                                    selections, extras,
+                                                    use_cache=False)
+        if (cache_table_num is not None and
+            not touch_user_search(cache_table_num)): # pragma: no cover
+            cache_table_num = None
     if cache_table_num is None: # pragma: no cover
         log.error('get_user_query_table: Failed to make entry in user_searches'+
                   ' *** Selections %s *** Extras %s',
@@ -979,12 +996,21 @@ def get_user_query_table(selections, extras, api_code=None):
     cache_table_name = get_user_search_table_name(cache_table_num)
 
     # Is this key set in the cache?
-    cache_key = (settings.CACHE_SERVER_PREFIX + settings.CACHE_KEY_PREFIX
-                 + ':cache_table:' + str(cache_table_num))
+    cache_key = cache_table_cache_key(cache_table_num)
     cached_val = cache.get(cache_key)
     if cached_val:
         return cached_val
 
+    # If this search refines (or just re-sorts) one whose table we already
+    # have, filter that table instead of searching everything again
+    if settings.SEARCH_REUSE_CACHE_TABLES:
+        derived_table = _create_derived_cache_table(selections, extras,
+                                                    cache_table_num,
+                                                    api_code)
+        if derived_table is not None:
+            cache.set(cache_key, derived_table)
+            return derived_table
+
     # Try to create the table using the selection criteria.
     # If the table already exists from earlier, this will throw a
     # MYSQL_TABLE_ALREADY_EXISTS exception and we can just return the table
@@ -1008,12 +1034,7 @@ def get_user_query_table(selections, extras, api_code=None):
         return None
 
     # With this we can create a table that contains the single column
-    create_sql = ('CREATE TABLE '
-                  + connection.ops.quote_name(cache_table_name)
-                  + '(sort_order INT NOT NULL AUTO_INCREMENT, '
-                  + 'PRIMARY KEY(sort_order), id INT UNSIGNED, '
-                  + 'UNIQUE KEY(id)) '
-                  + sql)
+    create_sql = _create_cache_table_sql(cache_table_name, sql)
     try:
         time1 = time.time()
         cursor.execute(create_sql, tuple(params))
@@ -1027,17 +1048,149 @@ def get_user_query_table(selections, extras, api_code=None):
     log.debug('API %s (%.3f) get_user_query_table: %s *** PARAMS %s',
               str(api_code), time.time()-time1, create_sql, str(params))
 
+    # For CREATE TABLE ... SELECT this is the number of rows inserted
+    set_cache_table_row_count(cache_table_num, cursor.rowcount)
+
     cache.set(cache_key, cache_table_name)
     return cache_table_name
 
+def _create_cache_table_sql(cache_table_name, sql):
+    return ('CREATE TABLE '
+            + connection.ops.quote_name(cache_table_name)
+            + '(sort_order INT NOT NULL AUTO_INCREMENT, '
+            + 'PRIMARY KEY(sort_order), id INT UNSIGNED, '
+            + 'UNIQUE KEY(id)) '
+            + sql)
+
+def _create_derived_cache_table(selections, extras, cache_table_num,
+                                api_code):
+    """Create a cache table from the cache table of an earlier search.
+
+    Returns the name of the new table, or None if there's no suitable
+    earlier search or something went wrong, in which case the caller should
+    run the full search instead.
+    """
+    (base_num, added_selections,
+     same_order) = find_base_user_search(selections, extras)
+    if base_num is None:
+        return None
+    cache_table_name = get_user_search_table_name(cache_table_num)
+    sql, params = construct_derived_query_string(
+                                        get_user_search_table_name(base_num),
+                                        added_selections, extras, same_order)
+    if not sql: # pragma: no cover
+        return None
+    create_sql = _create_cache_table_sql(cache_table_name, sql)
+    cursor = connection.cursor()
+    try:
+        time1 = time.time()
+        cursor.execute(create_sql, tuple(params))
+    except DatabaseError as e: # pragma: no cover
+        if e.args[0] == MYSQL_TABLE_ALREADY_EXISTS:
+            return cache_table_name
+        # Most likely the base table was dropped after we found it
+        log.warning('get_user_query_table: "%s" with params "%s" failed with '
+                    +'%s; doing full search', create_sql, str(tuple(params)),
+                    str(e))
+        return None
+    log.debug('API %s (%.3f) get_user_query_table (derived from %s): %s '
+              +'*** PARAMS %s', str(api_code), time.time()-time1,
+              get_user_search_table_name(base_num), create_sql, str(params))
+    set_cache_table_row_count(cache_table_num, cursor.rowcount)
+    return cache_table_name
+
+def find_base_user_search(selections, extras):
+    """Find an earlier search whose cache table a new search can be built from.
+
+    Most users refine a search one constraint at a time, or only change the
+    sort order. In the first case the new results are the rows of the earlier
+    search's table that also match the added constraint, in the same order.
+    In the second they are the same rows sorted differently. Either way the
+    rest of the search doesn't need to be evaluated again.
+
+    Only earlier searches whose tables are complete (they have a row count)
+    are considered, and the smallest one is used. It is touched so it won't
+    be evicted while we use it.
 
-def set_user_search_number(selections, extras):
+    Returns (cache_table_num, added_selections, same_order), or
+    (None, None, None) if there is no such search.
+    """
+    if not selections:
+        return None, None, None
+
+    (_, selections_hash, _, qtypes_hash,
+     _, units_hash, _, order_hash) = _user_search_hashes(selections, extras)
+
+    q = connection.ops.quote_name
+    conditions = []
+    params = []
+    # (selections_hash, qtypes_hash, units_hash, order_hash) -> added selections
+    added_by_hashes = {}
+
+    # The same search with one constraint (both sides of a range, or all of a
+    # string's clauses) removed
+    groups = sorted(set([strip_numeric_suffix(x) for x in selections]))
+    if len(groups) > 1:
+        for group in groups:
+            base_selections = {}
+            added_selections = {}
+            for param_qualified_name, value in selections.items():
+                if strip_numeric_suffix(param_qualified_name) == group:
+                    added_selections[param_qualified_name] = value
+                else:
+                    base_selections[param_qualified_name] = value
+            (_, base_selections_hash, _, base_qtypes_hash,
+             _, base_units_hash, _, _) = _user_search_hashes(base_selections,
+                                                             extras)
+            added_by_hashes[(base_selections_hash, base_qtypes_hash,
+                             base_units_hash, order_hash)] = added_selections
+            conditions.append('('+q('selections_hash')+'=%s AND '
+                              +q('qtypes_hash')+'=%s AND '
+                              +q('units_hash')+'=%s AND '
+                              +q('order_hash')+'=%s)')
+            params += [base_selections_hash, base_qtypes_hash,
+                       base_units_hash, order_hash]
+
+    # The same search in a different order
+    conditions.append('('+q('selections_hash')+'=%s AND '
+                      +q('qtypes_hash')+'=%s AND '
+                      +q('units_hash')+'=%s AND '
+                      +q('order_hash')+'<>%s)')
+    params += [selections_hash, qtypes_hash, units_hash, order_hash]
+
+    sql = ('SELECT '+q('id')+','+q('selections_hash')+','+q('qtypes_hash')
+           +','+q('units_hash')+','+q('order_hash')
+           +' FROM '+q('user_searches')
+           +' WHERE '+q('row_count')+' IS NOT NULL AND ('
+           +' OR '.join(conditions)+')'
+           +' ORDER BY '+q('row_count')+','+q('id')+' DESC LIMIT 5')
+    cursor = connection.cursor()
+    try:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    except DatabaseError as e: # pragma: no cover
+        log.error('find_base_user_search: "%s" failed with %s', sql, str(e))
+        return None, None, None
+
+    for (num, row_selections_hash, row_qtypes_hash,
+         row_units_hash, row_order_hash) in rows:
+        if not touch_user_search(num):
+            continue
+        if row_order_hash != order_hash:
+            return num, {}, False
+        return num, added_by_hashes[(row_selections_hash, row_qtypes_hash,
+                                     row_units_hash, row_order_hash)], True
+    return None, None, None
+
+
+def set_user_search_number(selections, extras, use_cache=True):
     """Creates a new row in the user_searches table for each search request.
 
     This table lists query params+values plus any extra info needed to
     run a data search query.
     This method looks in user_searches table for current selections.
-    If none exist, creates it.
+    If none exist, creates it. If use_cache is False, the memory cache is
+    not consulted (because the number it holds is known to be stale).
 
     Returns the number of the cache table that should be used along with a flag
     indicating if this is a new entry in user_searches so the cache table
@@ -1046,6 +1199,72 @@ def set_user_search_number(selections, extras):
     if selections is None or extras is None: # pragma: no cover
         return None, False
 
+    (selections_json, selections_hash,
+     qtypes_json, qtypes_hash,
+     units_json, units_hash,
+     order_json, order_hash) = _user_search_hashes(selections, extras)
+
+    cache_key = user_search_number_cache_key(selections_hash, qtypes_hash,
+                                             units_hash, order_hash)
+    if use_cache:
+        cached_val = cache.get(cache_key)
+        if cached_val is not None:
+            return cached_val, False
+
+    # This operation has to be atomic because multiple threads may be trying
+    # to lookup/create the same selections entry at the same time. Thus,
+    # rather than looking it up, and then creating it if it doesn't exist
+    # (which leaves a nice hole for two threads to try to create it
+    # simultaneously), instead we go ahead and try to create it and let the
+    # UNIQUE CONSTRAINT on the hash fields throw an error if it already exists.
+    # That gives us an atomic write.
+    new_entry = False
+    s = UserSearches(selections_json=selections_json,
+                     selections_hash=selections_hash,
+                     qtypes_json=qtypes_json,
+                     qtypes_hash=qtypes_hash,
+                     units_json=units_json,
+                     units_hash=units_hash,
+                     order_json=order_json,
+                     order_hash=order_hash)
+    try:
+        s.save()
+        new_entry = True
+    except IntegrityError:
+        # This means it's already there and we tried to duplicate the constraint
+        try:
+            s = UserSearches.objects.get(selections_hash=selections_hash,
+                                         qtypes_hash=qtypes_hash,
+                                         units_hash=units_hash,
+                                         order_hash=order_hash)
+        except UserSearches.DoesNotExist: # pragma: no cover
+            # It was evicted by evict_cache_tables in the meantime
+            return None, False
+    except UserSearches.MultipleObjectsReturned: # pragma: no cover
+        # This really shouldn't be possible
+        s = UserSearches.objects.filter(selections_hash=selections_hash,
+                                        qtypes_hash=qtypes_hash,
+                                        units_hash=units_hash,
+                                        order_hash=order_hash)
+        s = s[0]
+        log.error('set_user_search_number: Multiple entries in user_searches'
+                  +' for *** Selections %s *** Qtypes %s *** Units %s '
+                  +' *** Order %s',
+                  str(selections_json),
+                  str(qtypes_json),
+                  str(units_json),
+                  str(order_json))
+
+    cache.set(cache_key, s.id)
+    return s.id, new_entry
+
+
+def _user_search_hashes(selections, extras):
+    """Return the JSON and hashes that identify a search in user_searches.
+
+    The result is (selections_json, selections_hash, qtypes_json,
+    qtypes_hash, units_json, units_hash, order_json, order_hash).
+    """
     selections_json = str(json.dumps(sort_dictionary(selections)))
     selections_hash = hashlib.md5(str.encode(selections_json)).hexdigest()
 
@@ -1089,57 +1308,8 @@ def set_user_search_number(selections, extras):
         order_json = str(json.dumps(extras['order']))
         order_hash = hashlib.md5(str.encode(order_json)).hexdigest()
 
-    cache_key = (settings.CACHE_SERVER_PREFIX + settings.CACHE_KEY_PREFIX
-                 +':usersearchno:selections_hash:' + str(selections_hash)
-                 +':qtypes_hash:' + str(qtypes_hash)
-                 +':units_hash:' + str(units_hash)
-                 +':order_hash:' + str(order_hash))
-    cached_val = cache.get(cache_key)
-    if cached_val is not None:
-        return cached_val, False
-
-    # This operation has to be atomic because multiple threads may be trying
-    # to lookup/create the same selections entry at the same time. Thus,
-    # rather than looking it up, and then creating it if it doesn't exist
-    # (which leaves a nice hole for two threads to try to create it
-    # simultaneously), instead we go ahead and try to create it and let the
-    # UNIQUE CONSTRAINT on the hash fields throw an error if it already exists.
-    # That gives us an atomic write.
-    new_entry = False
-    s = UserSearches(selections_json=selections_json,
-                     selections_hash=selections_hash,
-                     qtypes_json=qtypes_json,
-                     qtypes_hash=qtypes_hash,
-                     units_json=units_json,
-                     units_hash=units_hash,
-                     order_json=order_json,
-                     order_hash=order_hash)
-    try:
-        s.save()
-        new_entry = True
-    except IntegrityError:
-        # This means it's already there and we tried to duplicate the constraint
-        s = UserSearches.objects.get(selections_hash=selections_hash,
-                                     qtypes_hash=qtypes_hash,
-                                     units_hash=units_hash,
-                                     order_hash=order_hash)
-    except UserSearches.MultipleObjectsReturned: # pragma: no cover
-        # This really shouldn't be possible
-        s = UserSearches.objects.filter(selections_hash=selections_hash,
-                                        qtypes_hash=qtypes_hash,
-                                        units_hash=units_hash,
-                                        order_hash=order_hash)
-        s = s[0]
-        log.error('set_user_search_number: Multiple entries in user_searches'
-                  +' for *** Selections %s *** Qtypes %s *** Units %s '
-                  +' *** Order %s',
-                  str(selections_json),
-                  str(qtypes_json),
-                  str(units_json),
-                  str(order_json))
-
-    cache.set(cache_key, s.id)
-    return s.id, new_entry
+    return (selections_json, selections_hash, qtypes_json, qtypes_hash,
+            units_json, units_hash, order_json, order_hash)
 
 
 def get_param_info_by_slug(slug, source):
@@ -1168,87 +1338,12 @@ def get_param_info_by_slug(slug, source):
                   'numeric suffix', slug)
         return None
 
-    ret = None
-    # Current slug as given
-    try:
-        ret = ParamInfo.objects.get(slug=slug)
-    except ParamInfo.DoesNotExist:
-        pass
-
-    if not ret:
-        # Old slug as given
-        try:
-            ret = ParamInfo.objects.get(old_slug=slug)
-        except ParamInfo.DoesNotExist:
-            pass
-
-    if ret:
-        if source == 'search':
-            if slug[-1] in ('1', '2'):
-                # Search slug has 1/2, param_info has 1/2 - all is good
-                return ret
-            # For a single-column range, the slug we were given MUST end
-            # in a '1' or '2' - but for non-range types, it's OK to not
-            # have the '1' or '2'. Note the non-single-column ranges were
-            # already dealt with above.
-            (form_type, form_type_format,
-             form_type_unit_id) = parse_form_type(ret.form_type)
-            if form_type in settings.RANGE_FORM_TYPES: # pragma: no cover
-                # Whoops! We are missing the numeric suffix.
-                return None
-
+    # All the rules above have already been applied to every known slug
+    # when the registry was built
+    ret = lookup_param_info_by_slug(slug, source)
+    if ret is not None:
         return ret
 
-    # For widgets, if this is a multi-column range, return the version with
-    # the '1' suffix.
-    if source == 'widget':
-        try:
-            return ParamInfo.objects.get(slug=slug+'1')
-        except ParamInfo.DoesNotExist:
-            pass
-
-        try:
-            return ParamInfo.objects.get(old_slug=slug+'1')
-        except ParamInfo.DoesNotExist:
-            pass
-
-    # Q-types can never have a '1' or '2' suffix, but the database entries
-    # might.
-    if source == 'qtype' and slug[-1] not in ('1', '2'):
-        try:
-            return ParamInfo.objects.get(slug=slug+'1')
-        except ParamInfo.DoesNotExist:
-            pass
-
-        try:
-            return ParamInfo.objects.get(old_slug=slug+'1')
-        except ParamInfo.DoesNotExist:
-            pass
-
-    # Searching on a single-column range is done with '1' or '2' suffixes
-    # even though the database entry is just a single column without a numeric
-    # suffix.
-    if source == 'search' and (slug[-1] == '1' or slug[-1] == '2'):
-        ret = None
-        try:
-            ret = ParamInfo.objects.get(slug=slug[:-1])
-        except ParamInfo.DoesNotExist:
-            pass
-
-        if not ret:
-            try:
-                ret = ParamInfo.objects.get(old_slug=slug[:-1])
-            except ParamInfo.DoesNotExist:
-                pass
-
-        if ret:
-            (form_type, form_type_format,
-             form_type_unit_id) = parse_form_type(ret.form_type)
-            if form_type not in settings.RANGE_FORM_TYPES:
-                # Whoops! It's not a range, but we have a numeric suffix.
-                return None
-            return ret
-
     log.error('get_param_info_by_slug: Slug "%s" source "%s" not found',
               slug, source)
 
@@ -1260,8 +1355,12 @@ def get_param_info_by_slug(slug, source):
 #
 ################################################################################
 
-def construct_query_string(selections, extras):
-    """Given a set selections,extras generate the appropriate SQL SELECT"""
+def _construct_query_clauses(selections, extras):
+    """Return the WHERE clauses and tables needed for a set of selections.
+
+    The result is (clauses, clause_params, obs_tables, mult_tables), or None
+    if the selections are bad. The clauses are to be ANDed together.
+    """
     all_qtypes = extras['qtypes'] if 'qtypes' in extras else []
     all_units = extras['units'] if 'units' in extras else []
     finished_ranges = []    # Ranges are done for both sides at once so track
@@ -1286,7 +1385,7 @@ def construct_query_string(selections, extras):
                       +' *** Selections %s *** Extras *** %s',
                       param_qualified_name,
                       str(selections), str(extras))
-            return None, None
+            return None
         cat_name = param_info.category_name
         quoted_cat_name = connection.ops.quote_name(cat_name)
 
@@ -1300,7 +1399,7 @@ def construct_query_string(selections, extras):
             units = []
 
         (form_type, form_type_format,
-         form_type_unit_id) = parse_form_type(param_info.form_type)
+         form_type_unit_id) = param_info.parsed_form_type()
 
         if form_type in settings.MULT_FORM_TYPES:
             # This is where we convert from the "pretty" name the user selected
@@ -1319,7 +1418,7 @@ def construct_query_string(selections, extras):
                           +' *** Selections %s *** Extras *** %s',
                           param_qualified_name,
                           str(mult_values), str(selections), str(extras))
-                return None, None
+                return None
             if mult_values:
                 clause = (quoted_cat_name+'.'
                           +connection.ops.quote_name(mult_name))
@@ -1356,7 +1455,7 @@ def construct_query_string(selections, extras):
                                                  qtypes, units)
 
             if clause is None:
-                return None, None
+                return None
             if clause:
                 clauses.append(clause)
                 clause_params += params
@@ -1366,7 +1465,7 @@ def construct_query_string(selections, extras):
             clause, params = get_string_query(selections, param_qualified_name,
                                               qtypes)
             if clause is None:
-                return None, None
+                return None
             clauses.append(clause)
             clause_params += params
             obs_tables.add(cat_name)
@@ -1374,7 +1473,17 @@ def construct_query_string(selections, extras):
         else: # pragma: no cover
             log.error('construct_query_string: Unknown field type "%s" for '
                       +'param "%s"', form_type, param_qualified_name)
-            return None, None
+            return None
+
+    return clauses, clause_params, obs_tables, mult_tables
+
+
+def construct_query_string(selections, extras):
+    """Given a set selections,extras generate the appropriate SQL SELECT"""
+    ret = _construct_query_clauses(selections, extras)
+    if ret is None:
+        return None, None
+    clauses, clause_params, obs_tables, mult_tables = ret
 
     # Make the ordering SQL
     order_sql = ''
@@ -1393,8 +1502,63 @@ def construct_query_string(selections, extras):
     sql += connection.ops.quote_name('obs_general')+'.'
     sql += connection.ops.quote_name('id')
 
-    # Now JOIN all the obs_ tables together
+    # Now JOIN all the obs_ tables together and add in the WHERE clauses
     sql += ' FROM '+connection.ops.quote_name('obs_general')
+    sql += _construct_join_where_sql(clauses, obs_tables, mult_tables)
+
+    # Add in the ORDER BY clause
+    sql += order_sql
+
+    # log.debug('SEARCH SQL: %s *** PARAMS %s', sql, str(clause_params))
+    return sql, clause_params
+
+def construct_derived_query_string(base_table, added_selections, extras,
+                                   same_order):
+    """Generate the SQL SELECT for a search built from an earlier search.
+
+    The earlier search's cache table base_table is filtered by the
+    constraints in added_selections. If same_order is True the rows keep
+    their order in base_table, otherwise they are sorted again by
+    extras['order'].
+    """
+    ret = _construct_query_clauses(added_selections, extras)
+    if ret is None: # pragma: no cover
+        return None, None
+    clauses, clause_params, obs_tables, mult_tables = ret
+
+    quoted_base_table = connection.ops.quote_name(base_table)
+    if same_order:
+        order_sql = (' ORDER BY '+quoted_base_table+'.'
+                     +connection.ops.quote_name('sort_order'))
+    else:
+        order_sql = ''
+        if 'order' in extras:
+            order_params, descending_params = extras['order']
+            (order_sql, order_mult_tables,
+             order_obs_tables) = create_order_by_sql(order_params,
+                                                     descending_params)
+            if order_sql is None: # pragma: no cover
+                return None, None
+            mult_tables |= order_mult_tables
+            obs_tables |= order_obs_tables
+
+    sql = 'SELECT '
+    sql += connection.ops.quote_name('obs_general')+'.'
+    sql += connection.ops.quote_name('id')
+    sql += ' FROM '+quoted_base_table
+    sql += ' JOIN '+connection.ops.quote_name('obs_general')
+    sql += ' ON '+connection.ops.quote_name('obs_general')+'.'
+    sql += connection.ops.quote_name('id')+'='
+    sql += quoted_base_table+'.'+connection.ops.quote_name('id')
+    sql += _construct_join_where_sql(clauses, obs_tables, mult_tables)
+    sql += order_sql
+
+    return sql, clause_params
+
+def _construct_join_where_sql(clauses, obs_tables, mult_tables):
+    "Return the JOINs to obs_general and the WHERE part of a search query."
+    # JOIN all the obs_ tables together
+    sql = ''
     for table in sorted(obs_tables):
         if table == 'obs_general':
             continue
@@ -1420,11 +1584,7 @@ def construct_query_string(selections, extras):
         else:
             sql += ' AND '.join(['('+c+')' for c in clauses])
 
-    # Add in the ORDER BY clause
-    sql += order_sql
-
-    # log.debug('SEARCH SQL: %s *** PARAMS %s', sql, str(clause_params))
-    return sql, clause_params
+    return sql
 
 
 def _valid_regex(r):
@@ -1458,7 +1618,7 @@ def get_string_query(selections, param_qualified_name, qtypes):
         return None, None
 
     (form_type, form_type_format,
-     form_type_unit_id) = parse_form_type(param_info.form_type)
+     form_type_unit_id) = param_info.parsed_form_type()
 
     cat_name = param_info.category_name
     quoted_cat_name = connection.ops.quote_name(cat_name)
@@ -1546,7 +1706,7 @@ def get_range_query(selections, param_qualified_name, qtypes, units):
         return None, None
 
     (form_type, form_type_format,
-     form_type_unit_id) = parse_form_type(param_info.form_type)
+     form_type_unit_id) = param_info.parsed_form_type()
 
     param_qualified_name_no_num = strip_numeric_suffix(param_qualified_name)
     param_qualified_name_min = param_qualified_name_no_num + '1'
@@ -1556,7 +1716,7 @@ def get_range_query(selections, param_qualified_name, qtypes, units):
     values_max = selections.get(param_qualified_name_max, [])
 
     (form_type, form_type_format,
-     form_type_unit_id) = parse_form_type(param_info.form_type)
+     form_type_unit_id) = param_info.parsed_form_type()
 
     if qtypes is None or len(qtypes) == 0:
         qtypes = ['any'] * len(values_min)
@@ -1703,7 +1863,7 @@ def get_longitude_query(selections, param_qualified_name, qtypes, units):
         return None, None
 
     (form_type, form_type_format,
-     form_type_unit_id) = parse_form_type(param_info.form_type)
+     form_type_unit_id) = param_info.parsed_form_type()
 
     param_qualified_name_no_num = strip_numeric_suffix(param_qualified_name)
     param_qualified_name_min = param_qualified_name_no_num + '1'
@@ -1720,7 +1880,7 @@ def get_longitude_query(selections, param_qualified_name, qtypes, units):
     col_d_long = cat_name + '.d_' + name_no_num
 
     (form_type, form_type_format,
-     form_type_unit_id) = parse_form_type(param_info.form_type)
+     form_type_unit_id) = param_info.parsed_form_type()
 
     if qtypes is None or len(qtypes) == 0:
         qtypes = ['any'] * len(values_min)
@@ -1849,10 +2009,6 @@ def get_longitude_query(selections, param_qualified_name, qtypes, units):
 
     return clause, params
 
-def get_user_search_table_name(num):
-    """ pass cache_no, returns user search table name"""
-    return 'cache_' + str(num)
-
 
 ################################################################################
 #
@@ -1868,16 +2024,12 @@ def _get_param_info_by_qualified_name(param_qualified_name):
     cat_name = param_qualified_name.split('.')[0]
     name = param_qualified_name.split('.')[1]
 
-    try:
-        return ParamInfo.objects.get(category_name=cat_name, name=name)
-    except ParamInfo.DoesNotExist:
+    ret = lookup_param_info_by_qualified_name(cat_name, name)
+    if ret is None:
         # Single column range queries will not have the numeric suffix
         name_no_num = strip_numeric_suffix(name)
-        try:
-            return ParamInfo.objects.get(category_name=cat_name,
-                                         name=name_no_num)
-        except ParamInfo.DoesNotExist:
-            return None
+        ret = lookup_param_info_by_qualified_name(cat_name, name_no_num)
+    return ret
 
 
 def is_single_column_range(param_qualified_name):
@@ -1890,14 +2042,8 @@ def is_single_column_range(param_qualified_name):
 
     # Single column range queries will not have the numeric suffix
     name_no_num = strip_numeric_suffix(name)
-    try:
-        _ = ParamInfo.objects.get(category_name=cat_name,
-                                  name=name_no_num)
-        return True
-    except ParamInfo.DoesNotExist:
-        return False
-
-    return False
+    registry = get_param_info_registry()
+    return registry.by_qualified_name(cat_name, name_no_num) is not None
 
 
 def _clean_numeric_field(s):
@@ -1954,7 +2100,7 @@ def create_order_by_sql(order_params, descending_params):
                           +' slug "%s"', order_slug)
                 return None, None, None
             (form_type, form_type_format,
-             form_type_unit_id) = parse_form_type(pi.form_type)
+             form_type_unit_id) = pi.parsed_form_type()
             order_param = pi.param_qualified_name()
             order_obs_tables.add(pi.category_name)
             if form_type in settings.MULT_FORM_TYPES:
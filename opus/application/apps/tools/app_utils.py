@@ -15,7 +15,7 @@ import subprocess
 import time
 
 from django.core.exceptions import MultipleObjectsReturned, ObjectDoesNotExist
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 
 from search.models import ObsGeneral
 
@@ -37,6 +37,50 @@ def csv_response(filename, data, column_names=None):
 def json_response(data):
     return HttpResponse(json.dumps(data), content_type='application/json')
 
+class _EchoBuffer(object):
+    "A file-like object whose write() just returns what it was given"
+    def write(self, value):
+        return value
+
+def csv_streaming_response(filename, rows, column_names=None):
+    """Like csv_response, but rows can be any iterable and each row is sent
+    to the client as soon as it is available."""
+    # Non-streaming text responses have their \r's removed by
+    # StripWhitespaceMiddleware, so match that here
+    writer = csv.writer(_EchoBuffer(), lineterminator='\n')
+    def _generate():
+        if column_names:
+            yield writer.writerow(column_names)
+        for row in rows:
+            yield writer.writerow(row)
+    response = StreamingHttpResponse(_generate(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename={filename}.csv'
+    return response
+
+def json_streaming_response(data, list_key, rows, count_key=None):
+    """Like json_response, but data[list_key] is filled in from the iterable
+    rows, each of which is sent to the client as soon as it is available.
+    If count_key is given, the number of rows is added as data[count_key] at
+    the end."""
+    def _generate():
+        header = json.dumps(data)
+        if data:
+            yield header[:-1] + ', '
+        else:
+            yield '{'
+        yield json.dumps(list_key) + ': ['
+        count = 0
+        for row in rows:
+            if count:
+                yield ', '
+            yield json.dumps(row)
+            count += 1
+        yield ']'
+        if count_key is not None:
+            yield ', ' + json.dumps(count_key) + ': ' + str(count)
+        yield '}'
+    return StreamingHttpResponse(_generate(), content_type='application/json')
+
 def download_filename(opus_id, file_type):
     "Create a unique filename for a user's cart or CSV file."
     random_ascii = random.choice(string.ascii_letters).lower()
@@ -333,6 +377,11 @@ def HTTP404_UNKNOWN_DOWNLOAD_FILE_FORMAT(fmt, r):
         r = r.path
     return f'Unknown DOWNLOAD FILE FORMAT "{fmt}" for {r}'
 
+def HTTP404_UNKNOWN_DOWNLOAD_JOB(job_id, r):
+    if type(r) != str:
+        r = r.path
+    return f'Unknown download job "{job_id}" for {r}'
+
 def wrap_http500_string(s):
     # This duplicates the format for the Django debug page
     ret = f'<div id="info">{s}</div>'
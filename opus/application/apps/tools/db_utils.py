@@ -4,7 +4,11 @@
 #
 ################################################################################
 
+import json
+import time
+
 from django.apps import apps
+from django.db import connection, DatabaseError
 
 from tools.app_utils import get_mult_name
 
@@ -12,11 +16,117 @@ from opus_support import parse_form_type
 
 import settings
 
+import logging
+log = logging.getLogger(__name__)
+
 
 MYSQL_TABLE_NOT_EXISTS = 1146
 MYSQL_TABLE_ALREADY_EXISTS = 1050
 MYSQL_EXECUTION_TIME_EXCEEDED = 3024
 
+_IMPORT_VERSION = None
+_IMPORT_VERSION_CHECK_TIME = 0.
+
+def get_import_version():
+    """Return the version stamp written by the most recent import.
+
+    The import pipeline bumps this value whenever it changes the permanent
+    tables. In-memory caches of those tables use it to decide when they are
+    stale. To keep this cheap, the database is only consulted once every
+    IMPORT_VERSION_CHECK_INTERVAL seconds per process. If the import_version
+    table doesn't exist (an old database), '' is returned.
+    """
+    global _IMPORT_VERSION, _IMPORT_VERSION_CHECK_TIME
+    now = time.time()
+    if (_IMPORT_VERSION is not None and
+        now - _IMPORT_VERSION_CHECK_TIME < settings.IMPORT_VERSION_CHECK_INTERVAL):
+        return _IMPORT_VERSION
+
+    version = ''
+    sql = ('SELECT '+connection.ops.quote_name('version')
+           +' FROM '+connection.ops.quote_name('import_version')
+           +' WHERE '+connection.ops.quote_name('id')+'=1')
+    cursor = connection.cursor()
+    try:
+        cursor.execute(sql)
+        row = cursor.fetchone()
+        if row:
+            version = row[0]
+    except DatabaseError as e:
+        if e.args[0] != MYSQL_TABLE_NOT_EXISTS: # pragma: no cover
+            log.error('get_import_version: "%s" failed with %s', sql, str(e))
+
+    _IMPORT_VERSION = version
+    _IMPORT_VERSION_CHECK_TIME = now
+    return version
+
+_MULT_LABEL_MAPS = {}
+
+def get_mult_label_map(mult_name):
+    """Return a dict of all entries in a mult table.
+
+    The dict is keyed by mult id and contains (label, disp_order, value)
+    tuples. Mult tables only change during an import, so each one is read in
+    bulk once and kept until the import version changes. Returns None if
+    there is no model for the mult table.
+
+    The returned dict is shared and must not be modified.
+    """
+    version = get_import_version()
+    entry = _MULT_LABEL_MAPS.get(mult_name)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    try:
+        model = apps.get_model('search', mult_name.title().replace('_',''))
+    except LookupError:
+        log.error('get_mult_label_map: Could not get_model for %s',
+                  mult_name.title().replace('_',''))
+        return None
+
+    label_map = {row[0]: (row[1], row[2], row[3])
+                 for row in model.objects.values_list('id', 'label',
+                                                      'disp_order', 'value')}
+    _MULT_LABEL_MAPS[mult_name] = (version, label_map)
+    return label_map
+
+_PRECOMPUTED_METADATA = None
+
+def get_precomputed_metadata(name):
+    """Return a value computed by the import pipeline for the empty search.
+
+    The import pipeline stores the result count, range endpoints, and mult
+    counts for the unconstrained search in the precomputed_metadata table
+    (see import/do_precompute_metadata.py). The whole table is small, so it
+    is read once per import version. Returns None if there is no such value
+    (or no such table), in which case the caller must compute it.
+    """
+    global _PRECOMPUTED_METADATA
+    version = get_import_version()
+    entry = _PRECOMPUTED_METADATA
+    if entry is None or entry[0] != version:
+        values = {}
+        sql = ('SELECT '+connection.ops.quote_name('name')+','
+               +connection.ops.quote_name('value')
+               +' FROM '+connection.ops.quote_name('precomputed_metadata'))
+        cursor = connection.cursor()
+        try:
+            cursor.execute(sql)
+            for row_name, row_value in cursor.fetchall():
+                values[row_name] = row_value
+        except DatabaseError as e:
+            if e.args[0] != MYSQL_TABLE_NOT_EXISTS: # pragma: no cover
+                log.error('get_precomputed_metadata: "%s" failed with %s',
+                          sql, str(e))
+        entry = (version, values)
+        _PRECOMPUTED_METADATA = entry
+
+    value = entry[1].get(name)
+    if value is None:
+        return None
+    # Decoded each time so callers are free to modify the result
+    return json.loads(value)
+
 def table_model_from_name(table_name):
     "Given a table name (obs_pds) return the Django model class (ObsPds)"
     model_name = ''.join(table_name.title().split('_'))
@@ -35,6 +145,59 @@ def query_table_for_opus_id(table_name, opus_id):
         return table_model.objects.filter(opus_id=opus_id)
     return table_model.objects.filter(obs_general__opus_id=opus_id)
 
+def query_tables_for_opus_id(opus_id, table_columns):
+    """Return the given columns of many tables for a single opus_id.
+
+    table_columns is an ordered dict of table_name -> list of column names.
+    Rather than one query per table, the tables are LEFT JOINed to obs_general
+    on obs_general_id, METADATA_MAX_JOIN_TABLES at a time.
+
+    Returns None if opus_id isn't in obs_general. Otherwise returns a dict of
+    table_name -> {column_name: value}, with None for a table that doesn't
+    have a row for this observation. If a table has more than one row, the
+    first one is used. This can throw DatabaseError.
+    """
+    q = connection.ops.quote_name
+    q_general = q('obs_general')
+    table_names = list(table_columns.keys())
+    # Always run at least one query so we know whether the opus_id exists
+    groups = [table_names[i:i+settings.METADATA_MAX_JOIN_TABLES]
+              for i in range(0, len(table_names),
+                             settings.METADATA_MAX_JOIN_TABLES)] or [[]]
+    ret = {}
+    cursor = connection.cursor()
+    for group in groups:
+        select = [q_general+'.'+q('id')]
+        joins = []
+        # (table_name, column_names) in the order they appear in select
+        layout = []
+        for table_name in group:
+            q_table = q(table_name)
+            if table_name != 'obs_general':
+                joins.append('LEFT JOIN '+q_table+' ON '
+                             +q_table+'.'+q('obs_general_id')+'='
+                             +q_general+'.'+q('id'))
+            select.append(q_table+'.'+q('id'))
+            columns = table_columns[table_name]
+            select += [q_table+'.'+q(column) for column in columns]
+            layout.append((table_name, columns))
+        sql = ('SELECT '+','.join(select)+' FROM '+q_general+' '
+               +' '.join(joins)+' WHERE '+q_general+'.'+q('opus_id')+'=%s'
+               +' LIMIT 1')
+        cursor.execute(sql, [opus_id])
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        pos = 1
+        for table_name, columns in layout:
+            if row[pos] is None:
+                ret[table_name] = None
+            else:
+                ret[table_name] = dict(zip(columns,
+                                           row[pos+1:pos+1+len(columns)]))
+            pos += 1+len(columns)
+    return ret
+
 def lookup_pretty_value_for_mult(param_info, value, cvt_null):
     "Given a param_info for a mult and the mult value, return the pretty label"
     if param_info.form_type is None: # pragma: no cover
@@ -47,11 +210,14 @@ def lookup_pretty_value_for_mult(param_info, value, cvt_null):
         return None
 
     mult_param = get_mult_name(param_info.param_qualified_name())
-    model = apps.get_model('search', mult_param.title().replace('_',''))
+    label_map = get_mult_label_map(mult_param)
+    if label_map is None: # pragma: no cover
+        return None
 
-    results = model.objects.filter(id=value).values('value','label')
-    if not results: # pragma: no cover
+    result = label_map.get(value)
+    if result is None: # pragma: no cover
         return None
-    if not cvt_null and results[0]['value'] is None:
+    label, _, mult_value = result
+    if not cvt_null and mult_value is None:
         return None
-    return results[0]['label']
+    return label
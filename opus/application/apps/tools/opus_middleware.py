@@ -28,7 +28,8 @@ class StripWhitespaceMiddleware(object):
 
     def __call__(self, request):
         response = self.get_response(request)
-        if "text" in response['Content-Type']:
+        # Streaming responses have no content to rewrite
+        if not response.streaming and "text" in response['Content-Type']:
             # Use next line instead to avoid failure on cached / HTTP 304 NOT MODIFIED responses without Content-Type
             # if response.status_code == 200 and "text" in response['Content-Type']:
             decoded = response.content.decode()
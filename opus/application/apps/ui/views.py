@@ -33,7 +33,7 @@ from django.views.decorators.cache import never_cache
 from django.views.generic import TemplateView
 
 from cart.models import Cart
-from dictionary.models import Definitions
+from dictionary.views import get_def_for_tooltip
 from paraminfo.models import ParamInfo
 from results.views import get_triggered_tables
 from search.forms import SearchForm
@@ -601,15 +601,8 @@ def api_init_detail_page(request, **kwargs):
                 file_list[i] = {'filename': fn,
                                 'link': file_list[i]}
             product_info['files'] = file_list
-            try:
-                entry = Definitions.objects.get(
-                                    context__name='OPUS_PRODUCT_TYPE',
-                                    term=product_type[2])
-                product_info['tooltip'] = entry.definition
-            except Definitions.DoesNotExist:
-                log.error('No tooltip definition for OPUS_PRODUCT_TYPE "%s"',
-                          product_type[2])
-                product_info['tooltip'] = None
+            product_info['tooltip'] = get_def_for_tooltip(product_type[2],
+                                                          'OPUS_PRODUCT_TYPE')
             new_products[version][product_type[3]] = product_info
 
     context = {
@@ -0,0 +1,32 @@
+################################################################################
+#
+# download_worker.py
+#
+# Build cart download archives queued by __cart/download.json.
+#
+# This is only needed if settings.DOWNLOAD_JOB_WORKER is 'process'; otherwise
+# the archives are built by threads inside the web server processes.
+#
+# Usage: python download_worker.py [--poll-interval SECS] [--once]
+#
+################################################################################
+
+import argparse
+import logging
+
+import settings
+
+from cart.download_jobs import run_download_worker
+
+parser = argparse.ArgumentParser(
+    description='Build cart download archives queued by OPUS')
+parser.add_argument('--poll-interval', type=float, default=1.,
+                    help='How often to look for new jobs (seconds)')
+parser.add_argument('--once', action='store_true', default=False,
+                    help='Run all queued jobs and then exit')
+args = parser.parse_args()
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s %(levelname)s %(message)s')
+
+run_download_worker(args.poll_interval, once=args.once)
@@ -0,0 +1,42 @@
+################################################################################
+#
+# evict_cache_tables.py
+#
+# Drop the least recently used cache_NNN search result tables (see
+# search/cache_tables.py). Run this periodically, e.g. from cron every few
+# minutes.
+#
+# Usage: python evict_cache_tables.py [--max-count N] [--max-rows N]
+#                                     [--min-age SECS]
+#
+################################################################################
+
+import argparse
+import logging
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+
+import django
+django.setup()
+
+from search.cache_tables import evict_cache_tables
+
+parser = argparse.ArgumentParser(
+    description='Drop the least recently used OPUS search cache tables')
+parser.add_argument('--max-count', type=int, default=None,
+                    help='Keep at most this many tables '
+                         +'(default CACHE_TABLE_MAX_COUNT)')
+parser.add_argument('--max-rows', type=int, default=None,
+                    help='Keep at most this many rows in all tables '
+                         +'(default CACHE_TABLE_MAX_ROWS)')
+parser.add_argument('--min-age', type=int, default=None,
+                    help='Never drop a table used within this many seconds '
+                         +'(default CACHE_TABLE_MIN_AGE)')
+args = parser.parse_args()
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s %(levelname)s %(message)s')
+
+evict_cache_tables(max_count=args.max_count, max_rows=args.max_rows,
+                   min_age=args.min_age)
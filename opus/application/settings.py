@@ -296,7 +296,7 @@ SLUGS_NOT_IN_DB = ('browse', 'order', 'page', 'startobs',
                    'cols', 'col_chooser', 'detail', 'download',
                    'expanded_cats',
                    'gallery_data_viewer', 'ignorelog', 'limit', 'loc_type',
-                   'range', 'recyclebin', 'reqno', 'request',
+                   'range', 'recyclebin', 'reqno', 'request', 'slugs',
                    'types', 'url_cols', 'units', 'unselected_types', 'view',
                    'widgets', 'widgets2',
                    '__sessionid')
@@ -343,6 +343,9 @@ DEFAULT_STRINGCHOICE_LIMIT = 100
 
 SQL_MAX_LIMIT = 100000000 # Max size for a LIMIT clause
 
+# Number of rows read from the database at a time when streaming results
+SQL_STREAMING_FETCH_SIZE = 1000
+
 # More than this many rows in the cache table -> don't join it
 STRINGCHOICE_FULL_SEARCH_COUNT_THRESHOLD = 100000
 # Timeout for SELECT when joined with cache table
@@ -362,6 +365,38 @@ TEST_RESULT_COUNTS_AGAINST_INTERNAL_DB = False
 
 OPUS_FILE_VERSION = ''
 
+# How often (in seconds) each server process re-reads the import_version table
+# to see if its in-memory copies of param_info, table_names, etc. are stale
+IMPORT_VERSION_CHECK_INTERVAL = 30
+
+# The cache_NNN tables holding search results are evicted least recently used
+# first by evict_cache_tables.py when there are more than MAX_COUNT of them or
+# they hold more than MAX_ROWS rows in total. A table is never evicted within
+# MIN_AGE seconds of being used, which must be much longer than both the
+# longest request and TOUCH_INTERVAL, how often each table's last use time is
+# updated.
+CACHE_TABLE_MAX_COUNT = 5000
+CACHE_TABLE_MAX_ROWS = 200000000
+CACHE_TABLE_MIN_AGE = 60*60 # seconds
+CACHE_TABLE_TOUCH_INTERVAL = 60 # seconds
+
+# If True, a search that adds one constraint to (or only changes the order of)
+# an earlier search is done by filtering (or re-sorting) the earlier search's
+# cache table rather than searching all of the obs tables again
+SEARCH_REUSE_CACHE_TABLES = True
+
+# If True, api_get_mult_counts joins the mult table into its GROUP BY so that
+# labels, disp_orders, and counts all come back from a single query. If False,
+# the counts are matched against the in-memory mult label maps.
+MULT_COUNTS_USE_JOIN = False
+
+# The Details page fetches all of an observation's tables by joining them to
+# obs_general, this many tables per query (MySQL allows at most 61)
+METADATA_MAX_JOIN_TABLES = 30
+# Rendered api/metadata responses are cached per opus_id and format. Set to
+# False to always build them from the database.
+METADATA_CACHE_RESPONSES = True
+
 # OPUS supported cart download formats, a dictionary keyed by format, and value
 # is a tuple containing MIME type & accessing (w/r) modes for the format.
 DOWNLOAD_FORMATS = {
@@ -369,3 +404,33 @@ DOWNLOAD_FORMATS = {
     'tar': ('application/x-tar', 'w', 'r'),
     'tgz': ('application/gzip', 'w:gz', 'r:gz'), # same as .tar.gz, we will use .tgz here
 }
+
+# Cart download archives are built by download jobs (see cart/download_jobs.py).
+# The job files are kept here.
+DOWNLOAD_JOB_PATH = os.path.join(TAR_FILE_PATH, 'download_jobs')
+# 'thread' to build archives in a thread pool inside the web server process,
+# or 'process' if download_worker.py is running to build them
+DOWNLOAD_JOB_WORKER = 'thread'
+DOWNLOAD_JOB_WORKER_THREADS = 2
+# How long __cart/download.json waits for a job to finish before telling the
+# client to poll for it
+DOWNLOAD_JOB_WAIT_TIME = 10 # seconds
+# How long api/download/<opusid>.zip waits for someone else's identical build
+# to finish
+DOWNLOAD_JOB_MAX_WAIT_TIME = 300 # seconds
+# Finished archives are kept and reused for identical requests. The least
+# recently used are deleted when there are too many or they take too much
+# space, but never within MIN_AGE seconds of being used.
+DOWNLOAD_ARCHIVE_CACHE_MAX_SIZE = 100*1024*1024*1024
+DOWNLOAD_ARCHIVE_CACHE_MAX_COUNT = 10000
+DOWNLOAD_ARCHIVE_CACHE_MIN_AGE = 60*60 # seconds
+# The cache is checked after a job finishes at most this often
+DOWNLOAD_ARCHIVE_EVICT_INTERVAL = 60 # seconds
+# If the web server supports it (e.g. 'X-Sendfile' for Apache mod_xsendfile),
+# let it send the archive file instead of streaming it through Django
+DOWNLOAD_X_SENDFILE_HEADER = None
+# Number of threads used to read data products in parallel while building an
+# archive, and the most bytes of them that will be read ahead into memory at
+# once (larger files are copied into the archive without being read ahead)
+DOWNLOAD_READ_THREADS = 8
+DOWNLOAD_READ_AHEAD_MAX_SIZE = 64*1024*1024
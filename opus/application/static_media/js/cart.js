@@ -356,45 +356,62 @@ var o_cart = {
             url: url,
             dataType: "json",
             success: function(data) {
-                if (data.error !== undefined) {
-                    // hide the spinner and display error message in an open modal
-                    $(".op-download-links-contents .spinner").hide();
-                    $(".app-footer .op-download-links-btn").popover("update");
-                    $("#op-download-links-error-msg-modal .modal-body").text(data.error);
-                    $("#op-download-links-error-msg-modal").modal("show");
-                } else {
-                    // To dynamically update and display contents of an open popover, we have to make sure html
-                    // in both (1) #op-download-links (content when popover is initialized) and (2) .popover-body
-                    // (when popover is open) are synced up with updates. To achieve this, we have to call show
-                    // method from popover to update content, and make sure the selector managing DOM are selecting
-                    // the same elements in both #op-download-links and .popover-body. (length === 2).
-                    $(".op-download-links-btn").show();
-                    $(".app-footer .op-download-links-btn").popover("show");
-
-                    // Set the max height for the window of download links history
-                    $(".popover-body").css("max-height", downloadLinksPBMaxHeight);
-                    $(".op-download-links-contents .op-empty-history").remove();
-                    $(".op-download-links-contents .spinner").hide();
-                    let latestLink = $(`<li><a href = "${data.filename}" download>${data.filename}</a></li>`);
-                    $(".op-download-links-contents ul.op-zipped-files li:nth-child(1)").after(latestLink);
-                    $(".op-clear-history-btn").prop("disabled", false);
-                    $(".op-download-links-btn").removeClass("op-a-tag-btn-disabled");
-                    o_cart.enablePSinDownloadLinksWindow();
-                }
+                o_cart.handleDownloadResponse(data, errorMsg);
             },
             error: function(e) {
-                // hide the spinner and display error message in an open modal
-                $(".op-download-links-contents .spinner").hide();
-                $(".app-footer .op-download-links-btn").popover("update");
-                $("#op-download-links-error-msg-modal .modal-body").text(errorMsg);
-                $("#op-download-links-error-msg-modal").modal("show");
+                o_cart.handleDownloadResponse(null, errorMsg);
             },
-            complete: function() {
-                o_cart.downloadInProcess = false;
-            }
         });
     },
 
+    handleDownloadResponse: function(data, errorMsg) {
+        /**
+         * Display the result of __cart/download.json. Large archives are
+         * built in the background, in which case we are given a jobid and
+         * poll for the result.
+         */
+        if (data === null || data.error !== undefined) {
+            // hide the spinner and display error message in an open modal
+            $(".op-download-links-contents .spinner").hide();
+            $(".app-footer .op-download-links-btn").popover("update");
+            $("#op-download-links-error-msg-modal .modal-body").text(data === null ? errorMsg : data.error);
+            $("#op-download-links-error-msg-modal").modal("show");
+            o_cart.downloadInProcess = false;
+        } else if (data.jobid !== undefined) {
+            setTimeout(function() {
+                $.ajax({
+                    url: `/opus/__cart/download/status.json?jobid=${data.jobid}`,
+                    dataType: "json",
+                    success: function(statusData) {
+                        o_cart.handleDownloadResponse(statusData, errorMsg);
+                    },
+                    error: function(e) {
+                        o_cart.handleDownloadResponse(null, errorMsg);
+                    },
+                });
+            }, 2000);
+        } else {
+            // To dynamically update and display contents of an open popover, we have to make sure html
+            // in both (1) #op-download-links (content when popover is initialized) and (2) .popover-body
+            // (when popover is open) are synced up with updates. To achieve this, we have to call show
+            // method from popover to update content, and make sure the selector managing DOM are selecting
+            // the same elements in both #op-download-links and .popover-body. (length === 2).
+            $(".op-download-links-btn").show();
+            $(".app-footer .op-download-links-btn").popover("show");
+
+            // Set the max height for the window of download links history
+            $(".popover-body").css("max-height", downloadLinksPBMaxHeight);
+            $(".op-download-links-contents .op-empty-history").remove();
+            $(".op-download-links-contents .spinner").hide();
+            let latestLink = $(`<li><a href = "${data.filename}" download>${data.filename}</a></li>`);
+            $(".op-download-links-contents ul.op-zipped-files li:nth-child(1)").after(latestLink);
+            $(".op-clear-history-btn").prop("disabled", false);
+            $(".op-download-links-btn").removeClass("op-a-tag-btn-disabled");
+            o_cart.enablePSinDownloadLinksWindow();
+            o_cart.downloadInProcess = false;
+        }
+    },
+
     enablePSinDownloadLinksWindow: function() {
         /**
          * Initialize and update PS in download links window when the height
@@ -1,6 +1,8 @@
 # opus/application/test_api/test_cart_api.py
 
+import json
 import logging
+import os
 import requests
 from unittest import TestCase
 
@@ -12,7 +14,8 @@ from tools.app_utils import (HTTP404_BAD_OR_MISSING_RANGE,
                              HTTP404_BAD_RECYCLEBIN,
                              HTTP404_MISSING_OPUS_ID,
                              HTTP404_SEARCH_PARAMS_INVALID,
-                             HTTP404_UNKNOWN_DOWNLOAD_FILE_FORMAT)
+                             HTTP404_UNKNOWN_DOWNLOAD_FILE_FORMAT,
+                             HTTP404_UNKNOWN_DOWNLOAD_JOB)
 
 from api_test_helper import ApiTestHelper
 
@@ -2654,6 +2657,47 @@ class ApiCartTests(TestCase, ApiTestHelper):
         self._run_status_equal(url, 404,
                                HTTP404_UNKNOWN_DOWNLOAD_FILE_FORMAT('xxx', '/__cart/download.json'))
 
+    # Same cart and options again
+    def test__api_cart_download_reuse(self):
+        "[test_cart_api.py] /__cart/download.json: same download twice"
+        url = '/__cart/reset.json?reqno=42'
+        expected = {'recycled_count': 0, 'count': 0, 'reqno': 42}
+        self._run_json_equal(url, expected)
+        url = '/__cart/add.json?opusid=co-iss-n1462840881&reqno=456'
+        expected = {'recycled_count': 0, 'count': 1, 'error': False, 'reqno': 456}
+        self._run_json_equal(url, expected)
+        url = '/__cart/download.json?types=coiss_raw&hierarchical=0&urlonly=1'
+        print(url)
+        response = self._get_response(url)
+        self.assertEqual(response.status_code, 200)
+        filename1 = json.loads(response.content)['filename']
+        response = self._get_response(url)
+        self.assertEqual(response.status_code, 200)
+        filename2 = json.loads(response.content)['filename']
+        self.assertEqual(filename1, filename2)
+        path = filename1.replace(settings.TAR_FILE_URL_PATH,
+                                 settings.TAR_FILE_PATH)
+        if os.path.exists(path):
+            os.remove(path)
+
+            ###########################################################
+            ######### /__cart/download/status.json: API TESTS #########
+            ###########################################################
+
+    def test__api_cart_download_status_bad_jobid(self):
+        "[test_cart_api.py] /__cart/download/status.json: bad jobid"
+        url = '/__cart/download/status.json?jobid=../../etc/passwd'
+        self._run_status_equal(url, 404,
+                    HTTP404_UNKNOWN_DOWNLOAD_JOB('../../etc/passwd',
+                                                '/__cart/download/status.json'))
+
+    def test__api_cart_download_status_unknown_jobid(self):
+        "[test_cart_api.py] /__cart/download/status.json: unknown jobid"
+        url = '/__cart/download/status.json?jobid='+'0'*40
+        self._run_status_equal(url, 404,
+                    HTTP404_UNKNOWN_DOWNLOAD_JOB('0'*40,
+                                                '/__cart/download/status.json'))
+
             ###########################################################
             ######### /api/download/<opusid>.<fmt>: API TESTS #########
             ###########################################################
@@ -2711,6 +2755,22 @@ class ApiCartTests(TestCase, ApiTestHelper):
         expected = ['calibrated/COISS_2xxx/COISS_2008/data/1481264980_1481267140/N1481265970_1_CALIB.IMG', 'calibrated/COISS_2xxx/COISS_2008/data/1481264980_1481267140/N1481265970_1_CALIB.LBL', 'data.csv', 'manifest.csv', 'previews/COISS_2xxx/COISS_2008/data/1481264980_1481267140/N1481265970_1_full.png', 'urls.txt', 'volumes/COISS_2xxx/COISS_2008/data/1481264980_1481267140/N1481265970_1.IMG', 'volumes/COISS_2xxx/COISS_2008/data/1481264980_1481267140/N1481265970_1.LBL', 'volumes/COISS_2xxx/COISS_2008/label/prefix2.fmt', 'volumes/COISS_2xxx/COISS_2008/label/tlmtab.fmt']
         self._run_archive_file_equal(url, expected, response_type='binary', fmt='tgz')
 
+    def test__api_download_reuse_archive(self):
+        "[test_cart_api.py] /__api/download/<opusid>.zip: same archive reused"
+        url = '/__api/download/co-iss-n1481265970.zip?types=coiss_raw&hierarchical=0'
+        response1 = self._get_response(url)
+        self.assertEqual(response1.status_code, 200)
+        response2 = self._get_response(url)
+        self.assertEqual(response2.status_code, 200)
+        file = response1.headers['Content-Disposition']
+        self.assertEqual(file, response2.headers['Content-Disposition'])
+        self.assertEqual(response1.content, response2.content)
+        archive_file_path = settings.TAR_FILE_PATH + file[file.index('=')+1::]
+        if os.path.exists(archive_file_path):
+            os.remove(archive_file_path)
+        expected = ['N1481265970_1.IMG', 'N1481265970_1.LBL', 'data.csv', 'manifest.csv', 'prefix2.fmt', 'tlmtab.fmt', 'urls.txt']
+        self._run_archive_file_equal(url, expected, response_type='binary')
+
 
             ################################################
             ######### /__cart/view.html: API TESTS #########
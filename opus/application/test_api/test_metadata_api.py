@@ -297,6 +297,18 @@ class ApiMetadataTests(TestCase, ApiTestHelper):
                     "Polydeuces": 2, "Prometheus": 4, "Saturn": 1483, "Saturn Rings": 1040, "Sky": 90, "Telesto": 2, "Tethys": 11, "Titan": 384, "Unknown": 16}, "reqno": 3}
         self._run_json_equal(url, expected)
 
+    # Single-query JOIN path
+    def test__api_meta_mults_join(self):
+        "[test_metadata_api.py] /api/meta/meta/mults: join"
+        settings.MULT_COUNTS_USE_JOIN = True
+        try:
+            url = '/__api/meta/mults/target.json?volumeid=COISS_2111&reqno=1'
+            expected = {"field_id": "target", "mults": {"Atlas": 2, "Daphnis": 4, "Enceladus": 271, "Epimetheus": 27, "Hyrrokkin": 140, "Iapetus": 127, "Janus": 4, "Methone": 2, "Pallene": 2, "Pan": 56,
+                        "Polydeuces": 2, "Prometheus": 4, "Saturn": 1483, "Saturn Rings": 1040, "Sky": 90, "Telesto": 2, "Tethys": 11, "Titan": 384, "Unknown": 16}, "reqno": 1}
+            self._run_json_equal(url, expected)
+        finally:
+            settings.MULT_COUNTS_USE_JOIN = False
+
     # Unrelated constraints
     def test__api_meta_mults_COISS_2111(self):
         "[test_metadata_api.py] /api/meta/meta/mults: for COISS_2111"
@@ -441,6 +453,62 @@ class ApiMetadataTests(TestCase, ApiTestHelper):
                 HTTP404_UNKNOWN_SLUG('targetx', '/api/meta/mults/targetx.json'))
 
 
+            #####################################################
+            ######### /__api/meta/mults.json: API TESTS #########
+            #####################################################
+
+    def _run_mults_batch_matches_single(self, search, slugs):
+        url = f'/__api/meta/mults.json?{search}&slugs={",".join(slugs)}&reqno=5'
+        print(url)
+        response = self._get_response(url)
+        self.assertEqual(response.status_code, 200)
+        jdata = json.loads(response.content)
+        self.assertEqual(jdata['reqno'], 5)
+        self.assertEqual(list(jdata['mults'].keys()), slugs)
+        for slug in slugs:
+            single_url = f'/__api/meta/mults/{slug}.json?{search}&reqno=1'
+            response = self._get_response(single_url)
+            self.assertEqual(response.status_code, 200)
+            single_jdata = json.loads(response.content)
+            self.assertEqual(jdata['mults'][slug], single_jdata['mults'])
+
+    def test__api_meta_mults_batch_COISS_2111(self):
+        "[test_metadata_api.py] /__api/meta/mults.json: for COISS_2111"
+        url = '/__api/meta/mults.json?volumeid=COISS_2111&slugs=target&reqno=1'
+        expected = {"mults": {"target": {"Atlas": 2, "Daphnis": 4, "Enceladus": 271, "Epimetheus": 27, "Hyrrokkin": 140, "Iapetus": 127, "Janus": 4, "Methone": 2, "Pallene": 2, "Pan": 56,
+                    "Polydeuces": 2, "Prometheus": 4, "Saturn": 1483, "Saturn Rings": 1040, "Sky": 90, "Telesto": 2, "Tethys": 11, "Titan": 384, "Unknown": 16}}, "reqno": 1}
+        self._run_json_equal(url, expected)
+
+    def test__api_meta_mults_batch_same_table(self):
+        "[test_metadata_api.py] /__api/meta/mults.json: several mults in obs_general"
+        self._run_mults_batch_matches_single('volumeid=COISS_2111',
+                                             ['target', 'planet', 'instrument'])
+
+    def test__api_meta_mults_batch_selected(self):
+        "[test_metadata_api.py] /__api/meta/mults.json: mult also in search"
+        self._run_mults_batch_matches_single(
+                        'volumeid=COISS_2111&planet=Saturn&target=Pan',
+                        ['target', 'planet', 'mission'])
+
+    def test__api_meta_mults_batch_no_slugs(self):
+        "[test_metadata_api.py] /__api/meta/mults.json: no slugs"
+        url = '/__api/meta/mults.json?volumeid=COISS_2111&reqno=1'
+        self._run_status_equal(url, 404,
+                HTTP404_UNKNOWN_SLUG(None, '/__api/meta/mults.json'))
+
+    def test__api_meta_mults_batch_bad_slug(self):
+        "[test_metadata_api.py] /__api/meta/mults.json: bad slug"
+        url = '/__api/meta/mults.json?volumeid=COISS_2111&slugs=target,targetx&reqno=1'
+        self._run_status_equal(url, 404,
+                HTTP404_UNKNOWN_SLUG('targetx', '/__api/meta/mults.json'))
+
+    def test__api_meta_mults_batch_reqno_bad(self):
+        "[test_metadata_api.py] /__api/meta/mults.json: reqno bad"
+        url = '/__api/meta/mults.json?volumeid=COISS_2111&slugs=target&reqno=NaN'
+        self._run_status_equal(url, 404,
+                HTTP404_BAD_OR_MISSING_REQNO('/__api/meta/mults.json'))
+
+
             ########################################################
             ######### /api/meta/range/endpoints: API TESTS #########
             ########################################################
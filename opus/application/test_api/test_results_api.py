@@ -97,6 +97,63 @@ class ApiResultsTests(TestCase, ApiTestHelper):
         rev_nos2.sort(reverse=True)
         self.assertEqual(rev_nos, rev_nos2)
 
+    def test__api_data_startobs_pages(self):
+        "[test_results_api.py] /api/data: startobs pages match full results"
+        url = '/api/data.json?volumeid=COISS_2002&cols=opusid&limit=100000'
+        print(url)
+        response = self._get_response(url)
+        self.assertEqual(response.status_code, 200)
+        all_opus_ids = [x[0] for x in json.loads(response.content)['page']]
+        self.assertGreater(len(all_opus_ids), 150)
+        for start_obs, limit in ((1, 10), (101, 50),
+                                 (len(all_opus_ids)-5, 10),
+                                 (len(all_opus_ids)+1, 10)):
+            url = (f'/api/data.json?volumeid=COISS_2002&cols=opusid'
+                   f'&startobs={start_obs}&limit={limit}')
+            print(url)
+            response = self._get_response(url)
+            self.assertEqual(response.status_code, 200)
+            opus_ids = [x[0] for x in json.loads(response.content)['page']]
+            self.assertEqual(opus_ids,
+                             all_opus_ids[start_obs-1:start_obs-1+limit])
+
+    def test__api_data_limit_all_json(self):
+        "[test_results_api.py] /api/data: limit all json"
+        url = '/api/data.json?volumeid=COISS_2002&limit=100000'
+        print(url)
+        response = self._get_response(url)
+        self.assertEqual(response.status_code, 200)
+        expected = json.loads(response.content)
+        url = '/api/data.json?volumeid=COISS_2002&limit=all'
+        print(url)
+        response = self._get_response(url)
+        self.assertEqual(response.status_code, 200)
+        jdata = json.loads(response.content)
+        self.assertEqual(jdata['limit'], 'all')
+        self.assertEqual(jdata['count'], expected['count'])
+        self.assertEqual(jdata['available'], expected['available'])
+        self.assertEqual(jdata['labels'], expected['labels'])
+        self.assertEqual(jdata['page'], expected['page'])
+
+    def test__api_data_limit_all_csv(self):
+        "[test_results_api.py] /api/data: limit all csv"
+        url = '/api/data.csv?volumeid=COISS_2002&limit=100000'
+        print(url)
+        response = self._get_response(url)
+        self.assertEqual(response.status_code, 200)
+        expected = self._cleanup_csv(response.content)
+        url = '/api/data.csv?volumeid=COISS_2002&limit=all'
+        print(url)
+        response = self._get_response(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._cleanup_csv(response.content), expected)
+
+    def test__api_data_no_results_limit_all_json(self):
+        "[test_results_api.py] /api/data: no results limit all json"
+        url = '/api/data.json?opusid=notgoodid&cols=&limit=all'
+        expected = {"limit": "all", "available": 0, "page": [], "order": "time1,opusid", "count": 0, "labels": [], "columns": [], "start_obs": 1}
+        self._run_json_equal(url, expected)
+
     def test__api_data_no_results_default_json(self):
         "[test_results_api.py] /api/data: no results default cols json"
         url = '/api/data.json?opusid=notgoodid'
@@ -226,6 +283,12 @@ class ApiResultsTests(TestCase, ApiTestHelper):
         url = '/api/metadata_v2/S_IMG_VG2_ISS_4360845_N.json'
         self._run_json_equal_file(url, 'api_metadata2_vg_iss_2_s_c4360845_default_json.json')
 
+    def test__api_metadata2_vg_iss_2_s_c4360845_default_json_cached(self):
+        "[test_results_api.py] /api/metadata_v2: vg-iss-2-s-c4360845 default json twice"
+        url = '/api/metadata_v2/vg-iss-2-s-c4360845.json'
+        self._run_json_equal_file(url, 'api_metadata2_vg_iss_2_s_c4360845_default_json.json')
+        self._run_json_equal_file(url, 'api_metadata2_vg_iss_2_s_c4360845_default_json.json')
+
     def test__api_metadata_vg_iss_2_s_c4360845_default_html(self):
         "[test_results_api.py] /api/metadata: vg-iss-2-s-c4360845 default html"
         url = '/api/metadata/vg-iss-2-s-c4360845.html'
@@ -649,6 +712,13 @@ class ApiResultsTests(TestCase, ApiTestHelper):
         self._run_status_equal(url, 404,
             HTTP404_UNKNOWN_CATEGORY('/api/metadata/vg-iss-2-s-c4360845.json'))
 
+    def test__api_metadata_bad_cats_bad_opusid_json(self):
+        "[test_results_api.py] /api/metadata: bad cats and bad opusid json"
+        url = '/api/metadata/vg-iss-2-s-c4360845x.json?cats=obs_pds,whatever'
+        self._run_status_equal(url, 404,
+                        HTTP404_UNKNOWN_OPUS_ID('vg-iss-2-s-c4360845x',
+                                    '/api/metadata/vg-iss-2-s-c4360845x.json'))
+
     def test__api_metadata_bad_cats2_json(self):
         "[test_results_api.py] /api/metadata: bad cats 2 json"
         url = '/api/metadata/vg-iss-2-s-c4360845.json?cats=,obs_pds,obs_general'
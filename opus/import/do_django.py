@@ -4,6 +4,8 @@
 # Things related to Django and the OPUS UI.
 ################################################################################
 
+import datetime
+
 import impglobals
 import import_util
 
@@ -19,3 +21,42 @@ def drop_cache_tables():
     impglobals.DATABASE.drop_table('perm', 'user_searches')
     impglobals.DATABASE.create_table('perm', 'user_searches',
                                      user_search_schema)
+
+def update_user_searches_table():
+    """Add any columns that an existing user_searches table is missing.
+
+    user_searches is only recreated when the cache tables are dropped, so a
+    table made before a column was added to its schema won't have it.
+    """
+    db = impglobals.DATABASE
+    if not db.table_exists('perm', 'user_searches'):
+        return
+    existing_columns = [x['field_name']
+                        for x in db.table_info('perm', 'user_searches')]
+    user_search_schema = import_util.read_schema_for_table('user_searches')
+    prev_field_name = None
+    for column in user_search_schema:
+        if 'constraint' in column:
+            continue
+        field_name = column['field_name']
+        if field_name not in existing_columns:
+            impglobals.LOGGER.log('info',
+                        f'Adding column "{field_name}" to user_searches')
+            db.add_column('perm', 'user_searches', column,
+                          after=prev_field_name)
+        prev_field_name = field_name
+
+def bump_import_version():
+    """Record a new import version in the import_version table.
+
+    The running OPUS server compares this value against the one it saw last
+    and throws away any in-memory copies of permanent tables (param_info,
+    table_names, mult tables, etc.) when it changes.
+    """
+    db = impglobals.DATABASE
+    version = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')
+    impglobals.LOGGER.log('info', f'Setting import version to {version}')
+    import_version_schema = import_util.read_schema_for_table('import_version')
+    db.create_table('perm', 'import_version', import_version_schema)
+    db.upsert_row('perm', 'import_version', 'id',
+                  {'id': 1, 'version': version})
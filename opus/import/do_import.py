@@ -4,7 +4,10 @@
 # This is the actual top-level import process.
 ################################################################################
 
+import collections
 import csv
+import itertools
+import multiprocessing
 import os
 
 import pdsfile
@@ -15,6 +18,7 @@ from opus_support import (get_single_parse_function,
 from config_data import *
 import do_cart
 import do_django
+import do_import_manifest
 import impglobals
 import import_util
 
@@ -80,6 +84,9 @@ def delete_all_obs_mult_tables(namespace):
         if table_name.startswith('mult_'):
             impglobals.DATABASE.drop_table(namespace, table_name)
 
+    # The manifest describes the volumes in the obs tables, so it goes too
+    do_import_manifest.drop_manifest(namespace)
+
 
 def delete_volume_from_obs_tables(volume_id, namespace):
     "Delete a single volume from all import or permanent obs tables."
@@ -104,6 +111,8 @@ def delete_volume_from_obs_tables(volume_id, namespace):
     if 'obs_general' in table_names:
         impglobals.DATABASE.delete_rows(namespace, 'obs_general', where)
 
+    do_import_manifest.delete_volume_manifest(volume_id, namespace)
+
 
 def find_duplicate_opus_ids():
     """Find opus_ids that exist in both import and permanent tables.
@@ -160,10 +169,12 @@ def delete_duplicate_opus_id_from_perm_tables():
         delete_opus_id_from_obs_tables(opus_id, 'perm')
 
 
-def create_tables_for_import(volume_id, namespace):
+def create_tables_for_import(volume_id, namespace, defer_keys=False):
     """Create the import or permanent obs_ tables and all the mult tables they
        reference. This does NOT create the target-specific obs_surface_geometry
-       tables because we don't yet know what target names we have."""
+       tables because we don't yet know what target names we have. If
+       defer_keys is True, new obs_ tables are created without their keys,
+       and create_deferred_keys must be called once they have been filled."""
 
     volume_id_prefix = volume_id[:volume_id.find('_')]
     instrument_name = VOLUME_ID_PREFIX_TO_INSTRUMENT_NAME[volume_id_prefix]
@@ -227,7 +238,7 @@ def create_tables_for_import(volume_id, namespace):
                     _CREATED_IMP_MULT_TABLES.add(mult_name)
 
         impglobals.DATABASE.create_table(namespace, table_name,
-                                         table_schema)
+                                         table_schema, defer_keys=defer_keys)
 
     return table_schemas, table_names_in_order
 
@@ -270,13 +281,18 @@ def copy_volume_from_import_to_permanent(volume_id):
                                             replace=[
                ('<TARGET>', import_util.table_name_for_sfc_target(target_name)),
                ('<SLUGTARGET>', import_util.slug_name_for_sfc_target(target_name))])
-            impglobals.DATABASE.create_table('perm', table_name, table_schema)
+            # The keys are added by do_import_steps after all the volumes
+            # have been copied
+            impglobals.DATABASE.create_table('perm', table_name, table_schema,
+                                             defer_keys=True)
         impglobals.LOGGER.log('debug', f'Copying table "{table_name}"')
         where = f'{q("volume_id")}="{volume_id}"'
         impglobals.DATABASE.copy_rows_between_namespaces('import', 'perm',
                                                          table_name,
                                                          where=where)
 
+    do_import_manifest.copy_volume_manifest_to_permanent(volume_id)
+
 def read_existing_import_opus_id():
     """Return a list of all opus_id used in the import tables. Used to check
        for duplicates during import."""
@@ -318,6 +334,44 @@ _MULT_TABLE_CACHE = None
 _CREATED_IMP_MULT_TABLES = None
 _MODIFIED_MULT_TABLES = None
 
+class _MultTable(object):
+    """The cached contents of a mult table.
+
+    The rows are kept in their original order, which is the order they are
+    written back to the database. Everything update_mult_table needs to know
+    about them for each new value is kept up to date as rows are added so that
+    it doesn't have to look through all of the rows every time."""
+
+    def __init__(self, rows):
+        self.rows = []
+        self._id_by_value = {}
+        self.max_id = None
+        self.num_non_numeric_labels = 0
+        for row in rows:
+            self.append(row)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def find_id(self, value):
+        "Return the id of the first row with the given value, or None."
+        return self._id_by_value.get(value)
+
+    def append(self, row):
+        self.rows.append(row)
+        self._id_by_value.setdefault(row['value'], row['id'])
+        if self.max_id is None or row['id'] > self.max_id:
+            self.max_id = row['id']
+        label = row['label']
+        if (label is None or
+            str(label).upper() == 'NONE' or
+            str(label).upper() == 'NULL'):
+            return
+        try:
+            float(label)
+        except ValueError:
+            self.num_non_numeric_labels += 1
+
 def _mult_table_column_names(table_name):
     """Return a list of the columns found in a mult tables. This isn't
        constant because various *_target_name tables have an extra
@@ -361,9 +415,10 @@ def read_or_create_mult_table(mult_table_name, table_column):
         mult_rows = _convert_sql_response_to_mult_table(
                             mult_table_name,
                             table_column['mult_options'])
-        _MULT_TABLE_CACHE[mult_table_name] = mult_rows
+        mult_table = _MultTable(mult_rows)
+        _MULT_TABLE_CACHE[mult_table_name] = mult_table
         _MODIFIED_MULT_TABLES[mult_table_name] = table_column
-        return mult_rows
+        return mult_table
 
     # If there is already an import version of the table, it means this is a
     # second run of the import pipeline without copying over to the new
@@ -400,12 +455,13 @@ def read_or_create_mult_table(mult_table_name, table_column):
                     _mult_table_column_names(mult_table_name))
         mult_rows = _convert_sql_response_to_mult_table(mult_table_name,
                                                         rows)
-        _MULT_TABLE_CACHE[mult_table_name] = mult_rows
-        return mult_rows
+        mult_table = _MultTable(mult_rows)
+        _MULT_TABLE_CACHE[mult_table_name] = mult_table
+        return mult_table
 
-    rows = []
-    _MULT_TABLE_CACHE[mult_table_name] = rows
-    return rows
+    mult_table = _MultTable([])
+    _MULT_TABLE_CACHE[mult_table_name] = mult_table
+    return mult_table
 
 
 def update_mult_table(table_name, field_name, table_column, val, label,
@@ -416,10 +472,10 @@ def update_mult_table(table_name, field_name, table_column, val, label,
     mult_table = read_or_create_mult_table(mult_table_name, table_column)
     if val is not None:
         val = str(val)
-    for entry in mult_table:
-        if entry['value'] == val:
-            # The value is already in the mult table, so we're done here
-            return entry['id']
+    id_num = mult_table.find_id(val)
+    if id_num is not None:
+        # The value is already in the mult table, so we're done here
+        return id_num
 
     if 'mult_options' in table_column:
         import_util.log_nonrepeating_error(
@@ -438,17 +494,7 @@ def update_mult_table(table_name, field_name, table_column, val, label,
         parse_func = get_single_parse_function(form_type_unit_id)
 
         # See if all values in the mult table are numeric
-        all_numeric = True
-        for row in mult_table:
-            if (row['label'] is None or
-                str(row['label']).upper() == 'NONE' or
-                str(row['label']).upper() == 'NULL'):
-                continue
-            try:
-                float(row['label'])
-            except ValueError:
-                all_numeric = False
-                break
+        all_numeric = mult_table.num_non_numeric_labels == 0
         try:
             float(label)
         except ValueError:
@@ -493,7 +539,7 @@ f'Unable to parse "{label}" for type "range_func_name": {e}')
     if len(mult_table) == 0:
         next_id = 0
     else:
-        next_id = max([x['id'] for x in mult_table])+1
+        next_id = mult_table.max_id+1
     if label is None:
         label = 'N/A'
     new_entry = {
@@ -526,7 +572,7 @@ def dump_import_mult_tables():
     """Dump all of the cached import mult tables into the database."""
 
     for mult_table_name in sorted(_MODIFIED_MULT_TABLES):
-        rows = _MULT_TABLE_CACHE[mult_table_name]
+        rows = _MULT_TABLE_CACHE[mult_table_name].rows
         # Insert or update all the rows
         imp_mult_table_name = impglobals.DATABASE.convert_raw_to_namespace(
                 'import', mult_table_name)
@@ -580,6 +626,7 @@ def import_one_volume(volume_id):
     impglobals.ANNOUNCED_IMPORT_WARNINGS = []
     impglobals.ANNOUNCED_IMPORT_ERRORS = []
     impglobals.MAX_TABLE_ID_CACHE = {}
+    _TABLE_PLAN_CACHE.clear()
     impglobals.CURRENT_VOLUME_ID = volume_id
     impglobals.CURRENT_INDEX_ROW_NUMBER = None
 
@@ -590,6 +637,37 @@ def import_one_volume(volume_id):
         impglobals.CURRENT_VOLUME_ID = None
         return False
 
+    metadata_paths, index_labels = find_volume_index_labels(volume_pdsfile)
+    if not index_labels:
+        impglobals.LOGGER.log('error',
+            f'No appropriate label file found: "{volume_id}"')
+        impglobals.LOGGER.close()
+        impglobals.CURRENT_VOLUME_ID = None
+        return False
+
+    # If there is more than one index file (like for EBROCC), stop at the
+    # first one that fails
+    ret = True
+    for vol_prefix, volume_label_path in index_labels:
+        ret = ret and import_one_index(volume_id,
+                                       volume_pdsfile,
+                                       vol_prefix,
+                                       metadata_paths,
+                                       volume_label_path)
+    if ret:
+        do_import_manifest.record_volume_manifest(
+                volume_id, volume_input_files(metadata_paths, index_labels))
+    impglobals.LOGGER.close()
+    impglobals.CURRENT_VOLUME_ID = None
+    impglobals.CURRENT_INDEX_ROW_NUMBER = None
+    return ret
+
+def find_volume_index_labels(volume_pdsfile):
+    """Find the index files to import for a volume.
+
+    Returns (metadata_paths, index_labels), where index_labels is a list of
+    (vol_prefix, volume_label_path). The list is empty if no appropriate
+    label file was found."""
 
     #################################
     ### FIND RELEVANT INDEX FILES ###
@@ -611,7 +689,6 @@ def import_one_volume(volume_id):
     for path in paths:
         if not os.path.exists(path):
             continue
-        found_in_this_dir = False
         basenames = os.listdir(path)
         volume_label_path = None
         vol_prefix = ''
@@ -656,22 +733,14 @@ def import_one_volume(volume_id):
 
         if volume_label_path is not None:
             # Found that one and only label
-            ret = import_one_index(volume_id,
-                                   volume_pdsfile,
-                                   vol_prefix,
-                                   metadata_paths,
-                                   volume_label_path)
-            impglobals.LOGGER.close()
-            impglobals.CURRENT_VOLUME_ID = None
-            impglobals.CURRENT_INDEX_ROW_NUMBER = None
-            return ret
+            return metadata_paths, [(vol_prefix, volume_label_path)]
 
         # For the remaining, there might be more than one index file (like
         # for EBROCC), but we still give priority.
 
         # EBROCC - give preference to PROFILE_INDEX over INDEX
         # Otherwise just use normal INDEX
-        ret = True
+        index_labels = []
         for index_name in ('_PROFILE_INDEX.LBL', '_INDEX.LBL'):
             for basename in basenames:
                 if (basename.upper().endswith(index_name) and
@@ -680,27 +749,77 @@ def import_one_volume(volume_id):
                     volume_label_path = os.path.join(path, basename)
                     impglobals.LOGGER.log('debug',
                         f'Using index: {volume_label_path}')
-                    found_in_this_dir = True
                     vol_prefix = basename.replace(index_name, '')
                     vol_prefix = vol_prefix.replace(index_name.lower(), '')
-                    ret = ret and import_one_index(volume_id,
-                                                   volume_pdsfile,
-                                                   vol_prefix,
-                                                   metadata_paths,
-                                                   volume_label_path)
-
-            if found_in_this_dir:
-                impglobals.LOGGER.close()
-                impglobals.CURRENT_VOLUME_ID = None
-                impglobals.CURRENT_INDEX_ROW_NUMBER = None
-                return ret
-
-    impglobals.LOGGER.log('error',
-        f'No appropriate label file found: "{volume_id}"')
-    impglobals.LOGGER.close()
-    impglobals.CURRENT_VOLUME_ID = None
+                    index_labels.append((vol_prefix, volume_label_path))
+
+            if index_labels:
+                return metadata_paths, index_labels
 
-    return False
+    return metadata_paths, []
+
+def volume_label_paths(metadata_paths, index_labels):
+    """Return all the labels of the tables import_one_index reads for the
+       index labels returned by find_volume_index_labels."""
+    label_paths = []
+    for vol_prefix, volume_label_path in index_labels:
+        label_paths.append(volume_label_path)
+        for path in metadata_paths:
+            label_paths += [x[1] for x in
+                            associated_label_paths(path, vol_prefix)]
+    return label_paths
+
+def volume_input_files(metadata_paths, index_labels):
+    "Return all the files import_one_index reads, labels and tables."
+    return do_import_manifest.input_files_for_labels(
+                        volume_label_paths(metadata_paths, index_labels))
+
+def associated_label_paths(metadata_path, vol_prefix):
+    """Yield (basename, label_path) for the associated metadata files
+    (summary, supplemental index, and inventory) in a metadata directory."""
+    assoc_pdsfile = pdsfile.PdsFile.from_logical_path(metadata_path)
+    basenames = assoc_pdsfile.childnames
+    for basename in basenames:
+        if basename.find('999') != -1:
+            # These are cumulative geo files
+            continue
+        if vol_prefix != '' and not basename.startswith(vol_prefix):
+            continue
+        if (not basename.upper().endswith('SUMMARY.LBL') and
+            not basename.upper().endswith('SUPPLEMENTAL_INDEX.LBL') and
+            not basename.upper().endswith('INVENTORY.LBL')):
+            continue
+        yield basename, os.path.join(assoc_pdsfile.abspath, basename)
+
+def read_index_table(label_path):
+    """Read an index or associated metadata table as a list of row dicts.
+       Returns (rows, label_dict), or (None, None) if the read failed. Tables
+       already read by a worker process (see --processes) are used as is."""
+    if label_path in _PREREAD_TABLES:
+        return _PREREAD_TABLES.pop(label_path)
+
+    if not label_path.upper().endswith('INVENTORY.LBL'):
+        return import_util.safe_pdstable_read(label_path)
+
+    # The pdstable.py module can't read non-fixed-length records
+    # so we fake it up ourselves here.
+    table_filename = (label_path.replace('.LBL', '.CSV')
+                      .replace('.lbl', '.csv'))
+    rows = []
+    label_dict = {} # Not used
+    with open(table_filename, 'r') as table_file:
+        csvreader = csv.reader(table_file)
+        for row in csvreader:
+            (csv_volume, csv_filespec, csv_ringobsid,
+             *csv_targets) = row
+            row_dict = {'VOLUME_ID': csv_volume.strip(),
+                        'FILE_SPECIFICATION_NAME':
+                                     csv_filespec.strip(),
+                        'OPUS_ID':
+                                     csv_ringobsid.strip(),
+                        'TARGET_LIST': csv_targets}
+            rows.append(row_dict)
+    return rows, label_dict
 
 
 def import_one_index(volume_id, volume_pdsfile, vol_prefix, metadata_paths,
@@ -710,7 +829,7 @@ def import_one_index(volume_id, volume_pdsfile, vol_prefix, metadata_paths,
     mission_abbrev = VOLUME_ID_PREFIX_TO_MISSION_ABBREV[volume_id_prefix]
     volset = volume_pdsfile.volset
 
-    obs_rows, obs_label_dict = import_util.safe_pdstable_read(volume_label_path)
+    obs_rows, obs_label_dict = read_index_table(volume_label_path)
     if not obs_rows:
         impglobals.LOGGER.log('error', f'Read failed: "{volume_label_path}"')
         return False
@@ -738,43 +857,10 @@ def import_one_index(volume_id, volume_pdsfile, vol_prefix, metadata_paths,
 
     if metadata_paths:
         for path in metadata_paths:
-            assoc_pdsfile = pdsfile.PdsFile.from_logical_path(path)
-            basenames = assoc_pdsfile.childnames
-            for basename in basenames:
-                if basename.find('999') != -1:
-                    # These are cumulative geo files
-                    continue
-                if vol_prefix != '' and not basename.startswith(vol_prefix):
-                    continue
-                if (not basename.upper().endswith('SUMMARY.LBL') and
-                    not basename.upper().endswith('SUPPLEMENTAL_INDEX.LBL') and
-                    not basename.upper().endswith('INVENTORY.LBL')):
-                    continue
-                assoc_label_path = os.path.join(assoc_pdsfile.abspath,
-                                                basename)
-                if not basename.upper().endswith('INVENTORY.LBL'):
-                    (assoc_rows,
-                     assoc_label_dict) = import_util.safe_pdstable_read(
-                                                            assoc_label_path)
-                else:
-                    # The pdstable.py module can't read non-fixed-length records
-                    # so we fake it up ourselves here.
-                    table_filename = (assoc_label_path.replace('.LBL', '.CSV')
-                                      .replace('.lbl', '.csv'))
-                    assoc_rows = []
-                    assoc_label_dict = {} # Not used
-                    with open(table_filename, 'r') as table_file:
-                        csvreader = csv.reader(table_file)
-                        for row in csvreader:
-                            (csv_volume, csv_filespec, csv_ringobsid,
-                             *csv_targets) = row
-                            row_dict = {'VOLUME_ID': csv_volume.strip(),
-                                        'FILE_SPECIFICATION_NAME':
-                                                     csv_filespec.strip(),
-                                        'OPUS_ID':
-                                                     csv_ringobsid.strip(),
-                                        'TARGET_LIST': csv_targets}
-                            assoc_rows.append(row_dict)
+            for basename, assoc_label_path in associated_label_paths(
+                                                            path, vol_prefix):
+                (assoc_rows,
+                 assoc_label_dict) = read_index_table(assoc_label_path)
                 if not assoc_rows:
                     # No need to report an error here because safe_pdstable_read
                     # will have already done so
@@ -1233,8 +1319,8 @@ def import_one_index(volume_id, volume_pdsfile, vol_prefix, metadata_paths,
                                 'import', table_name)
             impglobals.LOGGER.log('debug',
                 f'Inserting into obs table "{imp_name}"')
-            impglobals.DATABASE.insert_rows('import', table_name,
-                                            table_rows[table_name])
+            impglobals.DATABASE.load_rows('import', table_name,
+                                          table_rows[table_name])
         else:
             for target_name in sorted(used_targets):
                 new_table_name = table_name.replace(
@@ -1254,26 +1340,370 @@ def import_one_index(volume_id, volume_pdsfile, vol_prefix, metadata_paths,
                 # we have
                 impglobals.DATABASE.create_table('import', new_table_name,
                                                  surface_geo_schema)
-                impglobals.DATABASE.insert_rows('import', new_table_name,
+                impglobals.DATABASE.load_rows('import', new_table_name,
                     table_rows[new_table_name])
 
     return True # SUCCESS!
 
 
-def import_observation_table(volume_id,
-                             volset,
-                             instrument_name,
-                             func_instrument_name,
-                             mission_abbrev,
-                             volume_type,
-                             table_name,
-                             table_schema,
-                             metadata):
-    "Import the data from a row from a PDS file into a single table."
-    new_row = {}
+# Everything import_observation_table needs to know about the columns of a
+# table that doesn't depend on the row being imported - the column order, the
+# parsed data sources with their populate_* functions already looked up, the
+# validation rules, and the mult columns - is worked out the first time the
+# table is seen for a volume and kept here so that it isn't redone for every
+# row. The key is (table_name, instrument_name, func_instrument_name).
+_TABLE_PLAN_CACHE = {}
+
+# A column plan:
+#   field_name          The column
+#   steps               The data sources in order, each a function
+#                       step(metadata, error_list) that returns None to go on
+#                       to the next one or (column_val, mult_label,
+#                       mult_label_set, disp_order) when done; None if the
+#                       column has no data source
+#   validate            Function validate(column_val) that returns the value
+#                       to store
+#   mult_column_name    The mult_ column to fill in, or None
+#   table_column        The schema entry for the column
+_ColumnPlan = collections.namedtuple('_ColumnPlan',
+                                     ['field_name', 'steps', 'validate',
+                                      'mult_column_name', 'table_column'])
+
+# The result of a data source that is done but has no value
+_NULL_RESULT = (None, None, False, None)
+
+def _null_step(metadata, error_list):
+    return _NULL_RESULT
+
+def _make_tab_step(ref_name, ref_column, field_name, table_name):
+    "A TAB:<name> data source - a column of another metadata row."
+    row_key = ref_name+'_row'
+    def tab_step(metadata, error_list):
+        if row_key not in metadata:
+            if ref_name != 'ring_geo':
+                # If we don't have ring_geo for this volume, don't
+                # bitch about it because we already did earlier.
+                error_list.append(
+                    'Unknown internal metadata name '+
+                    f'"{ref_name}"'+
+                    f' while processing column "{field_name}" in '+
+                    f'table "{table_name}"')
+            return None
+        ref_index_row = metadata[row_key]
+        if ref_index_row is None:
+            import_util.log_nonrepeating_warning(
+                'Missing row in metadata file '+
+                f'"{ref_name}"')
+            return _NULL_RESULT
+        if ref_column not in ref_index_row:
+            error_list.append(
+                    'Unknown referenced column '+
+                    f'"{ref_column}" '+
+                    f'while processing column "{field_name}" in '+
+                    f'table "{table_name}"')
+            return None
+        return (import_util.safe_column(ref_index_row, ref_column),
+                None, False, None)
+    return tab_step
+
+def _make_array_step(data_source_cmd_param, ref_column, field_name,
+                     table_name):
+    "An ARRAY:<name>.<index> data source - an element of a metadata column."
+    (ref_index_name,
+     array_index) = data_source_cmd_param.split('.')
+    array_index = int(array_index)
+    row_key = ref_index_name+'_row'
+    def array_step(metadata, error_list):
+        if row_key not in metadata:
+            if data_source_cmd_param != 'ring_geo':
+                # If we don't have ring_geo for this volume, don't
+                # bitch about it because we already did earlier.
+                error_list.append(
+                    'Unknown internal metadata name '+
+                    f'"{ref_index_name}"'+
+                    f' while processing column "{field_name}" in '+
+                    f'table "{table_name}"')
+            return None
+        ref_index_row = metadata[row_key]
+        if ref_index_row is None:
+            import_util.log_nonrepeating_warning(
+                'Missing row in metadata file '+
+                f'"{data_source_cmd_param}"')
+            return _NULL_RESULT
+        if ref_column not in ref_index_row:
+            error_list.append(
+                    'Unknown referenced column '+
+                    f'"{ref_column}" '+
+                    f'while processing table "{table_name}"')
+            return None
+        if (array_index < 0 or
+            array_index >= len(ref_index_row[ref_column])):
+            import_util.log_nonrepeating_error(
+                f'Bad array index "{array_index}" for column '+
+                f'"{field_name}" in table "{table_name}"')
+            return _NULL_RESULT
+        return (import_util.safe_column(ref_index_row, ref_column,
+                                        array_index),
+                None, False, None)
+    return array_step
+
+def _make_function_step(func_name_suffix, volume_id, volset, instrument_name,
+                        func_instrument_name, mission_abbrev, volume_type,
+                        table_name, table_schema, field_name):
+    "A FUNCTION:<name> data source - the Python function populate_<name>."
+    not_exists_is_ok = False
+    if func_name_suffix[0] == '~':
+        not_exists_is_ok = True
+        func_name_suffix = func_name_suffix[1:]
 
-    # So it can be accessed by populate_*
-    metadata[table_name+'_row'] = new_row
+    func_name = 'populate_'+func_name_suffix
+    func_name = func_name.replace('<INST>', func_instrument_name)
+    func_name = func_name.replace('<MISSION>', mission_abbrev)
+    func_name = func_name.replace('<TYPE>', volume_type)
+    func = globals().get(func_name)
+
+    def function_step(metadata, error_list):
+        if func is None:
+            # Function doesn't exist
+            if not not_exists_is_ok:
+                import_util.log_nonrepeating_error(
+                    f'Unknown table populate function "{func_name}" for '+
+                    f'"{field_name}" in table "{table_name}"')
+            return None
+        ret = func(volume_id=volume_id, volset=volset,
+                   instrument_name=instrument_name,
+                   mission_abbrev=mission_abbrev,
+                   table_name=table_name, table_schema=table_schema,
+                   metadata=metadata)
+        if isinstance(ret, tuple) or isinstance(ret, list):
+            if len(ret) == 3:
+                return (ret[0], ret[1], True, ret[2])
+            return (ret[0], ret[1], True, None)
+        return (ret, None, False, None)
+    return function_step
+
+def _make_max_id_step(table_name):
+    "A MAX_ID data source - the next unused id for the table."
+    def max_id_step(metadata, error_list):
+        if table_name not in impglobals.MAX_TABLE_ID_CACHE:
+            impglobals.MAX_TABLE_ID_CACHE[table_name] = (
+                import_util.find_max_table_id(table_name))
+        impglobals.MAX_TABLE_ID_CACHE[table_name] = (
+            impglobals.MAX_TABLE_ID_CACHE[table_name]+1)
+        return (impglobals.MAX_TABLE_ID_CACHE[table_name], None, False, None)
+    return max_id_step
+
+def _make_value_step(column_val):
+    "A VALUESTR, VALUEREAL, or VALUEINT data source - a constant."
+    result = (column_val, None, False, None)
+    def value_step(metadata, error_list):
+        return result
+    return value_step
+
+def _make_unknown_step(data_source_cmd, field_name, table_name):
+    def unknown_step(metadata, error_list):
+        import_util.log_nonrepeating_error(
+            f'Unknown data_source type "{data_source_cmd}" for'+
+            f'"{field_name}" in table "{table_name}"')
+        return _NULL_RESULT
+    return unknown_step
+
+def _compile_data_source_steps(volume_id, volset, instrument_name,
+                               func_instrument_name, mission_abbrev,
+                               volume_type, table_name, table_schema,
+                               field_name, data_source_tuple):
+    """Turn a column's data_source list into a list of data source steps.
+       Data sources that always finish the column end the list."""
+    steps = []
+    data_source_offset = 0
+    while data_source_offset < len(data_source_tuple):
+        data_source_cmd = data_source_tuple[data_source_offset]
+        if data_source_cmd.find(':') != -1:
+            (data_source_cmd_prefix,
+             data_source_cmd_param) = data_source_cmd.split(':')
+        else:
+            data_source_cmd_prefix = data_source_cmd
+            data_source_cmd_param = None
+
+        if data_source_cmd_prefix == 'IGNORE':
+            steps.append(_null_step)
+            break
+
+        data_source_data = data_source_tuple[data_source_offset+1]
+
+        if data_source_cmd_prefix.startswith('TAB'):
+            data_source_offset += 2
+            steps.append(_make_tab_step(data_source_cmd_param,
+                                        data_source_data,
+                                        field_name, table_name))
+            continue
+
+        if data_source_cmd_prefix.startswith('ARRAY'):
+            data_source_offset += 2
+            steps.append(_make_array_step(data_source_cmd_param,
+                                          data_source_data,
+                                          field_name, table_name))
+            continue
+
+        if data_source_cmd_prefix == 'FUNCTION':
+            data_source_offset += 2
+            steps.append(_make_function_step(data_source_data,
+                                             volume_id,
+                                             volset,
+                                             instrument_name,
+                                             func_instrument_name,
+                                             mission_abbrev,
+                                             volume_type,
+                                             table_name,
+                                             table_schema,
+                                             field_name))
+            continue
+
+        if data_source_cmd_prefix == 'MAX_ID':
+            steps.append(_make_max_id_step(table_name))
+            break
+
+        if data_source_cmd_prefix == 'VALUESTR':
+            steps.append(_make_value_step(data_source_data))
+            break
+
+        if data_source_cmd_prefix == 'VALUEREAL':
+            steps.append(_make_value_step(float(data_source_data)))
+            break
+
+        if data_source_cmd_prefix == 'VALUEINT':
+            steps.append(_make_value_step(int(data_source_data)))
+            break
+
+        steps.append(_make_unknown_step(data_source_cmd, field_name,
+                                        table_name))
+        break
+
+    return steps
+
+def _compile_column_validator(table_name, table_column):
+    """Return a function that checks a column value against the column's
+       type and limits and returns the value to store."""
+    field_name = table_column['field_name']
+    field_type = table_column['field_type']
+    notnull = table_column.get('field_notnull', False)
+
+    is_flag = field_type.startswith('flag')
+    is_char = field_type.startswith('char')
+    is_real = field_type.startswith('real')
+    is_int = field_type.startswith('int') or field_type.startswith('uint')
+    if is_char:
+        field_size = int(field_type[4:])
+    val_sentinel = table_column.get('val_sentinel', None)
+    if type(val_sentinel) != list:
+        val_sentinel = [val_sentinel]
+    val_min = table_column.get('val_min', None)
+    val_max = table_column.get('val_max', None)
+    val_use_null = table_column.get('val_set_invalid_to_null', False)
+
+    def validate(column_val):
+        if column_val is None:
+            if notnull:
+                import_util.log_nonrepeating_error(
+                    f'Column "{field_name}" in table "{table_name}" '+
+                    'has NULL value but NOT NULL is set')
+            return None
+
+        if is_flag:
+            if column_val in [0, 'n', 'N', 'no', 'No', 'NO', 'off', 'OFF']:
+                if field_type == 'flag_onoff':
+                    column_val = 'Off'
+                else:
+                    column_val = 'No'
+            elif column_val in [1, 'y', 'Y', 'yes', 'Yes', 'YES', 'on',
+                                'ON']:
+                if field_type == 'flag_onoff':
+                    column_val = 'On'
+                else:
+                    column_val = 'Yes'
+            elif column_val in ['N/A', 'UNK', 'NULL']:
+                column_val = None
+            else:
+                import_util.log_nonrepeating_error(
+                    f'Column "{field_name}" in table "{table_name}" '+
+                    f'has FLAG type but value "{column_val}" is not '+
+                    'a valid flag value')
+                column_val = None
+        if is_char:
+            if not isinstance(column_val, str):
+                import_util.log_nonrepeating_error(
+                    f'Column "{field_name}" in table "{table_name}" '+
+                    f'has CHAR type but value "{column_val}" is of '+
+                    f'type "{type(column_val)}"')
+                column_val = ''
+            elif len(column_val) > field_size:
+                import_util.log_nonrepeating_error(
+                    f'Column "{field_name}" in table "{table_name}" '+
+                    f'has CHAR size {field_size} but value '+
+                    f'"{column_val}" is too long')
+                column_val = column_val[:field_size]
+        elif is_real or is_int:
+            the_val = None
+            if is_real:
+                try:
+                    the_val = float(column_val)
+                except ValueError:
+                    import_util.log_nonrepeating_error(
+                        f'Column "{field_name}" in table '+
+                        f'"{table_name}" has REAL type but '+
+                        f'"{column_val}" is not a float')
+                    column_val = None
+            else:
+                try:
+                    the_val = int(column_val)
+                except ValueError:
+                    import_util.log_nonrepeating_error(
+                        f'Column "{field_name}" in table '+
+                        f'"{table_name}" has INT type but '+
+                        f'"{column_val}" is not an int')
+                    column_val = None
+            if column_val is not None and the_val is not None:
+                if the_val in val_sentinel:
+                    column_val = None
+                    import_util.log_nonrepeating_error(
+                        f'Caught sentinel value {the_val} for column '+
+                        f'"{field_name}" that was missed'+
+                        ' by the PDS label!')
+            if column_val is not None and the_val is not None:
+                if val_min is not None and the_val < val_min:
+                    if val_use_null:
+                        msg = (f'Column "{field_name}" in table '+
+                               f'"{table_name}" has minimum value '+
+                               f'{val_min} but {column_val} is too small -'+
+                               ' substituting NULL')
+                        impglobals.LOGGER.log('debug', msg)
+                    else:
+                        msg = (f'Column "{field_name}" in table '+
+                               f'"{table_name}" has minimum value '+
+                               f'{val_min} but {column_val} is too small')
+                        import_util.log_nonrepeating_error(msg)
+                    column_val = None
+                if val_max is not None and the_val > val_max:
+                    if val_use_null:
+                        msg = (f'Column "{field_name}" in table '+
+                               f'"{table_name}" has maximum value {val_max}'+
+                               f' but {column_val} is too large - '+
+                               'substituting NULL')
+                        impglobals.LOGGER.log('debug', msg)
+                    else:
+                        msg = (f'Column "{field_name}" in table '+
+                               f'"{table_name}" has maximum value '+
+                               f'{val_max} but {column_val} is too large')
+                        import_util.log_nonrepeating_error(msg)
+                    column_val = None
+        return column_val
+
+    return validate
+
+def _compile_table_plan(volume_id, volset, instrument_name,
+                        func_instrument_name, mission_abbrev, volume_type,
+                        table_name, table_schema):
+    "Return the list of _ColumnPlan used to import rows into a table."
 
     # Compute the columns in the specified order because some populate_*
     # functions rely on previous ones having already been run.
@@ -1283,318 +1713,105 @@ def import_observation_table(volume_id,
     ordered_table_schema.sort(key=lambda x: x[0])
     ordered_columns = [x[1] for x in ordered_table_schema]
 
-    # Run through all the based columns and compute their values.
-    # Always skip "id" for tables other than obs_general, because this is just
-    # an AUTO_INCREMENT field used by Django and has no other purpose.
     # Always skip "timestamp" fields because these are automatically filled in
     # by SQL because we mark them as ON CREATE and ON UPDATE.
     # Skip "mult_" tables because they are handled separately when the search
     # type is a GROUP-type.
 
+    plan = []
     for table_column in ordered_columns:
         if (table_column.get('put_mults_here', False) or
             table_column.get('pi_referred_slug', False)):
             continue
         field_name = table_column['field_name']
-        field_type = table_column['field_type']
-
-        metadata['table_name'] = table_name
-        metadata['field_name'] = field_name
-
         if field_name == 'timestamp':
             continue
 
         data_source_tuple = table_column.get('data_source', None)
         if not data_source_tuple:
-            import_util.log_nonrepeating_warning(
-                f'No data source for column "{field_name}" in table '+
-                f'"{table_name}"')
-            column_val = None
+            steps = None
         else:
+            steps = _compile_data_source_steps(volume_id, volset,
+                                               instrument_name,
+                                               func_instrument_name,
+                                               mission_abbrev, volume_type,
+                                               table_name, table_schema,
+                                               field_name, data_source_tuple)
 
-            ### COMPUTE THE NEW COLUMN VALUE ###
-
-            processed = False
-            column_val = None
-            mult_label = None
-            mult_label_set = False
-            disp_order = None # Might be set with mult_label but not otherwise
-
-            # Collect all the error messages in case we never find a valid
-            # data source, in which case we display all of them
-            error_list = []
+        mult_column_name = None
+        form_type = table_column.get('pi_form_type', None)
+        if form_type is not None and form_type.find(':') != -1:
+            form_type = form_type[:form_type.find(':')]
+        if form_type in GROUP_FORM_TYPES:
+            mult_column_name = import_util.table_name_mult(table_name,
+                                                           field_name)
 
-            data_source_offset = 0
-            while data_source_offset < len(data_source_tuple):
-                data_source_cmd = data_source_tuple[data_source_offset]
-                if data_source_cmd.find(':') != -1:
-                    (data_source_cmd_prefix,
-                     data_source_cmd_param) = data_source_cmd.split(':')
-                else:
-                    data_source_cmd_prefix = data_source_cmd
-                    data_source_cmd_param = None
+        plan.append(_ColumnPlan(field_name, steps,
+                                _compile_column_validator(table_name,
+                                                          table_column),
+                                mult_column_name, table_column))
+    return plan
 
-                if data_source_cmd_prefix == 'IGNORE':
-                    processed = True
-                    break
 
-                data_source_data = data_source_tuple[data_source_offset+1]
-
-                if data_source_cmd_prefix.startswith('TAB'):
-                    data_source_offset += 2
-                    ref_index_row = None
-                    if data_source_cmd_param+'_row' not in metadata:
-                        if data_source_cmd_param != 'ring_geo':
-                            # If we don't have ring_geo for this volume, don't
-                            # bitch about it because we already did earlier.
-                            error_list.append(
-                                'Unknown internal metadata name '+
-                                f'"{data_source_cmd_param}"'+
-                                f' while processing column "{field_name}" in '+
-                                f'table "{table_name}"')
-                        continue
-                    ref_index_row = metadata[data_source_cmd_param+'_row']
-                    if ref_index_row is None:
-                        import_util.log_nonrepeating_warning(
-                            'Missing row in metadata file '+
-                            f'"{data_source_cmd_param}"')
-                        processed = True
-                        break
-                    if data_source_data not in ref_index_row:
-                        error_list.append(
-                                'Unknown referenced column '+
-                                f'"{data_source_data}" '+
-                                f'while processing column "{field_name}" in '+
-                                f'table "{table_name}"')
-                        continue
-                    column_val = import_util.safe_column(ref_index_row,
-                                                         data_source_data)
-                    processed = True
-                    break
+def import_observation_table(volume_id,
+                             volset,
+                             instrument_name,
+                             func_instrument_name,
+                             mission_abbrev,
+                             volume_type,
+                             table_name,
+                             table_schema,
+                             metadata):
+    "Import the data from a row from a PDS file into a single table."
+    plan_key = (table_name, instrument_name, func_instrument_name)
+    plan = _TABLE_PLAN_CACHE.get(plan_key)
+    if plan is None:
+        plan = _compile_table_plan(volume_id, volset, instrument_name,
+                                   func_instrument_name, mission_abbrev,
+                                   volume_type, table_name, table_schema)
+        _TABLE_PLAN_CACHE[plan_key] = plan
 
-                if data_source_cmd_prefix.startswith('ARRAY'):
-                    data_source_offset += 2
-                    (ref_index_name,
-                     array_index) = data_source_cmd_param.split('.')
-                    array_index = int(array_index)
-                    ref_index_row = None
-                    if ref_index_name+'_row' not in metadata:
-                        if data_source_cmd_param != 'ring_geo':
-                            # If we don't have ring_geo for this volume, don't
-                            # bitch about it because we already did earlier.
-                            error_list.append(
-                                'Unknown internal metadata name '+
-                                f'"{ref_index_name}"'+
-                                f' while processing column "{field_name}" in '+
-                                f'table "{table_name}"')
-                        continue
-                    ref_index_row = metadata[ref_index_name+'_row']
-                    if ref_index_row is None:
-                        import_util.log_nonrepeating_warning(
-                            'Missing row in metadata file '+
-                            f'"{data_source_cmd_param}"')
-                        processed = True
-                        break
-                    if data_source_data not in ref_index_row:
-                        error_list.append(
-                                'Unknown referenced column '+
-                                f'"{data_source_data}" '+
-                                f'while processing table "{table_name}"')
-                        continue
-                    if (array_index < 0 or
-                        array_index >=
-                            len(ref_index_row[data_source_data])):
-                        import_util.log_nonrepeating_error(
-                            f'Bad array index "{array_index}" for column '+
-                            f'"{field_name}" in table "{table_name}"')
-                        processed = True
-                        break
-                    column_val = import_util.safe_column(ref_index_row,
-                                                         data_source_data,
-                                                         array_index)
-                    processed = True
-                    break
+    new_row = {}
 
-                if data_source_cmd_prefix == 'FUNCTION':
-                    data_source_offset += 2
-                    ok, ret = import_run_field_function(data_source_data,
-                                                        volume_id,
-                                                        volset,
-                                                        instrument_name,
-                                                        func_instrument_name,
-                                                        mission_abbrev,
-                                                        volume_type,
-                                                        table_name,
-                                                        table_schema,
-                                                        metadata,
-                                                        field_name)
-                    if not ok:
-                        # Function doesn't exist
-                        # An error will already have been logged
-                        continue
-                    if isinstance(ret, tuple) or isinstance(ret, list):
-                        column_val = ret[0]
-                        mult_label = ret[1]
-                        if len(ret) == 3:
-                            disp_order = ret[2]
-                        mult_label_set = True
-                    else:
-                        column_val = ret
-                    processed = True
-                    break
+    # So it can be accessed by populate_*
+    metadata[table_name+'_row'] = new_row
 
-                if data_source_cmd_prefix == 'MAX_ID':
-                    if table_name not in impglobals.MAX_TABLE_ID_CACHE:
-                        impglobals.MAX_TABLE_ID_CACHE[table_name] = (
-                            import_util.find_max_table_id(table_name))
-                    impglobals.MAX_TABLE_ID_CACHE[table_name] = (
-                        impglobals.MAX_TABLE_ID_CACHE[table_name]+1)
-                    column_val = impglobals.MAX_TABLE_ID_CACHE[table_name]
-                    processed = True
-                    break
+    for column_plan in plan:
+        field_name = column_plan.field_name
 
-                if data_source_cmd_prefix == 'VALUESTR':
-                    column_val = data_source_data
-                    processed = True
-                    break
+        metadata['table_name'] = table_name
+        metadata['field_name'] = field_name
 
-                if data_source_cmd_prefix == 'VALUEREAL':
-                    column_val = float(data_source_data)
-                    processed = True
-                    break
+        ### COMPUTE THE NEW COLUMN VALUE ###
 
-                if data_source_cmd_prefix == 'VALUEINT':
-                    column_val = int(data_source_data)
-                    processed = True
+        result = None
+        if column_plan.steps is None:
+            import_util.log_nonrepeating_warning(
+                f'No data source for column "{field_name}" in table '+
+                f'"{table_name}"')
+        else:
+            # Collect all the error messages in case we never find a valid
+            # data source, in which case we display all of them
+            error_list = []
+            for step in column_plan.steps:
+                result = step(metadata, error_list)
+                if result is not None:
                     break
-
-                import_util.log_nonrepeating_error(
-                    f'Unknown data_source type "{data_source_cmd}" for'+
-                    f'"{field_name}" in table "{table_name}"')
-                processed = True
-                break
-
-            if not processed:
+            else:
                 for error_str in error_list:
                     import_util.log_nonrepeating_error(error_str)
+        if result is None:
+            result = _NULL_RESULT
+        column_val, mult_label, mult_label_set, disp_order = result
 
         ### VALIDATE THE COLUMN VALUE ###
 
-        if column_val is None:
-            notnull = table_column.get('field_notnull', False)
-            if notnull:
-                import_util.log_nonrepeating_error(
-                    f'Column "{field_name}" in table "{table_name}" '+
-                    'has NULL value but NOT NULL is set')
-        else:
-            if field_type.startswith('flag'):
-                if column_val in [0, 'n', 'N', 'no', 'No', 'NO', 'off', 'OFF']:
-                    if field_type == 'flag_onoff':
-                        column_val = 'Off'
-                    else:
-                        column_val = 'No'
-                elif column_val in [1, 'y', 'Y', 'yes', 'Yes', 'YES', 'on',
-                                    'ON']:
-                    if field_type == 'flag_onoff':
-                        column_val = 'On'
-                    else:
-                        column_val = 'Yes'
-                elif column_val in ['N/A', 'UNK', 'NULL']:
-                    column_val = None
-                else:
-                    import_util.log_nonrepeating_error(
-                        f'Column "{field_name}" in table "{table_name}" '+
-                        f'has FLAG type but value "{column_val}" is not '+
-                        'a valid flag value')
-                    column_val = None
-            if field_type.startswith('char'):
-                field_size = int(field_type[4:])
-                if not isinstance(column_val, str):
-                    import_util.log_nonrepeating_error(
-                        f'Column "{field_name}" in table "{table_name}" '+
-                        f'has CHAR type but value "{column_val}" is of '+
-                        f'type "{type(column_val)}"')
-                    column_val = ''
-                elif len(column_val) > field_size:
-                    import_util.log_nonrepeating_error(
-                        f'Column "{field_name}" in table "{table_name}" '+
-                        f'has CHAR size {field_size} but value '+
-                        f'"{column_val}" is too long')
-                    column_val = column_val[:field_size]
-            elif (field_type.startswith('real') or
-                  field_type.startswith('int') or
-                  field_type.startswith('uint')):
-                the_val = None
-                if field_type.startswith('real'):
-                    try:
-                        the_val = float(column_val)
-                    except ValueError:
-                        import_util.log_nonrepeating_error(
-                            f'Column "{field_name}" in table '+
-                            f'"{table_name}" has REAL type but '+
-                            f'"{column_val}" is not a float')
-                        column_val = None
-                else:
-                    try:
-                        the_val = int(column_val)
-                    except ValueError:
-                        import_util.log_nonrepeating_error(
-                            f'Column "{field_name}" in table '+
-                            f'"{table_name}" has INT type but '+
-                            f'"{column_val}" is not an int')
-                        column_val = None
-                if column_val is not None and the_val is not None:
-                    val_sentinel = table_column.get('val_sentinel', None)
-                    if type(val_sentinel) != list:
-                        val_sentinel = [val_sentinel]
-                    if the_val in val_sentinel:
-                        column_val = None
-                        import_util.log_nonrepeating_error(
-                            f'Caught sentinel value {the_val} for column '+
-                            f'"{field_name}" that was missed'+
-                            ' by the PDS label!')
-                if column_val is not None and the_val is not None:
-                    val_min = table_column.get('val_min', None)
-                    val_max = table_column.get('val_max', None)
-                    val_use_null = table_column.get('val_set_invalid_to_null',
-                                                    False)
-                    if val_min is not None and the_val < val_min:
-                        if val_use_null:
-                            msg = (f'Column "{field_name}" in table '+
-                                   f'"{table_name}" has minimum value '+
-                                   f'{val_min} but {column_val} is too small -'+
-                                   ' substituting NULL')
-                            impglobals.LOGGER.log('debug', msg)
-                        else:
-                            msg = (f'Column "{field_name}" in table '+
-                                   f'"{table_name}" has minimum value '+
-                                   f'{val_min} but {column_val} is too small')
-                            import_util.log_nonrepeating_error(msg)
-                        column_val = None
-                    if val_max is not None and the_val > val_max:
-                        if val_use_null:
-                            msg = (f'Column "{field_name}" in table '+
-                                   f'"{table_name}" has maximum value {val_max}'+
-                                   f' but {column_val} is too large - '+
-                                   'substituting NULL')
-                            impglobals.LOGGER.log('debug', msg)
-                        else:
-                            msg = (f'Column "{field_name}" in table '+
-                                   f'"{table_name}" has maximum value '+
-                                   f'{val_max} but {column_val} is too large')
-                            import_util.log_nonrepeating_error(msg)
-                        column_val = None
-
+        column_val = column_plan.validate(column_val)
         new_row[field_name] = column_val
 
         ### CHECK TO SEE IF THERE IS AN ASSOCIATED MULT_ TABLE ###
 
-        form_type = table_column.get('pi_form_type', None)
-        if form_type is not None and form_type.find(':') != -1:
-            form_type = form_type[:form_type.find(':')]
-        if form_type in GROUP_FORM_TYPES:
-            mult_column_name = import_util.table_name_mult(table_name,
-                                                           field_name)
+        if column_plan.mult_column_name is not None:
             if not mult_label_set:
                 if column_val is None:
                     mult_label = 'N/A'
@@ -1605,9 +1822,10 @@ def import_observation_table(volume_id,
                         # This catches things like 2014 MU69 and leaves them
                         # in all caps
                         mult_label = mult_label.title()
-            id_num = update_mult_table(table_name, field_name, table_column,
+            id_num = update_mult_table(table_name, field_name,
+                                       column_plan.table_column,
                                        column_val, mult_label, disp_order)
-            new_row[mult_column_name] = id_num
+            new_row[column_plan.mult_column_name] = id_num
 
         ### A BIT OF TRICKERY - WE CAN'T RETRIEVE THE RING OR SURFACE GEO
         ### METADATA UNTIL WE KNOW THE OPUS_ID, WHICH IS COMPUTED
@@ -1629,37 +1847,6 @@ def import_observation_table(volume_id,
 
     return new_row
 
-def import_run_field_function(func_name_suffix, volume_id,
-                              volset,
-                              instrument_name,
-                              func_instrument_name,
-                              mission_abbrev,
-                              volume_type,
-                              table_name, table_schema, metadata,
-                              field_name):
-    "Call the Python function used to populate a single field in a table."
-    not_exists_is_ok = False
-    if func_name_suffix[0] == '~':
-        not_exists_is_ok = True
-        func_name_suffix = func_name_suffix[1:]
-
-    func_name = 'populate_'+func_name_suffix
-    func_name = func_name.replace('<INST>', func_instrument_name)
-    func_name = func_name.replace('<MISSION>', mission_abbrev)
-    func_name = func_name.replace('<TYPE>', volume_type)
-    if func_name not in globals():
-        if not not_exists_is_ok:
-            import_util.log_nonrepeating_error(
-                f'Unknown table populate function "{func_name}" for '+
-                f'"{field_name}" in table "{table_name}"')
-        return (False, None)
-    func = globals()[func_name]
-    return (True, func(volume_id=volume_id, volset=volset,
-                       instrument_name=instrument_name,
-                       mission_abbrev=mission_abbrev,
-                       table_name=table_name, table_schema=table_schema,
-                       metadata=metadata))
-
 def get_pdsfile_rows_for_filespec(filespec, obs_general_id, opus_id, volume_id,
                                   instrument_id):
     rows = []
@@ -1817,10 +2004,118 @@ def remove_opus_id_from_tables(table_rows, opus_id):
             i += 1
 
 
+################################################################################
+# PARALLEL READING OF INDEX FILES
+################################################################################
+
+# With --processes N, a pool of worker processes reads and parses the index,
+# supplemental index, geometry, and inventory files of the upcoming volumes
+# while the main process imports the current one. Everything that allocates
+# ids or touches the database (mult tables, obs_general and obs_files ids,
+# duplicate opus_id handling, inserts) still happens in the main process, one
+# volume at a time in the requested order, so the result is identical to a
+# serial import.
+
+# label_path -> (rows, label_dict) read by a worker for the current volume
+_PREREAD_TABLES = {}
+
+class _QuietLogger(object):
+    "Worker processes must not write to the main process's log files."
+    def log(self, *args, **kwargs):
+        pass
+
+    def open(self, *args, **kwargs):
+        pass
+
+    def close(self, *args, **kwargs):
+        pass
+
+def _init_preread_worker():
+    impglobals.LOGGER = _QuietLogger()
+    impglobals.DATABASE = None
+
+def _preread_volume_tables(volume_id):
+    """Read all the tables import_one_volume will need for a volume.
+       This runs in a worker process. Returns (volume_id, tables) where tables
+       is a dict of label_path -> (rows, label_dict). Tables that can't be
+       read cleanly are left out so the main process reads them again and
+       reports the problem in the usual way."""
+    tables = {}
+    try:
+        volume_pdsfile = pdsfile.PdsFile.from_path(volume_id)
+        if not volume_pdsfile.is_volume:
+            return volume_id, tables
+        metadata_paths, index_labels = find_volume_index_labels(volume_pdsfile)
+        for label_path in volume_label_paths(metadata_paths, index_labels):
+            if label_path in tables:
+                continue
+            rows, label_dict = read_index_table(label_path)
+            if rows:
+                tables[label_path] = (rows, label_dict)
+    except Exception:
+        # Leave whatever we didn't get to for the main process
+        pass
+    return volume_id, tables
+
+def yield_volume_ids_with_preread_tables(volume_id_list):
+    """Yield the volume_ids in order, with the tables for each one already
+       read into _PREREAD_TABLES if --processes is more than 1."""
+    num_processes = impglobals.ARGUMENTS.processes
+    if num_processes <= 1 or len(volume_id_list) <= 1:
+        yield from volume_id_list
+        return
+
+    impglobals.LOGGER.log('info',
+        f'Reading index files with {num_processes} processes; the '+
+        'database is still updated by this process alone')
+    # Fork so the workers inherit the preloaded pdsfile state
+    context = multiprocessing.get_context('fork')
+    volume_id_iter = iter(volume_id_list)
+    with context.Pool(num_processes,
+                      initializer=_init_preread_worker) as pool:
+        # Don't let the workers get too far ahead, because parsed tables can
+        # be large
+        pending = collections.deque()
+        for volume_id in itertools.islice(volume_id_iter, num_processes*2):
+            pending.append(pool.apply_async(_preread_volume_tables,
+                                            (volume_id,)))
+        while pending:
+            volume_id, tables = pending.popleft().get()
+            for next_volume_id in itertools.islice(volume_id_iter, 1):
+                pending.append(pool.apply_async(_preread_volume_tables,
+                                                (next_volume_id,)))
+            _PREREAD_TABLES.clear()
+            _PREREAD_TABLES.update(tables)
+            yield volume_id
+    _PREREAD_TABLES.clear()
+
+
 ################################################################################
 # THE MAIN IMPORT LOOP
 ################################################################################
 
+def find_changed_volume_ids(volume_id_list):
+    """Return the volumes whose input files are not the ones recorded in the
+       permanent import_manifest table (--incremental)."""
+    changed_volume_ids = []
+    for volume_id in volume_id_list:
+        volume_pdsfile = pdsfile.PdsFile.from_path(volume_id)
+        if volume_pdsfile.is_volume:
+            metadata_paths, index_labels = find_volume_index_labels(
+                                                            volume_pdsfile)
+            if (index_labels and
+                do_import_manifest.volume_is_unchanged(
+                        volume_id,
+                        volume_input_files(metadata_paths, index_labels))):
+                impglobals.LOGGER.log('info',
+                    f'Volume "{volume_id}" is unchanged - skipping')
+                continue
+        changed_volume_ids.append(volume_id)
+    impglobals.LOGGER.log('info',
+        f'{len(changed_volume_ids)} of {len(volume_id_list)} volumes have '+
+        'changed')
+    return changed_volume_ids
+
 def do_import_steps():
     "Do all of the steps requested by the user for an import."
     impglobals.IMPORT_HAS_BAD_DATA = False
@@ -1833,6 +2128,14 @@ def do_import_steps():
                                                     impglobals.ARGUMENTS):
         volume_id_list.append(volume_id)
 
+    # With --incremental, only the volumes whose input files have changed are
+    # imported (and thus copied to the permanent tables)
+    volume_ids_to_import = volume_id_list
+    if (impglobals.ARGUMENTS.incremental and
+        (impglobals.ARGUMENTS.do_import or
+         impglobals.ARGUMENTS.delete_import_volumes)):
+        volume_ids_to_import = find_changed_volume_ids(volume_id_list)
+
     # Delete the old import tables if
     #   --drop-old-import-tables but not
     #   --leave-old-import-tables
@@ -1879,12 +2182,12 @@ def do_import_steps():
         if not old_imp_tables_dropped:
             impglobals.LOGGER.log('warning',
                                   'Importing on top of previous import tables!')
-            for volume_id in import_util.yield_import_volume_ids(
-                                                    impglobals.ARGUMENTS):
+            for volume_id in volume_ids_to_import:
                 delete_volume_from_obs_tables(volume_id, 'import')
 
     if impglobals.ARGUMENTS.do_import:
-        for volume_id in volume_id_list:
+        for volume_id in yield_volume_ids_with_preread_tables(
+                                                        volume_ids_to_import):
             if not import_one_volume(volume_id):
                 impglobals.LOGGER.log('fatal',
                         f'Import of volume {volume_id} failed - Aborting')
@@ -1928,8 +2231,10 @@ def do_import_steps():
     # If --copy-import-to-permanent-tables is given, create obs and mult tables
     # as necessary, then copy the import tables to the permanent tables.
     if impglobals.ARGUMENTS.copy_import_to_permanent_tables:
+        # Any obs tables that don't exist yet are created without keys, which
+        # are much faster to add after all the rows have been copied
         for volume_id in import_volume_ids:
-            create_tables_for_import(volume_id, 'perm')
+            create_tables_for_import(volume_id, 'perm', defer_keys=True)
 
         impglobals.LOGGER.log('info', 'Deleting duplicate opus_ids')
         delete_duplicate_opus_id_from_perm_tables()
@@ -1940,6 +2245,9 @@ def do_import_steps():
         for volume_id in import_volume_ids:
             copy_volume_from_import_to_permanent(volume_id)
 
+        impglobals.LOGGER.log('info', 'Creating keys for new permanent tables')
+        impglobals.DATABASE.create_deferred_keys('perm')
+
     # If --drop-new-import-tables is given, delete the new import tables
     if impglobals.ARGUMENTS.drop_new_import_tables:
         impglobals.LOGGER.log('info', 'Deleting all new import tables')
@@ -0,0 +1,116 @@
+################################################################################
+# do_import_manifest.py
+#
+# Maintain the import_manifest table used by --incremental.
+#
+# For every volume that has been imported, the manifest has one row per input
+# file (index, supplemental index, geometry, and inventory labels and their
+# tables) giving its path, mtime, size, and SHA-256 checksum. The rows are
+# written to the import namespace when the volume is imported and copied to
+# the permanent namespace along with the volume, so the permanent manifest
+# always describes what is in the permanent tables.
+#
+# With --incremental, a volume whose input files are exactly the ones in the
+# permanent manifest is skipped. A file whose mtime or size changed is only
+# considered changed if its checksum changed too.
+################################################################################
+
+import hashlib
+import os
+
+import impglobals
+import import_util
+
+
+_DATA_FILE_EXTENSIONS = ('.TAB', '.tab', '.CSV', '.csv')
+
+def _checksum(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        for block in iter(lambda: fp.read(1024*1024), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def input_files_for_labels(label_paths):
+    """Return the sorted list of files read for the given index labels: the
+       labels themselves and the tables that go with them."""
+    paths = set()
+    for label_path in label_paths:
+        paths.add(label_path)
+        stem = os.path.splitext(label_path)[0]
+        for ext in _DATA_FILE_EXTENSIONS:
+            if os.path.exists(stem+ext):
+                paths.add(stem+ext)
+    return sorted(paths)
+
+def _read_manifest(volume_id, namespace):
+    "Return a dict of path -> (mtime, size, checksum) for a volume."
+    db = impglobals.DATABASE
+    if not db.table_exists(namespace, 'import_manifest'):
+        return {}
+    q = db.quote_identifier
+    rows = db.read_rows(namespace, 'import_manifest',
+                        ['path', 'mtime', 'size', 'checksum'],
+                        where=f'{q("volume_id")}="{volume_id}"')
+    return {x[0]: (x[1], x[2], x[3]) for x in rows}
+
+def volume_is_unchanged(volume_id, input_files):
+    """Return True if input_files are the same files, with the same contents,
+       that were used for the volume now in the permanent tables."""
+    manifest = _read_manifest(volume_id, 'perm')
+    if not manifest or set(manifest.keys()) != set(input_files):
+        return False
+    for path in input_files:
+        mtime, size, checksum = manifest[path]
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if stat.st_mtime == mtime and stat.st_size == size:
+            continue
+        if _checksum(path) != checksum:
+            impglobals.LOGGER.log('debug', f'Input file changed: "{path}"')
+            return False
+    return True
+
+def record_volume_manifest(volume_id, input_files):
+    "Write the manifest for a volume that was just imported."
+    db = impglobals.DATABASE
+    manifest_schema = import_util.read_schema_for_table('import_manifest')
+    db.create_table('import', 'import_manifest', manifest_schema)
+    delete_volume_manifest(volume_id, 'import')
+    rows = []
+    for path in input_files:
+        stat = os.stat(path)
+        rows.append({'volume_id': volume_id,
+                     'path': path,
+                     'mtime': stat.st_mtime,
+                     'size': stat.st_size,
+                     'checksum': _checksum(path)})
+    db.insert_rows('import', 'import_manifest', rows)
+
+def copy_volume_manifest_to_permanent(volume_id):
+    "Replace the permanent manifest for a volume with the import one."
+    db = impglobals.DATABASE
+    manifest_schema = import_util.read_schema_for_table('import_manifest')
+    db.create_table('perm', 'import_manifest', manifest_schema)
+    delete_volume_manifest(volume_id, 'perm')
+    # The ids are only unique within a namespace, so leave them out
+    columns = ['volume_id', 'path', 'mtime', 'size', 'checksum']
+    manifest = _read_manifest(volume_id, 'import')
+    rows = [dict(zip(columns, (volume_id, path)+manifest[path]))
+            for path in sorted(manifest)]
+    db.insert_rows('perm', 'import_manifest', rows)
+
+def delete_volume_manifest(volume_id, namespace):
+    """Forget the input files of a volume. This must be done whenever the
+       volume is deleted from the obs tables."""
+    db = impglobals.DATABASE
+    if not db.table_exists(namespace, 'import_manifest'):
+        return
+    q = db.quote_identifier
+    db.delete_rows(namespace, 'import_manifest',
+                   f'{q("volume_id")}="{volume_id}"')
+
+def drop_manifest(namespace):
+    impglobals.DATABASE.drop_table(namespace, 'import_manifest')
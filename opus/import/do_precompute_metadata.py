@@ -0,0 +1,147 @@
+################################################################################
+# do_precompute_metadata.py
+#
+# Generate and maintain the precomputed_metadata table.
+#
+# With no search constraints, the range endpoints, mult counts, and result
+# count shown by OPUS are aggregates over entire obs tables. These only change
+# when the permanent tables change, so we compute them once here and OPUS
+# reads them instead of scanning millions of rows after every restart.
+#
+# Each row is keyed by a name and holds a JSON value:
+#   result_count                        <count>
+#   range:<category>.<name_no_num>      {"min": <raw>, "max": <raw>,
+#                                        "nulls": <count>}
+#   mult:<mult_table_name>              [[<mult_id>, <count>], ...]
+################################################################################
+
+import json
+
+import impglobals
+import import_util
+
+
+_RANGE_FORM_TYPES = ('LONG', 'RANGE')
+
+
+def _strip_numeric_suffix(name):
+    if len(name) > 0 and name[-1] in ['1', '2']:
+        return name[:-1]
+    return name
+
+def _precompute_result_count(rows):
+    db = impglobals.DATABASE
+    q = db.quote_identifier
+
+    res = db.general_select(f'COUNT(*) FROM {q("obs_general")}')
+    rows.append({'name': 'result_count',
+                 'value': json.dumps(res[0][0] if res else 0)})
+
+def _precompute_ranges(rows):
+    db = impglobals.DATABASE
+    logger = impglobals.LOGGER
+    q = db.quote_identifier
+
+    # This mirrors the logic in api_get_range_endpoints
+    res = db.general_select(
+        f"""{q('category_name')}, {q('name')}, {q('form_type')}, {q('slug')}
+FROM {q('param_info')} WHERE {q('referred_slug')} IS NULL""")
+    done = set()
+    for category_name, name, form_type, slug in res:
+        if not form_type:
+            continue
+        form_type = form_type.split(':')[0]
+        if form_type not in _RANGE_FORM_TYPES:
+            continue
+        name_no_num = _strip_numeric_suffix(name)
+        key = f'range:{category_name}.{name_no_num}'
+        if key in done:
+            continue
+        done.add(key)
+        if not db.table_exists('perm', category_name):
+            continue
+        if slug and slug[-1] in '12':
+            param1 = name_no_num + '1'
+            param2 = name_no_num + '2'
+        else:
+            param1 = param2 = name_no_num
+        logger.log('debug', f'Computing range endpoints for "{key}"')
+        cmd = f"""
+MIN({q(param1)}), MAX({q(param2)}),
+SUM({q(param1)} IS NULL AND {q(param2)} IS NULL) FROM {q(category_name)}"""
+        range_res = db.general_select(cmd)
+        if not range_res:
+            continue
+        min_val, max_val, nulls = range_res[0]
+        # MIN/MAX of a DECIMAL column come back as Decimal
+        rows.append({'name': key,
+                     'value': json.dumps({'min': min_val,
+                                          'max': max_val,
+                                          'nulls': int(nulls or 0)},
+                                         default=float)})
+
+def _precompute_mult_counts(rows):
+    db = impglobals.DATABASE
+    logger = impglobals.LOGGER
+    q = db.quote_identifier
+
+    for table_name in sorted(db.table_names('perm', prefix='obs_')):
+        for column in db.table_info('perm', table_name):
+            field_name = column['field_name']
+            if not field_name.startswith('mult_'):
+                continue
+            logger.log('debug', f'Computing mult counts for "{field_name}"')
+            cmd = f"""
+{q(field_name)}, COUNT(*) FROM {q(table_name)} GROUP BY {q(field_name)}"""
+            mult_res = db.general_select(cmd)
+            rows.append({'name': 'mult:'+field_name,
+                         'value': json.dumps([[mult_id, count]
+                                              for mult_id, count in mult_res])})
+
+def create_import_precomputed_metadata_table():
+    db = impglobals.DATABASE
+    logger = impglobals.LOGGER
+
+    logger.log('info', 'Creating new import precomputed_metadata table')
+    precomputed_schema = import_util.read_schema_for_table(
+                                                        'precomputed_metadata')
+    # Start from scratch
+    db.drop_table('import', 'precomputed_metadata')
+    db.create_table('import', 'precomputed_metadata', precomputed_schema,
+                    ignore_if_exists=False)
+
+    rows = []
+    _precompute_result_count(rows)
+    _precompute_ranges(rows)
+    _precompute_mult_counts(rows)
+
+    db.insert_rows('import', 'precomputed_metadata', rows)
+
+def copy_precomputed_metadata_from_import_to_permanent():
+    db = impglobals.DATABASE
+    logger = impglobals.LOGGER
+
+    logger.log('info',
+               'Copying precomputed_metadata table from import to permanent')
+    # Start from scratch
+    precomputed_schema = import_util.read_schema_for_table(
+                                                        'precomputed_metadata')
+    db.drop_table('perm', 'precomputed_metadata')
+    db.create_table('perm', 'precomputed_metadata', precomputed_schema,
+                    ignore_if_exists=False)
+
+    db.copy_rows_between_namespaces('import', 'perm', 'precomputed_metadata')
+
+def drop_precomputed_metadata():
+    """Throw away the precomputed values because the obs tables changed.
+
+    OPUS falls back to computing everything from the obs tables.
+    """
+    impglobals.LOGGER.log('info', 'Dropping stale precomputed_metadata table')
+    impglobals.DATABASE.drop_table('perm', 'precomputed_metadata')
+
+
+def do_precompute_metadata():
+    create_import_precomputed_metadata_table()
+    copy_precomputed_metadata_from_import_to_permanent()
+    impglobals.DATABASE.drop_table('import', 'precomputed_metadata')
@@ -1,4 +1,5 @@
 from functools import lru_cache
+import tempfile
 
 try:
     import MySQLdb
@@ -9,6 +10,24 @@ except ImportError:
 from importdb.super import ImportDBSuper, ImportDBException
 
 ERR_UNKNOWN_DATABASE = 1049
+# The server or client doesn't allow LOAD DATA LOCAL INFILE
+ERR_LOAD_DATA_NOT_ALLOWED = (1148, 2068, 3948)
+
+# How to write a value in a LOAD DATA file with the default FIELDS ESCAPED BY
+_LOAD_DATA_ESCAPES = str.maketrans({'\\': '\\\\',
+                                    '\t': '\\t',
+                                    '\n': '\\n',
+                                    '\r': '\\r',
+                                    '\0': '\\0'})
+
+def _load_data_value(val):
+    if val is None:
+        return '\\N'
+    if isinstance(val, str):
+        return val.translate(_LOAD_DATA_ESCAPES)
+    if isinstance(val, bool):
+        return str(int(val))
+    return str(val)
 
 class ImportDBMySQL(ImportDBSuper):
     # Note that for MySQL, we ignore the db_name and only use the schema_name
@@ -38,7 +57,8 @@ class ImportDBMySQL(ImportDBSuper):
             try:
                 self.conn = MySQLdb.connect(host=self.db_hostname,
                                             user=self.db_user,
-                                            passwd=self.db_password)
+                                            passwd=self.db_password,
+                                            local_infile=1)
             except MySQLdb.Error as e:
                 if self.logger:
                     self.logger.log('fatal',
@@ -100,6 +120,18 @@ class ImportDBMySQL(ImportDBSuper):
         # to do post-processing on
         self.tables_created = []
 
+        # Table name -> list of (key_type, field_name, ALTER TABLE clause,
+        # referenced table name or None) for the keys that
+        # create_table(defer_keys=True) left out
+        self._deferred_keys = {}
+        # The existing tables whose keys create_table(defer_keys=True) has
+        # already checked
+        self._keys_checked = set()
+
+        # Set to False the first time the server refuses LOAD DATA LOCAL
+        # INFILE so that load_rows goes straight to insert_rows after that
+        self._load_data_available = True
+
         if not MYSQLDB_AVAILABLE:
             self.mysql_version = 'Simulated'
         else:
@@ -284,6 +316,8 @@ FROM `INFORMATION_SCHEMA`.`COLUMNS` WHERE `TABLE_SCHEMA`='{self.db_schema}' AND
                     self.logger.log('debug',
                             f'Dropped table "{table_name}"')
 
+            self._deferred_keys.pop(table_name, None)
+            self._keys_checked.discard(table_name)
             if table_name in self._table_names:
                 self._table_names.remove(table_name)
             else:
@@ -295,20 +329,31 @@ FROM `INFORMATION_SCHEMA`.`COLUMNS` WHERE `TABLE_SCHEMA`='{self.db_schema}' AND
         super(ImportDBMySQL, self)._exit()
 
     def create_table(self, namespace, raw_table_name, schema,
-                     ignore_if_exists=True, auto_create_mults=True):
+                     ignore_if_exists=True, auto_create_mults=True,
+                     defer_keys=False):
         """Create a new table from the given schema. Returns True if
            table successfully created; False if table already existed
-           and ignore_if_exists==True."""
+           and ignore_if_exists==True. If defer_keys==True, only the primary
+           key is created now; the other keys are added by
+           create_deferred_keys, which is much faster once the table has
+           been filled. An existing table is checked for any of these keys
+           that are missing, because an earlier run stopped before
+           create_deferred_keys, and create_deferred_keys adds those too."""
         super(ImportDBMySQL, self)._enter('create_table')
 
-        if ignore_if_exists and self.table_exists(namespace, raw_table_name):
+        table_name = self.convert_raw_to_namespace(namespace, raw_table_name)
+
+        table_exists = (ignore_if_exists and
+                        self.table_exists(namespace, raw_table_name))
+        if table_exists and (not defer_keys or
+                             table_name in self._deferred_keys or
+                             table_name in self._keys_checked):
             super(ImportDBMySQL, self)._exit()
             return False
 
-        table_name = self.convert_raw_to_namespace(namespace, raw_table_name)
-
         cmd = ''
         key_cmd = ''
+        deferred_key_cmds = []
 
         if auto_create_mults:
             mult_schema = []
@@ -352,104 +397,50 @@ FROM `INFORMATION_SCHEMA`.`COLUMNS` WHERE `TABLE_SCHEMA`='{self.db_schema}' AND
                 continue
 
             field_name = column['field_name']
-            field_type = column['field_type']
-
-            cmd += f'  `{field_name}` '
-            if field_type == 'int1':
-                cmd += 'tinyint'
-            elif field_type == 'int2':
-                cmd += 'smallint'
-            elif field_type == 'int3':
-                cmd += 'mediumint'
-            elif field_type == 'int4':
-                cmd += 'int'
-            elif field_type == 'int8':
-                cmd += 'bigint'
-
-            elif field_type == 'uint1':
-                cmd += 'tinyint unsigned'
-            elif field_type == 'uint2':
-                cmd += 'smallint unsigned'
-            elif field_type == 'uint3':
-                cmd += 'mediumint unsigned'
-            elif field_type == 'uint4':
-                cmd += 'int unsigned'
-            elif field_type == 'uint8':
-                cmd += 'bigint unsigned'
-
-            elif field_type == 'real4':
-                cmd += 'float'
-            elif field_type == 'real8':
-                cmd += 'double'
-
-            elif field_type[:4] == 'char':
-                cmd += 'char('+field_type[4:]+')'
-            elif field_type[:7] == 'varchar':
-                cmd += 'varchar('+field_type[7:]+')'
-            elif field_type == 'text':
-                cmd += 'text'
-            elif field_type == 'json':
-                cmd += 'JSON'
-            elif field_type == 'enum':
-                enum_str = column.get('field_enum_options', None)
-                assert enum_str, (raw_table_name, column)
-                cmd += f'enum({enum_str})'
-            elif field_type == 'flag_yesno':
-                cmd += "enum('Yes','No')"
-            elif field_type == 'flag_onoff':
-                cmd += "enum('On','Off')"
-            elif field_type == 'timestamp':
-                cmd += 'timestamp'
-            elif field_type == 'datetime':
-                cmd += 'datetime'
-            else:
-                assert False, field_type
-
-            field_default = column.get('field_default', 'NULL')
-            if field_default is None:
-                field_default = 'NULL'
-            if column.get('field_notnull', False):
-                cmd += ' NOT NULL'
-                if field_default == 'NULL':
-                    field_default = ''
-
-            if field_type == 'timestamp':
-                field_default = 'CURRENT_TIMESTAMP'
-
-            if field_default != '':
-                if (field_default != 'NULL' and
-                    field_default != 'CURRENT_TIMESTAMP'
-                    and not field_default.isdigit()):
-                    field_default = "'" + field_default + "'"
-                cmd += f' DEFAULT {field_default}'
-
-            if column.get('field_autoincrement', False):
-                cmd += ' AUTO_INCREMENT'
-
-            if field_type == 'timestamp':
-                cmd += ' ON UPDATE CURRENT_TIMESTAMP'
+            cmd += '  '+self._column_definition(column)
 
             key_type = column.get('field_key', False)
             foreign_key = column.get('field_key_foreign', False)
             assert not foreign_key or key_type == 'foreign'
             if key_type:
-                if key_cmd != '':
-                    key_cmd += ',\n'
+                ref_table = None
                 if key_type == 'unique':
-                    key_cmd += f'  UNIQUE KEY `{field_name}` (`{field_name}`)'
+                    one_key_cmd = f'UNIQUE KEY `{field_name}` (`{field_name}`)'
                 elif key_type == 'primary':
-                    key_cmd += f'  PRIMARY KEY (`{field_name}`)'
+                    one_key_cmd = f'PRIMARY KEY (`{field_name}`)'
                 elif key_type == 'foreign':
                     assert foreign_key
-                    key_cmd += f'  FOREIGN KEY (`{field_name}`)'
-                    key_cmd += ' REFERENCES '
+                    one_key_cmd = f'FOREIGN KEY (`{field_name}`)'
+                    one_key_cmd += ' REFERENCES '
                     f_table = self.convert_raw_to_namespace(namespace,
                                                             foreign_key[0])
-                    key_cmd += f'`{f_table}`'
-                    key_cmd += f'(`{foreign_key[1]}`)'
-                    key_cmd += ' ON DELETE RESTRICT ON UPDATE CASCADE'
+                    one_key_cmd += f'`{f_table}`'
+                    ref_table = f_table
+                    one_key_cmd += f'(`{foreign_key[1]}`)'
+                    one_key_cmd += ' ON DELETE RESTRICT ON UPDATE CASCADE'
+                else:
+                    one_key_cmd = f'KEY `{field_name}` (`{field_name}`)'
+                if defer_keys and key_type != 'primary':
+                    deferred_key_cmds.append((key_type, field_name,
+                                              'ADD '+one_key_cmd, ref_table))
                 else:
-                    key_cmd += f'  KEY `{field_name}` (`{field_name}`)'
+                    if key_cmd != '':
+                        key_cmd += ',\n'
+                    key_cmd += '  '+one_key_cmd
+
+        if table_exists:
+            missing_key_cmds = self._missing_key_cmds(table_name,
+                                                      deferred_key_cmds)
+            if missing_key_cmds:
+                if self.logger:
+                    self.logger.log('warning',
+                        f'Table "{table_name}" is missing '+
+                        f'{len(missing_key_cmds)} keys; they will be added '+
+                        'by create_deferred_keys')
+                self._deferred_keys[table_name] = missing_key_cmds
+            self._keys_checked.add(table_name)
+            super(ImportDBMySQL, self)._exit()
+            return False
 
         if key_cmd != '':
             cmd += ',\n' + key_cmd
@@ -475,11 +466,218 @@ FROM `INFORMATION_SCHEMA`.`COLUMNS` WHERE `TABLE_SCHEMA`='{self.db_schema}' AND
                 self._table_names.add(table_name)
 
         self.tables_created.append(table_name)
+        if deferred_key_cmds:
+            self._deferred_keys[table_name] = deferred_key_cmds
         self.table_info.cache_clear()
 
         super(ImportDBMySQL, self)._exit()
         return True
 
+    @staticmethod
+    def _column_definition(column):
+        "Return the SQL that defines a column of a table, given its schema."
+        field_name = column['field_name']
+        field_type = column['field_type']
+
+        cmd = f'`{field_name}` '
+        if field_type == 'int1':
+            cmd += 'tinyint'
+        elif field_type == 'int2':
+            cmd += 'smallint'
+        elif field_type == 'int3':
+            cmd += 'mediumint'
+        elif field_type == 'int4':
+            cmd += 'int'
+        elif field_type == 'int8':
+            cmd += 'bigint'
+
+        elif field_type == 'uint1':
+            cmd += 'tinyint unsigned'
+        elif field_type == 'uint2':
+            cmd += 'smallint unsigned'
+        elif field_type == 'uint3':
+            cmd += 'mediumint unsigned'
+        elif field_type == 'uint4':
+            cmd += 'int unsigned'
+        elif field_type == 'uint8':
+            cmd += 'bigint unsigned'
+
+        elif field_type == 'real4':
+            cmd += 'float'
+        elif field_type == 'real8':
+            cmd += 'double'
+
+        elif field_type[:4] == 'char':
+            cmd += 'char('+field_type[4:]+')'
+        elif field_type[:7] == 'varchar':
+            cmd += 'varchar('+field_type[7:]+')'
+        elif field_type == 'text':
+            cmd += 'text'
+        elif field_type == 'json':
+            cmd += 'JSON'
+        elif field_type == 'enum':
+            enum_str = column.get('field_enum_options', None)
+            assert enum_str, column
+            cmd += f'enum({enum_str})'
+        elif field_type == 'flag_yesno':
+            cmd += "enum('Yes','No')"
+        elif field_type == 'flag_onoff':
+            cmd += "enum('On','Off')"
+        elif field_type == 'timestamp':
+            cmd += 'timestamp'
+        elif field_type == 'datetime':
+            cmd += 'datetime'
+        else:
+            assert False, field_type
+
+        field_default = column.get('field_default', 'NULL')
+        if field_default is None:
+            field_default = 'NULL'
+        if column.get('field_notnull', False):
+            cmd += ' NOT NULL'
+            if field_default == 'NULL':
+                field_default = ''
+
+        if field_type == 'timestamp':
+            field_default = 'CURRENT_TIMESTAMP'
+
+        if field_default != '':
+            if (field_default != 'NULL' and
+                field_default != 'CURRENT_TIMESTAMP'
+                and not field_default.isdigit()):
+                field_default = "'" + field_default + "'"
+            cmd += f' DEFAULT {field_default}'
+
+        if column.get('field_autoincrement', False):
+            cmd += ' AUTO_INCREMENT'
+
+        if field_type == 'timestamp':
+            cmd += ' ON UPDATE CURRENT_TIMESTAMP'
+
+        return cmd
+
+    def _missing_key_cmds(self, table_name, key_cmds):
+        """Return the entries of key_cmds, a list of (key_type, field_name,
+           clause, referenced table), for the keys that the existing table
+           doesn't have."""
+        cmd = f"""
+SELECT `COLUMN_NAME`, `NON_UNIQUE` FROM `INFORMATION_SCHEMA`.`STATISTICS`
+WHERE `TABLE_SCHEMA`='{self.db_schema}' AND `TABLE_NAME`='{table_name}' AND
+`SEQ_IN_INDEX`=1"""
+        indexed_columns = {}
+        for column_name, non_unique in self._execute_and_fetchall(
+                                                cmd, '_missing_key_cmds'):
+            indexed_columns[column_name] = (
+                    indexed_columns.get(column_name, False) or not non_unique)
+
+        cmd = f"""
+SELECT `COLUMN_NAME` FROM `INFORMATION_SCHEMA`.`KEY_COLUMN_USAGE`
+WHERE `TABLE_SCHEMA`='{self.db_schema}' AND `TABLE_NAME`='{table_name}' AND
+`REFERENCED_TABLE_NAME` IS NOT NULL"""
+        foreign_columns = {x[0] for x in
+                           self._execute_and_fetchall(cmd, '_missing_key_cmds')}
+
+        missing_key_cmds = []
+        for key_info in key_cmds:
+            key_type, field_name = key_info[:2]
+            if key_type == 'foreign':
+                if field_name in foreign_columns:
+                    continue
+            elif key_type == 'unique':
+                if indexed_columns.get(field_name, False):
+                    continue
+            elif field_name in indexed_columns:
+                continue
+            missing_key_cmds.append(key_info)
+        return missing_key_cmds
+
+    def create_deferred_keys(self, namespace):
+        """Add the keys left out by create_table(defer_keys=True), or found
+           missing from an existing table, to all the tables in the
+           namespace. All the keys of a table are added with a
+           single ALTER TABLE so the table is only rebuilt once. Foreign keys
+           are checked against the existing rows as they are added, and
+           need an index on the column they reference, so the tables are
+           done in an order that puts every table after the ones it
+           references."""
+        super(ImportDBMySQL, self)._enter('create_deferred_keys')
+
+        table_names = [x for x in sorted(self._deferred_keys)
+                       if (namespace == 'import') ==
+                            self._is_import_namespace(x)]
+        ordered_table_names = []
+
+        def _add_table(table_name, visiting):
+            if (table_name not in table_names or
+                table_name in ordered_table_names or
+                table_name in visiting): # A cycle; nothing we can do
+                return
+            visiting.add(table_name)
+            for key_info in self._deferred_keys[table_name]:
+                if key_info[3] is not None:
+                    _add_table(key_info[3], visiting)
+            ordered_table_names.append(table_name)
+
+        for table_name in table_names:
+            _add_table(table_name, set())
+
+        for table_name in ordered_table_names:
+            key_cmds = [x[2] for x in self._deferred_keys.pop(table_name)]
+            cmd = f'ALTER TABLE `{table_name}` ' + ', '.join(key_cmds)
+            try:
+                self._execute(cmd, mutates=True)
+            except MySQLdb.Error as e:
+                if self.logger:
+                    self.logger.log('fatal',
+                        f'Failed to create keys for "{table_name}": '+
+                        f'{e.args[1]}')
+                raise ImportDBException(e)
+
+            if self.logger:
+                if self.read_only:
+                    self.logger.log('debug',
+                            f'[SIM] Created deferred keys for "{table_name}"')
+                else:
+                    self.logger.log('debug',
+                            f'Created deferred keys for "{table_name}"')
+
+        self.table_info.cache_clear()
+
+        super(ImportDBMySQL, self)._exit()
+
+    def add_column(self, namespace, raw_table_name, column, after=None):
+        """Add a column, given its schema, to an existing table. If after
+           is given, the column goes after that one."""
+        super(ImportDBMySQL, self)._enter('add_column')
+
+        table_name = self.convert_raw_to_namespace(namespace, raw_table_name)
+
+        cmd = (f'ALTER TABLE `{table_name}` ADD COLUMN '+
+               self._column_definition(column))
+        if after is not None:
+            cmd += f' AFTER `{after}`'
+
+        try:
+            self._execute(cmd, mutates=True)
+        except MySQLdb.Error as e:
+            if self.logger:
+                self.logger.log('fatal',
+                        f'Failed to add column "{column["field_name"]}" to '+
+                        f'"{table_name}": {e.args[1]}')
+            raise ImportDBException(e)
+
+        if self.logger:
+            if self.read_only:
+                self.logger.log('debug',
+            f'[SIM] Added column "{column["field_name"]}" to "{table_name}"')
+            else:
+                self.logger.log('debug',
+                f'Added column "{column["field_name"]}" to "{table_name}"')
+
+        self.table_info.cache_clear()
+
+        super(ImportDBMySQL, self)._exit()
+
     def analyze_table(self, namespace, raw_table_name):
         """Analyze the given table. This recomputes key distribution."""
         super(ImportDBMySQL, self)._enter('analyze_table')
@@ -593,6 +791,93 @@ FROM `INFORMATION_SCHEMA`.`COLUMNS` WHERE `TABLE_SCHEMA`='{self.db_schema}' AND
 
         super(ImportDBMySQL, self)._exit()
 
+    def load_rows(self, namespace, raw_table_name, rows):
+        """Bulk-load multiple rows with LOAD DATA LOCAL INFILE.
+
+        The rows are written to a temporary tab-separated file that the
+        server reads in one statement, which is much faster than insert_rows
+        for big tables. If the server or client doesn't allow LOAD DATA
+        LOCAL INFILE, insert_rows is used instead.
+
+        LOAD DATA LOCAL reports bad values as warnings instead of the errors
+        INSERT gives in strict mode, so any warning (other than a note)
+        fails the load. insert_rows only logs warnings.
+
+        All rows must have the same columns!"""
+
+        if len(rows) == 0:
+            return
+
+        if self.read_only or not self._load_data_available:
+            self.insert_rows(namespace, raw_table_name, rows)
+            return
+
+        super(ImportDBMySQL, self)._enter('load_rows')
+
+        table_name = self.convert_raw_to_namespace(namespace, raw_table_name)
+
+        sorted_column_names = sorted(rows[0].keys())
+        num_columns = len(sorted_column_names)
+
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8',
+                                         suffix='.tsv',
+                                         newline='\n') as load_file:
+            for row in rows:
+                # Every column must be there (or this raises KeyError) and
+                # there can't be any others
+                assert len(row) == num_columns, \
+                        (sorted_column_names, sorted(row.keys()))
+                load_file.write('\t'.join([_load_data_value(row[column_name])
+                                        for column_name in sorted_column_names])
+                                +'\n')
+            load_file.flush()
+
+            cmd = f"LOAD DATA LOCAL INFILE %s INTO TABLE `{table_name}` "
+            cmd += "CHARACTER SET utf8mb4 "
+            cmd += "FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' ("
+            cmd += ','.join(['`'+s+'`' for s in sorted_column_names])
+            cmd += ')'
+
+            try:
+                with self.conn.cursor() as cur:
+                    self._execute(cmd, [load_file.name], cur=cur,
+                                  mutates=True)
+                    # LOAD DATA LOCAL turns errors that would abort an INSERT
+                    # in strict mode into warnings, so treat them as errors
+                    problems = []
+                    if self.conn.warning_count():
+                        cur.execute('SHOW WARNINGS')
+                        problems = [x for x in cur.fetchall()
+                                    if x[0] != 'Note']
+                    if problems:
+                        self.conn.rollback()
+                    else:
+                        self.conn.commit()
+            except MySQLdb.Error as e:
+                if e.args[0] not in ERR_LOAD_DATA_NOT_ALLOWED:
+                    if self.logger:
+                        self.logger.log('fatal',
+                        f'Failed to load rows into "{table_name}": {e.args[1]}')
+                    raise ImportDBException(e)
+                if self.logger:
+                    self.logger.log('warning',
+                        f'LOAD DATA LOCAL INFILE not allowed ({e.args[1]}) - '+
+                        'using INSERT instead')
+                self._load_data_available = False
+                self.insert_rows(namespace, raw_table_name, rows)
+                super(ImportDBMySQL, self)._exit()
+                return
+
+        if problems:
+            if self.logger:
+                self.logger.log('fatal',
+                                f'Failed to load rows into "{table_name}":')
+                for level, code, message in problems[:20]:
+                    self.logger.log('fatal', f'  {level} {code}: {message}')
+            raise ImportDBException(problems[0])
+
+        super(ImportDBMySQL, self)._exit()
+
     def update_row(self, namespace, raw_table_name, row, where):
         super(ImportDBMySQL, self)._enter('insert_row')
 
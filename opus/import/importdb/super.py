@@ -132,9 +132,15 @@ class ImportDBSuper:
         assert False, 'ImportDBSuper::drop_table must be overriden'
 
     def create_table(self, namespace, raw_table_name, schema_filename,
-                     ignore_if_exists=True):
+                     ignore_if_exists=True, defer_keys=False):
         assert False, 'ImportDBSuper::create_table must be overriden'
 
+    def create_deferred_keys(self, namespace):
+        assert False, 'ImportDBSuper::create_deferred_keys must be overriden'
+
+    def add_column(self, namespace, raw_table_name, column, after=None):
+        assert False, 'ImportDBSuper::add_column must be overriden'
+
     def analyze_table(self, namespace, raw_table_name):
         assert False, 'ImportDBSuper::analyze_table must be overriden'
 
@@ -159,6 +165,10 @@ class ImportDBSuper:
     def insert_rows(self, namespace, raw_table_name, rows):
         assert False, 'ImportDBSuper::insert_rows must be overriden'
 
+    def load_rows(self, namespace, raw_table_name, rows):
+        "Bulk-load multiple rows. By default this is just insert_rows."
+        self.insert_rows(namespace, raw_table_name, rows)
+
     def update_row(self, namespace, raw_table_name, row, where):
         assert False, 'ImportDBSuper::update_row must be overriden'
 
@@ -42,6 +42,7 @@ import do_grouping_target_name # noqa: E402
 import do_import # noqa: E402
 import do_param_info # noqa: E402
 import do_partables # noqa: E402
+import do_precompute_metadata # noqa: E402
 import do_table_names # noqa: E402
 import do_update_mult_info # noqa: E402
 import do_validate # noqa: E402
@@ -91,6 +92,7 @@ parser.add_argument(
             --create-partables
             --create-table-names
             --create-grouping-target-name
+            --precompute-metadata
             --create-cart
             --drop-cache-tables
          """
@@ -116,6 +118,7 @@ parser.add_argument(
             --create-partables
             --create-table-names
             --create-grouping-target-name
+            --precompute-metadata
             --create-cart
             --drop-cache-tables
          """
@@ -128,6 +131,7 @@ parser.add_argument(
             --create-partables
             --create-table-names
             --create-grouping-target-name
+            --precompute-metadata
             --create-cart
             --drop-cache-tables
          """
@@ -148,6 +152,22 @@ parser.add_argument(
     help="""Perform an import of the specified volumes; implies
             --delete-import-volumes"""
 )
+parser.add_argument(
+    '--processes', type=int, default=1,
+    help="""Number of processes used to read and parse the index files of the
+            volumes being imported. Only the file parsing is parallel:
+            populating the import tables and all other database work still
+            runs in this single process, one volume at a time, in order, so
+            the results don't change and imports that are limited by the
+            database won't get faster"""
+)
+parser.add_argument(
+    '--incremental', action='store_true', default=False,
+    help="""Only import the volumes whose index, supplemental index, geometry,
+            or inventory files have changed since they were last copied to
+            the permanent tables; can't be used with --drop-permanent-tables
+            or --delete-permanent-volumes"""
+)
 parser.add_argument(
     '--leave-old-import-tables', action='store_true', default=False,
     help="""Leave the previous import tables and just add to them. Overrides
@@ -253,6 +273,11 @@ parser.add_argument(
     '--update-mult-info', action='store_true', default=False,
     help='Update the details of preprogrammed mult tables'
 )
+parser.add_argument(
+    '--precompute-metadata', action='store_true', default=False,
+    help="""Precompute the result count, range endpoints, and mult counts
+            for the unconstrained search"""
+)
 
 # Functions other than main import
 
@@ -327,6 +352,7 @@ if impglobals.ARGUMENTS.do_it_all:
     impglobals.ARGUMENTS.create_partables = True
     impglobals.ARGUMENTS.create_table_names = True
     impglobals.ARGUMENTS.create_grouping_target_name = True
+    impglobals.ARGUMENTS.precompute_metadata = True
     impglobals.ARGUMENTS.create_cart = True
     impglobals.ARGUMENTS.drop_cache_tables = True
 
@@ -344,6 +370,7 @@ if impglobals.ARGUMENTS.do_import_finalization:
     impglobals.ARGUMENTS.create_partables = True
     impglobals.ARGUMENTS.create_table_names = True
     impglobals.ARGUMENTS.create_grouping_target_name = True
+    impglobals.ARGUMENTS.precompute_metadata = True
     impglobals.ARGUMENTS.create_cart = True
     impglobals.ARGUMENTS.drop_cache_tables = True
 
@@ -352,6 +379,7 @@ if impglobals.ARGUMENTS.cleanup_aux_tables:
     impglobals.ARGUMENTS.create_partables = True
     impglobals.ARGUMENTS.create_table_names = True
     impglobals.ARGUMENTS.create_grouping_target_name = True
+    impglobals.ARGUMENTS.precompute_metadata = True
     impglobals.ARGUMENTS.create_cart = True
     impglobals.ARGUMENTS.drop_cache_tables = True
 
@@ -404,6 +432,16 @@ if (impglobals.ARGUMENTS.drop_permanent_tables !=
         '--drop-permanent-tables and --scorched-earth must be used together')
     sys.exit(-1)
 
+# --incremental skips volumes that are unchanged since they were copied to the
+# permanent tables, which would be lost if those rows are deleted first
+if (impglobals.ARGUMENTS.incremental and
+    (impglobals.ARGUMENTS.drop_permanent_tables or
+     impglobals.ARGUMENTS.delete_permanent_volumes)):
+    impglobals.LOGGER.log('fatal',
+        '--incremental can\'t be used with --drop-permanent-tables or '+
+        '--delete-permanent-volumes')
+    sys.exit(-1)
+
 our_schema_name = DB_SCHEMA_NAME
 if impglobals.ARGUMENTS.override_db_schema:
     our_schema_name = impglobals.ARGUMENTS.override_db_schema
@@ -446,6 +484,10 @@ try: # Top-level exception handling so we always log what's going on
 
     impglobals.DATABASE.log_sql = impglobals.ARGUMENTS.log_sql
 
+    # The running OPUS server expects every column in the user_searches
+    # schema, even if the table predates some of them
+    do_django.update_user_searches_table()
+
     # This MUST be done before the permanent tables are created, because there
     # could be entries in the cart table that point at the permanent
     # tables, and import could delete entries out of the permanent tables
@@ -503,6 +545,23 @@ try: # Top-level exception handling so we always log what's going on
 
         impglobals.LOGGER.close()
 
+    # This MUST be done after the permanent tables and param_info are final.
+    # If the obs tables changed and we aren't recomputing, the old values are
+    # wrong, so get rid of them.
+    if impglobals.ARGUMENTS.precompute_metadata:
+        impglobals.LOGGER.open(
+            'Precomputing unconstrained search metadata',
+            limits={'info': impglobals.ARGUMENTS.log_info_limit,
+                    'debug': impglobals.ARGUMENTS.log_debug_limit})
+
+        do_precompute_metadata.do_precompute_metadata()
+
+        impglobals.LOGGER.close()
+    elif (impglobals.ARGUMENTS.copy_import_to_permanent_tables or
+          impglobals.ARGUMENTS.delete_permanent_import_volumes or
+          impglobals.ARGUMENTS.delete_permanent_volumes):
+        do_precompute_metadata.drop_precomputed_metadata()
+
     if impglobals.ARGUMENTS.validate_perm:
         do_validate.do_validate('perm')
 
@@ -525,6 +584,22 @@ try: # Top-level exception handling so we always log what's going on
         do_dictionary.do_dictionary()
         impglobals.LOGGER.close()
 
+    # Anything that changes the permanent tables must bump the import version
+    # so that running OPUS servers discard their in-memory copies.
+    if (impglobals.ARGUMENTS.copy_import_to_permanent_tables or
+        impglobals.ARGUMENTS.delete_permanent_import_volumes or
+        impglobals.ARGUMENTS.delete_permanent_volumes or
+        impglobals.ARGUMENTS.drop_permanent_tables or
+        impglobals.ARGUMENTS.create_param_info or
+        impglobals.ARGUMENTS.create_partables or
+        impglobals.ARGUMENTS.create_table_names or
+        impglobals.ARGUMENTS.create_grouping_target_name or
+        impglobals.ARGUMENTS.update_mult_info or
+        impglobals.ARGUMENTS.precompute_metadata or
+        impglobals.ARGUMENTS.drop_cache_tables or
+        impglobals.ARGUMENTS.import_dictionary):
+        do_django.bump_import_version()
+
     if impglobals.ARGUMENTS.profile:
         pr.disable()
         s = io.StringIO()
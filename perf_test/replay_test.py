@@ -0,0 +1,367 @@
+################################################################################
+# replay_test.py
+#
+# Replay real OPUS traffic from Apache access logs and report per-endpoint
+# latency, and compare two such runs to catch regressions before deploying.
+#
+# The requests are read with log_analyzer's LogReader. Each client host's
+# requests are replayed in their original order (so the UI's sequences of
+# result_count, mults, endpoints, dataimages, ... calls are preserved), with
+# up to --concurrency hosts being replayed at the same time.
+#
+# Requests can be sent either to a running server (--server) or directly to
+# the Django test client in this process (--django). The latter also reports
+# the number of SQL queries and cache hits and misses for each endpoint.
+#
+# Usage:
+#   python replay_test.py run [--server URL | --django] [--concurrency N]
+#                             [--limit N] [--url-filter REGEX]
+#                             --output run.json access_log...
+#   python replay_test.py compare [--threshold FRAC] old.json new.json
+#
+# compare exits with status 1 if any endpoint's p50 or p95 got slower by more
+# than the threshold.
+################################################################################
+
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+import numpy as np
+
+PERF_TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(PERF_TEST_DIR, '..', 'log_analyzer'))
+from log_entry import LogReader # noqa: E402
+
+SERVER_ALIASES = {
+    'localhost': 'http://127.0.0.1:8000',
+    'dev': 'https://dev.pds-rings.seti.org',
+    'tools': 'https://opus.pds-rings.seti.org',
+}
+
+# Requests for the same API with different slugs, OPUS IDs, etc. are reported
+# together. Anything not matched here is reported by its full path.
+ENDPOINT_PATTERNS = [
+    (re.compile(p), r) for p, r in (
+        (r'/__api/meta/mults/[^/]+\.(\w+)$', '/__api/meta/mults/*.\\1'),
+        (r'/__api/meta/range/endpoints/[^/]+\.(\w+)$',
+            '/__api/meta/range/endpoints/*.\\1'),
+        (r'/__api/(metadata(?:_v2)?)/[^/]+\.(\w+)$', '/__api/\\1/*.\\2'),
+        (r'/__api/image/(\w+)/[^/]+\.(\w+)$', '/__api/image/\\1/*.\\2'),
+        (r'/__api/files/[^/]+\.(\w+)$', '/__api/files/*.\\1'),
+        (r'/__api/categories/[^/]+\.(\w+)$', '/__api/categories/*.\\1'),
+        (r'/__api/product_types/[^/]+\.(\w+)$',
+            '/__api/product_types/*.\\1'),
+        (r'/__api/download/[^/]+\.(\w+)$', '/__api/download/*.\\1'),
+        (r'/__api/stringsearchchoices/[^/]+\.(\w+)$',
+            '/__api/stringsearchchoices/*.\\1'),
+        (r'/__widget/[^/]+\.(\w+)$', '/__widget/*.\\1'),
+        (r'/__initdetail/[^/]+\.(\w+)$', '/__initdetail/*.\\1'),
+    )
+]
+
+_PERCENTILES = (50, 95, 99)
+
+
+def endpoint_name(path):
+    "Return the name under which a request path is reported."
+    # The UI is served from /opus on the real servers
+    if path.startswith('/opus/'):
+        path = path[5:]
+    for pattern, replacement in ENDPOINT_PATTERNS:
+        new_path, num_subs = pattern.subn(replacement, path)
+        if num_subs:
+            return new_path
+    return path
+
+
+################################################################################
+#
+# Reading the logs
+#
+################################################################################
+
+def read_request_sequences(file_names, url_filter, limit):
+    """Return a list of per-host lists of URLs (path?query) to replay.
+
+    Only successful GET requests whose path matches url_filter are used.
+    The hosts are ordered by the time of their first request.
+    """
+    url_re = re.compile(url_filter)
+    log_entries = LogReader.read_logs(file_names)
+    log_entries.sort(key=lambda entry: entry.time)
+    by_host = OrderedDict()
+    num_requests = 0
+    for entry in log_entries:
+        if entry.method != 'GET' or entry.status >= 400:
+            continue
+        if not url_re.search(entry.url.path):
+            continue
+        url = entry.url.path
+        if entry.url.query:
+            url += '?' + entry.url.query
+        by_host.setdefault(entry.host_ip, []).append(url)
+        num_requests += 1
+        if limit and num_requests >= limit:
+            break
+    return list(by_host.values())
+
+
+################################################################################
+#
+# Clients
+#
+################################################################################
+
+class ServerClient:
+    "Send requests to a running server. Queries and cache use are unknown."
+    def __init__(self, server):
+        import requests
+        self._server = SERVER_ALIASES.get(server, server).rstrip('/')
+        self._session = requests.Session()
+
+    def get(self, url):
+        response = self._session.get(self._server+url)
+        response.content # Make sure we wait for the whole body
+        return response.status_code, None, None, None
+
+
+class _CacheCounter(threading.local):
+    hits = 0
+    misses = 0
+
+_CACHE_COUNTER = _CacheCounter()
+_DJANGO_READY = False
+
+def _setup_django():
+    global _DJANGO_READY
+    if _DJANGO_READY:
+        return
+    sys.path.insert(0, os.path.join(PERF_TEST_DIR, '..', 'opus',
+                                    'application'))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+    import django
+    django.setup()
+    from django.test.utils import setup_test_environment
+    # Allows the test client's 'testserver' host
+    setup_test_environment()
+
+    # Count cache hits and misses by wrapping the cache backend's get. This
+    # covers both memcached and locmem, since every cache lookup in OPUS goes
+    # through cache.get.
+    from django.core.cache import caches
+    backend_class = type(caches['default'])
+    orig_get = backend_class.get
+    def counting_get(self, *args, **kwargs):
+        ret = orig_get(self, *args, **kwargs)
+        if ret is None:
+            _CACHE_COUNTER.misses += 1
+        else:
+            _CACHE_COUNTER.hits += 1
+        return ret
+    backend_class.get = counting_get
+    _DJANGO_READY = True
+
+class DjangoClient:
+    "Send requests to Django in this process using the test client."
+    def __init__(self):
+        _setup_django()
+        from django.test import Client
+        self._client = Client()
+
+    def get(self, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        _CACHE_COUNTER.hits = _CACHE_COUNTER.misses = 0
+        with CaptureQueriesContext(connection) as queries:
+            response = self._client.get(url)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+        return (response.status_code, len(queries),
+                _CACHE_COUNTER.hits, _CACHE_COUNTER.misses)
+
+
+################################################################################
+#
+# Running
+#
+################################################################################
+
+def replay_host(make_client, urls):
+    "Replay one host's requests in order and return a list of measurements."
+    client = make_client()
+    ret = []
+    for url in urls:
+        time1 = time.time()
+        try:
+            status, num_queries, cache_hits, cache_misses = client.get(url)
+        except Exception as e:
+            print(f'{url}: {e}')
+            status, num_queries, cache_hits, cache_misses = None, None, None, None
+        time2 = time.time()
+        ret.append((endpoint_name(url.split('?')[0]), time2-time1, status,
+                    num_queries, cache_hits, cache_misses))
+    return ret
+
+def summarize(measurements):
+    "Collect per-endpoint statistics from a list of measurements."
+    by_endpoint = OrderedDict()
+    for endpoint, *rest in sorted(measurements, key=lambda x: x[0]):
+        by_endpoint.setdefault(endpoint, []).append(rest)
+
+    ret = OrderedDict()
+    for endpoint, rows in by_endpoint.items():
+        times = [x[0] for x in rows]
+        stats = OrderedDict()
+        stats['count'] = len(rows)
+        stats['errors'] = len([x for x in rows
+                               if x[1] is None or x[1] >= 400])
+        stats['mean'] = float(np.mean(times))
+        for pct, val in zip(_PERCENTILES, np.percentile(times, _PERCENTILES)):
+            stats[f'p{pct}'] = float(val)
+        for idx, name in ((2, 'queries'), (3, 'cache_hits'),
+                          (4, 'cache_misses')):
+            vals = [x[idx] for x in rows if x[idx] is not None]
+            stats[name] = int(np.sum(vals)) if vals else None
+        ret[endpoint] = stats
+    return ret
+
+def print_summary(results):
+    print(f'{"Endpoint":45s} {"#":>6s} {"Err":>4s} {"p50":>8s} {"p95":>8s} '
+          +f'{"p99":>8s} {"Queries":>8s} {"Hits":>7s} {"Misses":>7s}')
+    for endpoint, stats in results['endpoints'].items():
+        extras = ''
+        for name, width in (('queries', 8), ('cache_hits', 7),
+                            ('cache_misses', 7)):
+            val = stats[name]
+            extras += ' ' + (f'{val:{width}d}' if val is not None
+                             else f'{"-":>{width}s}')
+        print(f'{endpoint:45s} {stats["count"]:6d} {stats["errors"]:4d} '
+              +f'{stats["p50"]:8.4f} {stats["p95"]:8.4f} {stats["p99"]:8.4f}'
+              +extras)
+    print(f'Total wall time {results["wall_time"]:.2f} secs for '
+          +f'{results["num_requests"]} requests')
+
+def run(args):
+    sequences = read_request_sequences(args.log_files, args.url_filter,
+                                       args.limit)
+    num_requests = sum([len(x) for x in sequences])
+    print(f'Replaying {num_requests} requests from {len(sequences)} hosts '
+          +f'with concurrency {args.concurrency}')
+
+    if args.django:
+        _setup_django()
+        make_client = DjangoClient
+    else:
+        make_client = lambda: ServerClient(args.server)
+
+    measurements = []
+    time1 = time.time()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        for ret in executor.map(lambda urls: replay_host(make_client, urls),
+                                sequences):
+            measurements.extend(ret)
+    wall_time = time.time() - time1
+
+    results = OrderedDict()
+    results['target'] = 'django' if args.django else args.server
+    results['concurrency'] = args.concurrency
+    results['log_files'] = args.log_files
+    results['num_requests'] = num_requests
+    results['wall_time'] = wall_time
+    results['endpoints'] = summarize(measurements)
+
+    print_summary(results)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=2)
+        print(f'Results written to {args.output}')
+
+def compare(args):
+    with open(args.old_run, 'r') as fp:
+        old = json.load(fp)
+    with open(args.new_run, 'r') as fp:
+        new = json.load(fp)
+
+    print(f'{"Endpoint":45s} {"old p50":>8s} {"new p50":>8s} {"chg":>7s} '
+          +f'{"old p95":>8s} {"new p95":>8s} {"chg":>7s} {"queries":>15s}')
+    num_regressions = 0
+    for endpoint, new_stats in new['endpoints'].items():
+        old_stats = old['endpoints'].get(endpoint)
+        if old_stats is None:
+            print(f'{endpoint:45s} (new endpoint)')
+            continue
+        line = f'{endpoint:45s}'
+        regressed = False
+        for pct in ('p50', 'p95'):
+            old_val = old_stats[pct]
+            new_val = new_stats[pct]
+            change = (new_val-old_val)/old_val if old_val else 0.
+            line += f' {old_val:8.4f} {new_val:8.4f} {change*100:+6.1f}%'
+            if change > args.threshold and new_val-old_val > args.min_delta:
+                regressed = True
+        old_q = old_stats.get('queries')
+        new_q = new_stats.get('queries')
+        if old_q is not None and new_q is not None:
+            line += f' {old_q:7d}->{new_q:<7d}'
+            if new_q > old_q:
+                regressed = True
+        if regressed:
+            line += '  REGRESSION'
+            num_regressions += 1
+        print(line)
+    for endpoint in old['endpoints']:
+        if endpoint not in new['endpoints']:
+            print(f'{endpoint:45s} (missing from new run)')
+
+    if num_regressions:
+        print(f'{num_regressions} endpoints regressed')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Replay OPUS traffic from Apache logs and compare runs')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    run_parser = subparsers.add_parser('run', help='Replay access logs')
+    run_parser.add_argument('log_files', nargs='+',
+                            help='Apache access log files')
+    target = run_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--server', type=str,
+                        help='Server root URL, or localhost, dev, or tools')
+    target.add_argument('--django', action='store_true', default=False,
+                        help='Use the Django test client in this process')
+    run_parser.add_argument('--concurrency', type=int, default=1,
+                            help='Number of hosts replayed at the same time')
+    run_parser.add_argument('--limit', type=int, default=None,
+                            help='Replay at most this many requests')
+    run_parser.add_argument('--url-filter', type=str, default=r'/__api/',
+                            help='Only replay request paths matching this '
+                                 +'regular expression')
+    run_parser.add_argument('--output', type=str, default=None,
+                            help='Write the results to this JSON file')
+    run_parser.set_defaults(func=run)
+
+    compare_parser = subparsers.add_parser('compare',
+                                           help='Compare two runs')
+    compare_parser.add_argument('old_run', help='Results of the old run')
+    compare_parser.add_argument('new_run', help='Results of the new run')
+    compare_parser.add_argument('--threshold', type=float, default=0.10,
+                                help='Fractional slowdown that counts as a '
+                                     +'regression')
+    compare_parser.add_argument('--min-delta', type=float, default=0.005,
+                                help='Ignore slowdowns smaller than this '
+                                     +'many seconds')
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)